@@ -0,0 +1,33 @@
+import os
+import string
+from functools import lru_cache
+from typing import List
+from razdel import tokenize as razdel_tokenize
+from natasha import MorphVocab
+
+# Меняется при любом изменении нормализации — от неё зависят артефакты BM25
+ANALYZER_VERSION = 1
+LEMMA_CACHE_SIZE = int(os.getenv("LEMMA_CACHE_SIZE", "100000"))
+
+PUNCTUATION = string.punctuation + "«»„“”‘’—–…"
+
+morph_vocab = MorphVocab()
+
+
+# === Слово → лемма (pymorphy через natasha) с ограниченным LRU-кэшем ===
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize(word: str) -> str:
+    if not word.isalpha():
+        return word  # числа, slug-теги вроде lifting_curse и т.п. оставляем как есть
+    return morph_vocab.parse(word)[0].normal_form.replace("ё", "е")
+
+
+# === Общий анализатор для индексации и для запросов ===
+# "Геральта", "Геральтом" и "Геральт," дают один и тот же термин "геральт"
+def analyze(text: str) -> List[str]:
+    tokens = []
+    for token in razdel_tokenize(text.lower().replace("ё", "е")):
+        word = token.text.strip(PUNCTUATION)
+        if word and any(ch.isalnum() for ch in word):
+            tokens.append(lemmatize(word))
+    return tokens
\ No newline at end of file
@@ -0,0 +1,132 @@
+import os
+import time
+import pickle
+import threading
+from collections import OrderedDict
+import numpy as np
+import faiss
+
+# === Семантический кэш ответов ===
+# Ключ — (каноническое имя персонажа, id найденных сцен, эмбеддинг вопроса).
+# Почти одинаковые вопросы к одному персонажу (косинус ≥ порога) с той же выдачей сцен
+# получают готовый ответ без обращения к LLM.
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "5000"))  # 0 — кэш выключен
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))  # секунды
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # минимальный косинус
+ANSWER_CACHE_NEIGHBOURS = 8  # сколько ближайших вопросов проверять на совпадение выдачи
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH")  # файл для сохранения между перезапусками
+
+
+class AnswerCache:
+    def __init__(self, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, threshold=ANSWER_CACHE_THRESHOLD):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()  # id → (persona, scene_ids, вектор, ответ, создан, мс генерации); порядок — LRU
+        self._indexes = {}  # persona → faiss.IndexIDMap над векторами вопросов этого персонажа
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.hits = 0
+        self.saved_ms = 0.0
+
+    def _index_for(self, persona, dim):
+        index = self._indexes.get(persona)
+        if index is None:
+            index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+            self._indexes[persona] = index
+        return index
+
+    def _remove(self, entry_id):
+        persona = self._entries.pop(entry_id)[0]
+        self._indexes[persona].remove_ids(np.array([entry_id], dtype=np.int64))
+
+    def _expired(self, created, now):
+        return self.ttl and now - created > self.ttl
+
+    def get(self, persona, scene_ids, vector):
+        if not self.max_size:
+            return None
+        scene_ids = tuple(scene_ids)
+        query = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+        now = time.time()
+        with self._lock:
+            self.lookups += 1
+            index = self._indexes.get(persona)
+            if index is None or not index.ntotal:
+                return None
+            sims, ids = index.search(query, min(ANSWER_CACHE_NEIGHBOURS, index.ntotal))
+            for sim, entry_id in zip(sims[0], ids[0].tolist()):
+                if entry_id < 0 or sim < self.threshold:
+                    break
+                _, cached_scenes, _, answer, created, generate_ms = self._entries[entry_id]
+                if self._expired(created, now):
+                    self._remove(entry_id)
+                    continue
+                if cached_scenes != scene_ids:
+                    continue
+                self._entries.move_to_end(entry_id)
+                self.hits += 1
+                self.saved_ms += generate_ms
+                return answer
+        return None
+
+    def put(self, persona, scene_ids, vector, answer, generate_ms=0.0, created=None):
+        if not self.max_size:
+            return
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index_for(persona, len(vector)).add_with_ids(vector.reshape(1, -1), np.array([entry_id], dtype=np.int64))
+            self._entries[entry_id] = (persona, tuple(scene_ids), vector, answer,
+                                       created if created is not None else time.time(), generate_ms)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._indexes.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "personas": sum(1 for index in self._indexes.values() if index.ntotal),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+            "saved_ms": round(self.saved_ms, 1),
+        }
+
+    # === Сохранение на диск: тёплый кэш переживает перезапуск ===
+    def save(self, path=ANSWER_CACHE_PATH):
+        if not path:
+            return
+        with self._lock:
+            entries = list(self._entries.values())
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"  # воркеры gunicorn сохраняют кэш одновременно
+        with open(tmp, "wb") as f:
+            pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        print(f"✅ Кэш ответов сохранён: {len(entries)} записей → {path}")
+
+    def load(self, path=ANSWER_CACHE_PATH):
+        if not path or not os.path.exists(path):
+            return
+        try:
+            with open(path, "rb") as f:
+                entries = pickle.load(f)
+        except Exception as e:
+            print(f"⚠️ Не удалось загрузить кэш ответов {path}: {e}")
+            return
+        now = time.time()
+        for persona, scene_ids, vector, answer, created, generate_ms in entries:
+            if not self._expired(created, now):
+                self.put(persona, scene_ids, vector, answer, generate_ms, created)
+        print(f"✅ Кэш ответов загружен: {len(self._entries)} записей из {path}")
\ No newline at end of file
@@ -0,0 +1,287 @@
+import os
+import json
+import time
+import shutil
+import fcntl
+import hashlib
+import argparse
+from contextlib import contextmanager
+
+import faiss
+import numpy as np
+
+from api.analyzer import ANALYZER_VERSION, analyze
+from api.bm25 import SparseBM25
+from api.evidence import prepare_scene
+from api.scene_store import SceneStore
+from api.vector import VectorBackend, build_index, index_spec
+
+SCENES_PATH = os.getenv("SCENES_PATH", "data/scenes.jsonl")
+INDEX_DIR = os.getenv("INDEX_DIR", "data/index")
+MODEL_NAME = os.getenv("EMBED_MODEL", "intfloat/multilingual-e5-small")
+# Чем считаются эмбеддинги: torch (sentence-transformers) | onnx-int8 | onnx-fp32 (api/onnx_encoder.py)
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+ENCODER_BACKENDS = ("torch", "onnx-int8", "onnx-fp32")
+# Векторы корпуса, посчитанные через torch, годятся другому кодировщику, если на выборке сводок
+# его эмбеддинги совпадают с сохранёнными не хуже этого порога (средний косинус); иначе корпус перекодируется
+ENCODER_MIN_COSINE = float(os.getenv("ENCODER_MIN_COSINE", "0.98"))
+ENCODER_CHECK_SAMPLE = int(os.getenv("ENCODER_CHECK_SAMPLE", "64"))
+
+# Меняется при любом изменении формата артефактов или способа их построения
+ARTIFACT_VERSION = 6
+
+MANIFEST = "manifest.json"
+EMBEDDINGS = "embeddings.npy"
+FAISS_INDEX = "faiss.index"
+
+
+# === Загружаем сцены ===
+def load_scenes(path=SCENES_PATH):
+    scenes = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                scenes.append(json.loads(line))
+    return scenes
+
+
+# === Модель эмбеддингов ===
+def load_model(model_name=MODEL_NAME, backend=ENCODER_BACKEND):
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Неизвестный ENCODER_BACKEND={backend}, допустимо: {', '.join(ENCODER_BACKENDS)}")
+    if backend.startswith("onnx"):
+        from api.onnx_encoder import OnnxEncoder
+        return OnnxEncoder.load(model_name, quantized=backend == "onnx-int8")
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def encoder_id(model):
+    # У SentenceTransformer своего атрибута нет — это исходный вариант
+    return getattr(model, "backend", "torch") if model is not None else ENCODER_BACKEND
+
+
+def bm25_document(scene):
+    return scene["summary_50w"] + " " + " ".join(scene["beats"]) + " " + " ".join(scene["event_tags"])
+
+
+# === Версионирование: хэш содержимого scenes.jsonl + модель + кодировщик ===
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def artifact_key(scenes_path=SCENES_PATH, model_name=MODEL_NAME, vector_spec=None, encoder="torch"):
+    h = hashlib.sha256()
+    h.update(file_sha256(scenes_path).encode())
+    h.update(model_name.encode())
+    if encoder != "torch":  # ключи сборок через torch не меняются
+        h.update(encoder.encode())
+    h.update(json.dumps(vector_spec or index_spec(), sort_keys=True).encode())
+    h.update(f"{ARTIFACT_VERSION}.{ANALYZER_VERSION}".encode())
+    return h.hexdigest()[:16]
+
+
+def is_complete(artifact_dir):
+    return os.path.exists(os.path.join(artifact_dir, MANIFEST))
+
+
+@contextmanager
+def _build_lock(index_dir):
+    # Несколько воркеров могут стартовать одновременно — строит только один
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+# === Совместимость кодировщика с сохранёнными векторами ===
+def encoder_agreement(artifact_dir, model, sample=ENCODER_CHECK_SAMPLE):
+    # (средний, минимальный) косинус между сохранёнными эмбеддингами сводок и посчитанными model заново
+    embeddings = np.load(os.path.join(artifact_dir, EMBEDDINGS), mmap_mode="r")
+    scenes = SceneStore.load(artifact_dir)
+    ids = np.unique(np.linspace(0, len(scenes) - 1, min(sample, len(scenes))).astype(np.int64))
+    fresh = np.asarray(model.encode([scenes[i]["summary_50w"] for i in ids], normalize_embeddings=True,
+                                    show_progress_bar=False), dtype=np.float32)
+    cosine = (np.asarray(embeddings[ids], dtype=np.float32) * fresh).sum(axis=1)
+    return float(cosine.mean()), float(cosine.min())
+
+
+def reusable_artifacts(scenes_path, model_name, index_dir, model, vector_spec):
+    # Сборка через torch подходит другому кодировщику, если он воспроизводит её векторы
+    artifact_dir = os.path.join(index_dir, artifact_key(scenes_path, model_name, vector_spec))
+    if not is_complete(artifact_dir):
+        return None
+    mean, worst = encoder_agreement(artifact_dir, model)
+    if mean >= ENCODER_MIN_COSINE:
+        print(f"✅ {encoder_id(model)} совместим с векторами {artifact_dir}: косинус {mean:.4f} (мин. {worst:.4f})")
+        return artifact_dir
+    print(f"⚠️ {encoder_id(model)} расходится с векторами {artifact_dir}: косинус {mean:.4f} < {ENCODER_MIN_COSINE}"
+          f" — корпус будет перекодирован")
+    return None
+
+
+# === Сборка артефактов ===
+def build_artifacts(scenes_path=SCENES_PATH, model_name=MODEL_NAME, index_dir=INDEX_DIR, model=None, force=False,
+                    vector_spec=None, encoder=None):
+    vector_spec = vector_spec or index_spec()
+    encoder = encoder or encoder_id(model)
+    key = artifact_key(scenes_path, model_name, vector_spec, encoder)
+    artifact_dir = os.path.join(index_dir, key)
+    if is_complete(artifact_dir) and not force:
+        return artifact_dir
+
+    if encoder != "torch" and not force:
+        model = model or load_model(model_name, encoder)
+        reused = reusable_artifacts(scenes_path, model_name, index_dir, model, vector_spec)
+        if reused:
+            return reused
+
+    with _build_lock(index_dir):
+        if is_complete(artifact_dir) and not force:
+            return artifact_dir
+
+        started = time.time()
+        scenes = [prepare_scene(s) for s in load_scenes(scenes_path)]  # + фрагмент и размер в токенах
+
+        bm25 = SparseBM25.from_corpus([analyze(bm25_document(s)) for s in scenes])
+
+        if model is None:
+            model = load_model(model_name, encoder)
+        embeddings = model.encode(
+            [s["summary_50w"] for s in scenes],
+            normalize_embeddings=True,
+            batch_size=64,
+            show_progress_bar=True,
+        ).astype(np.float32)
+
+        index = build_index(embeddings, **vector_spec)  # косинус (dot product после нормализации)
+
+        # Пишем во временную папку и переименовываем — читатели не увидят недописанный индекс
+        tmp_dir = f"{artifact_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        np.save(os.path.join(tmp_dir, EMBEDDINGS), embeddings)
+        faiss.write_index(index, os.path.join(tmp_dir, FAISS_INDEX))
+        bm25.save(tmp_dir)
+        SceneStore.write(scenes, tmp_dir)  # колонки + тексты одним файлом для mmap
+
+        manifest = {
+            "key": key,
+            "version": ARTIFACT_VERSION,
+            "analyzer_version": ANALYZER_VERSION,
+            "model": model_name,
+            "encoder": encoder,
+            "scenes_path": scenes_path,
+            "scenes_sha256": file_sha256(scenes_path),
+            "n_scenes": len(scenes),
+            "dim": int(embeddings.shape[1]),
+            "vector_index": vector_spec,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "build_seconds": round(time.time() - started, 2),
+        }
+        with open(os.path.join(tmp_dir, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        shutil.rmtree(artifact_dir, ignore_errors=True)
+        os.replace(tmp_dir, artifact_dir)
+        # Сборка могла идти в процессе API: словари сцен и индексы сборки больше не нужны
+        del scenes, bm25, embeddings, index
+
+    print(f"✅ Артефакты индекса собраны: {artifact_dir} ({manifest['build_seconds']} с)")
+    return artifact_dir
+
+
+# === Загрузка артефактов (mmap) ===
+def read_manifest(artifact_dir):
+    with open(os.path.join(artifact_dir, MANIFEST), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_artifacts(artifact_dir, mmap=True):
+    # Векторы и FAISS отображаются в память: воркеры делят одну копию через page cache
+    embeddings = np.load(os.path.join(artifact_dir, EMBEDDINGS), mmap_mode="r" if mmap else None)
+
+    kind = read_manifest(artifact_dir)["vector_index"]["kind"]
+    index = VectorBackend.load(os.path.join(artifact_dir, FAISS_INDEX), kind, mmap=mmap, embeddings=embeddings)
+
+    bm25 = SparseBM25.load(artifact_dir)
+    scenes = SceneStore.load(artifact_dir)  # тексты сцен читаются с диска лениво
+
+    return scenes, bm25, index, embeddings
+
+
+def current_keys(scenes_path=SCENES_PATH, model_name=MODEL_NAME, index_dir=INDEX_DIR):
+    # Ключи сборок текущего scenes.jsonl и модели — по манифестам, а не пересчётом ключа: сборки с другим
+    # векторным индексом (--vector-index, VECTOR_INDEX) и другим кодировщиком тоже относятся к корпусу
+    keys = set()
+    if not os.path.isdir(index_dir):
+        return keys
+    sha = file_sha256(scenes_path)
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if not is_complete(path):
+            continue
+        manifest = read_manifest(path)
+        if (manifest.get("scenes_sha256") == sha and manifest.get("model") == model_name
+                and manifest.get("version") == ARTIFACT_VERSION
+                and manifest.get("analyzer_version") == ANALYZER_VERSION):
+            keys.add(name)
+    return keys
+
+
+def prune_artifacts(keep_keys, index_dir=INDEX_DIR):
+    # Под тем же замком, что и сборка: папка <ключ>.tmp-<pid> идущей сборки (другой процесс, CI)
+    # не трогается, а готовая сборка не исчезает между проверкой и os.replace
+    removed = []
+    if not os.path.isdir(index_dir):
+        return removed
+    with _build_lock(index_dir):
+        for name in os.listdir(index_dir):
+            path = os.path.join(index_dir, name)
+            if name not in keep_keys and ".tmp-" not in name and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(name)
+    return removed
+
+
+# === CLI: python -m api.artifacts build ===
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-сборка индексов для API")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="собрать артефакты индекса для scenes.jsonl")
+    build.add_argument("--scenes", default=SCENES_PATH)
+    build.add_argument("--model", default=MODEL_NAME)
+    build.add_argument("--out", default=INDEX_DIR)
+    build.add_argument("--force", action="store_true", help="пересобрать, даже если хэш не изменился")
+    build.add_argument("--encoder", default=ENCODER_BACKEND, choices=ENCODER_BACKENDS)
+    build.add_argument("--vector-index", default=None, help="flat | hnsw | ivfpq | ivfsq8 (по умолчанию VECTOR_INDEX)")
+
+    prune = sub.add_parser("prune", help="удалить артефакты, не относящиеся к текущему scenes.jsonl")
+    prune.add_argument("--scenes", default=SCENES_PATH)
+    prune.add_argument("--model", default=MODEL_NAME)
+    prune.add_argument("--out", default=INDEX_DIR)
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        vector_spec = index_spec(args.vector_index) if args.vector_index else None
+        artifact_dir = build_artifacts(args.scenes, args.model, args.out, force=args.force, vector_spec=vector_spec,
+                                       encoder=args.encoder)
+        print(json.dumps(read_manifest(artifact_dir), ensure_ascii=False, indent=2))
+    elif args.command == "prune":
+        # Остаются все сборки текущего корпуса: любой векторный индекс, любой кодировщик
+        removed = prune_artifacts(current_keys(args.scenes, args.model, args.out), args.out)
+        print(f"Удалено версий: {len(removed)}")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,200 @@
+import os
+import json
+import numpy as np
+from scipy import sparse
+
+TF_MATRIX = "bm25_tf.npz"
+VOCAB = "bm25_vocab.json"
+PARAMS = "bm25_params.json"
+
+
+# === Векторизованный BM25 на инвертированном индексе ===
+# Формулы и параметры повторяют rank_bm25.BM25Okapi, поэтому ранжирование совпадает,
+# но IDF и нормировка по длине документа свёрнуты в веса заранее.
+# Строки CSR-матрицы термин × документ — это списки вхождений (posting lists):
+# запрос читает только строки своих терминов и считает очки только для документов,
+# где эти термины встречаются, а top-k выбирается через argpartition.
+class SparseBM25:
+    def __init__(self, tf, vocab, k1=1.5, b=0.75, epsilon=0.25, live=None, df=None, term_ids=None):
+        # tf: CSR (документы × термины) с частотами терминов;
+        # live — маска неудалённых документов, df и term_ids передаются при инкрементальном обновлении
+        self.tf = tf.tocsr()
+        self.vocab = vocab
+        self.term_ids = term_ids if term_ids is not None else {t: i for i, t in enumerate(vocab)}
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.live = live if live is not None else np.ones(self.tf.shape[0], dtype=bool)
+        self.df = df
+        self._compute_weights()
+
+    @classmethod
+    def from_corpus(cls, corpus_tokens, **params):
+        term_ids = {}
+        rows, cols = [], []
+        for doc_id, tokens in enumerate(corpus_tokens):
+            for token in tokens:
+                cols.append(term_ids.setdefault(token, len(term_ids)))
+                rows.append(doc_id)
+
+        tf = sparse.csr_matrix(
+            (np.ones(len(cols), dtype=np.float32), (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))),
+            shape=(len(corpus_tokens), len(term_ids)),
+        )
+        tf.sum_duplicates()
+        return cls(tf, list(term_ids), **params)
+
+    def _compute_weights(self):
+        n_terms = self.tf.shape[1]
+        n_docs = int(self.live.sum())  # удалённые документы не входят в статистику корпуса
+        self.corpus_size = self.tf.shape[0]
+        self.doc_len = np.asarray(self.tf.sum(axis=1), dtype=np.float64).ravel()
+        self.avgdl = self.doc_len.sum() / n_docs if n_docs else 0.0
+
+        # IDF как в BM25Okapi: отрицательные значения заменяются на epsilon * средний IDF.
+        # Средний — только по терминам, которые ещё встречаются: после удаления книги в словаре остаются
+        # термины с df = 0, которых нет в свежесобранном индексе
+        if self.df is None:
+            self.df = np.bincount(self.tf.indices, minlength=n_terms).astype(np.float64)
+        df = self.df
+        idf = np.log(n_docs - df + 0.5) - np.log(df + 0.5)
+        present = df > 0
+        if present.any():
+            idf[idf < 0] = self.epsilon * idf[present].mean()
+        self.idf = idf
+
+        # w(d, t) = idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * |d| / avgdl))
+        tf = self.tf.tocoo()
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len[tf.row] / self.avgdl)
+        data = idf[tf.col] * tf.data * (self.k1 + 1) / (tf.data + norm)
+        weights = sparse.csr_matrix((data, (tf.col, tf.row)), shape=(n_terms, self.corpus_size))
+        weights.sort_indices()
+        self.weights = weights
+        # Списки вхождений: документы термина t — postings[indptr[t]:indptr[t + 1]]
+        self.indptr = weights.indptr
+        self.postings = weights.indices
+        self.posting_weights = weights.data
+
+    # === Инкрементальные обновления: новый объект, старый продолжает обслуживать запросы ===
+    # Частоты (df, длины документов) обновляются по добавленным/удалённым строкам. IDF и avgdl общие
+    # для корпуса, поэтому веса пересчитываются целиком — это один векторный проход по ненулевым элементам.
+    def params(self):
+        return {"k1": self.k1, "b": self.b, "epsilon": self.epsilon}
+
+    def with_documents(self, corpus_tokens):
+        # Новые документы получают id corpus_size, corpus_size + 1, ...
+        vocab, term_ids = list(self.vocab), dict(self.term_ids)
+        rows, cols = [], []
+        for doc_id, tokens in enumerate(corpus_tokens):
+            for token in tokens:
+                term_id = term_ids.get(token)
+                if term_id is None:
+                    term_id = term_ids[token] = len(vocab)
+                    vocab.append(token)
+                cols.append(term_id)
+                rows.append(doc_id)
+
+        added = sparse.csr_matrix(
+            (np.ones(len(cols), dtype=np.float32), (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))),
+            shape=(len(corpus_tokens), len(vocab)),
+        )
+        added.sum_duplicates()
+        old = self.tf.copy()
+        old.resize((old.shape[0], len(vocab)))
+        df = np.concatenate([self.df, np.zeros(len(vocab) - len(self.df))])
+        df += np.bincount(added.indices, minlength=len(vocab))
+        live = np.concatenate([self.live, np.ones(len(corpus_tokens), dtype=bool)])
+        return type(self)(sparse.vstack([old, added], format="csr"), vocab, live=live, df=df, term_ids=term_ids,
+                          **self.params())
+
+    def without_documents(self, doc_ids):
+        # id не переиспользуются: строки удалённых документов обнуляются, номера остальных не меняются
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        removed = self.tf[doc_ids]
+        df = self.df - np.bincount(removed.indices, minlength=len(self.df))
+        keep = np.ones(self.tf.shape[0], dtype=np.float32)
+        keep[doc_ids] = 0
+        tf = sparse.diags(keep).dot(self.tf).tocsr()
+        tf.eliminate_zeros()
+        live = self.live.copy()
+        live[doc_ids] = False
+        return type(self)(tf, self.vocab, live=live, df=df, term_ids=self.term_ids, **self.params())
+
+    def _query_vector(self, query_tokens):
+        ids, counts = {}, []
+        for token in query_tokens:
+            term_id = self.term_ids.get(token)
+            if term_id is None:
+                continue
+            if term_id in ids:
+                counts[ids[term_id]] += 1
+            else:
+                ids[term_id] = len(counts)
+                counts.append(1)
+        return np.fromiter(ids, dtype=np.int64, count=len(ids)), np.asarray(counts, dtype=np.float64)
+
+    def postings_for(self, term):
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return np.empty(0, dtype=self.postings.dtype), np.empty(0)
+        start, end = self.indptr[term_id], self.indptr[term_id + 1]
+        return self.postings[start:end], self.posting_weights[start:end]
+
+    def get_scores(self, query_tokens):
+        # Полный вектор очков по всем документам — для совместимости с BM25Okapi
+        term_ids, counts = self._query_vector(query_tokens)
+        if not len(term_ids):
+            return np.zeros(self.corpus_size)
+        return self.weights[term_ids].T.dot(counts)
+
+    def match(self, query_tokens):
+        # Очки только для документов, содержащих хотя бы один термин запроса
+        term_ids, counts = self._query_vector(query_tokens)
+        if not len(term_ids):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        docs, weights = [], []
+        for term_id, count in zip(term_ids, counts):
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs.append(self.postings[start:end])
+            weights.append(self.posting_weights[start:end] * count)
+        docs, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+        return docs.astype(np.int64), np.bincount(inverse, weights=np.concatenate(weights))
+
+    def search(self, query_tokens, k, allowed=None):
+        # allowed — отсортированный массив id документов (жёсткий фильтр)
+        docs, scores = self.match(query_tokens)
+        if allowed is not None:
+            keep = np.isin(docs, allowed, assume_unique=True)
+            docs, scores = docs[keep], scores[keep]
+        order = top_k(scores, k)
+        return docs[order], scores[order]
+
+    # === Сохранение в артефакты ===
+    def save(self, path):
+        sparse.save_npz(os.path.join(path, TF_MATRIX), self.tf)
+        with open(os.path.join(path, VOCAB), "w", encoding="utf-8") as f:
+            json.dump(self.vocab, f, ensure_ascii=False)
+        with open(os.path.join(path, PARAMS), "w", encoding="utf-8") as f:
+            json.dump(self.params(), f)
+
+    @classmethod
+    def load(cls, path):
+        tf = sparse.load_npz(os.path.join(path, TF_MATRIX))
+        with open(os.path.join(path, VOCAB), "r", encoding="utf-8") as f:
+            vocab = json.load(f)
+        with open(os.path.join(path, PARAMS), "r", encoding="utf-8") as f:
+            params = json.load(f)
+        return cls(tf, vocab, **params)
+
+
+def top_k(scores, k):
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(len(scores))
+    # При равных очках порядок по позиции (номеру сцены) — выдача детерминирована
+    return idx[np.lexsort((idx, -scores[idx]))]
\ No newline at end of file
@@ -1,92 +1,39 @@
-from api.search import smart_search
-import json
-from g4f.client import Client
-from api.indexer import bm25, index, model, scenes
-from api.search import smart_search
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
-import threading
-
-client = Client()
-
-# === Загрузка стилей с кэшем ===
-_character_cache = None
-
-def load_character_style(name: str, characters_path="data/characters.json"):
-    global _character_cache
-    if _character_cache is None:
-        try:
-            with open(characters_path, "r", encoding="utf-8") as f:
-                _character_cache = json.load(f)
-        except Exception as e:
-            raise RuntimeError(f"Ошибка загрузки characters.json: {e}")
-
-    for ch in _character_cache:
-        aliases = ch["name"] if isinstance(ch["name"], list) else [ch["name"]]
-        if any(alias.lower() == name.lower() for alias in aliases):
-            return ch
-
-    return {
-        "name": [name],
-        "voice": "Простой, разговорный стиль. Художественная форма, как в книге",
-        "lexicon": [],
-        "mood_bias": {"ирония": 0.2, "романтика": 0.0, "фатализм": 0.5},
-        "constraints": "Не выдумывать факты, отвечать так, будто узнал слухи.",
-        "few_shots": []
-    }
+import os
+import time
+import asyncio
+import contextvars
+from functools import partial
+from api.indexer import encoder, searcher
+from api.llm import LLM_MODEL, make_provider
+from api.answer_cache import AnswerCache
+from api.personas import PersonaRegistry
+from api.evidence import PROMPT_MAX_SCENES, SEPARATOR, evidence_block, pack_evidence
+from api.metrics import metrics, observe, span
+from concurrent.futures import ThreadPoolExecutor
+
+# Поиск (CPU) идёт в отдельном пуле потоков, чтобы не занимать цикл событий и пул FastAPI
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+llm = make_provider()  # пул провайдеров из LLM_PROVIDERS: хеджирование, переход при ошибках
+
+answer_cache = AnswerCache()
+answer_cache.load()
+# После смены корпуса старые ответы опираются на другие сцены
+searcher.on_swap(lambda snapshot: answer_cache.clear())
+
+# === Персонажи: псевдонимы, стили и готовые системные промпты ===
+personas = PersonaRegistry()
+
+def load_character_style(name: str):
+    return personas.get(name).style
 
 # === Построение промпта ===
-def truncate_text(text, max_len=500):
-    return " ".join(text.split()[:max_len])
-
-def build_prompt(persona: str, query: str, scenes: list, max_scenes: int = 3):
-    style = load_character_style(persona)
-    canon_name = style["name"][0] if isinstance(style["name"], list) else style["name"]
-
-    evidence_pack = "\n---\n".join(
-        f"[Сцена {s['scene_id']}]\nКратко: {s['summary_50w']}\nФрагмент: {truncate_text(s['text'], 120)}"
-        for s in scenes[:max_scenes]
-    )
-
-    system_prompt = f"""
-Ты - {canon_name}. Ты есть этот персонаж, а не играешь его роль. 
-
-Твоя сущность:
-• Манера речи: {style['voice']}
-• Характерные выражения: {', '.join(style['lexicon'])}
-• Ограничения в разговоре: {style['constraints']}
-
-Правила существования:
-
-1. **Половая принадлежность**: Сперва определи - кто ты? Если {canon_name} женщина (как Йеннифер, Трисс, Цирилла), говори и мыслишь как женщина. Иначе - соответственно.
-
-2. **Язык и стиль**: 
-   - Избегай канцелярщины и сухих формулировок. 
-   - Речь должна быть живой, образной, художественной.
-   - Ты не слуга и не помощник - ты {canon_name} из плоти и крови.
-
-3. **Ответы на вопросы**:
-   - На общие приветствия ("Как дела?", "Расскажи шутку") отвечай в своём характере, без отсылок к книгам или сценам.
-   - Если в вопросе прямо названо {canon_name} - говори от первого лица, как о пережитом.
-   - Не используй фразы вроде "Я сам там не был" или "Слыхал такое". Либо говори как свидетель, либо отвечай в своём стиле.
-
-4. **Обращение к собеседнику**: Не предполагай пол говорящего. Обходись без обращений, указывающих на род.
-
-5. **Временные границы**: 
-   - Твой мир ограничен вселенной Ведьмака и XIII веком. 
-   - О том, что было после, не ведаешь. 
-   - Слов вроде "реклама", "психиатр", "нейросети", "механические мозги", "сети", "алгоритмы", "искусственный интеллект" и подобных - не знаешь и не понимаешь.
-   - НЕ пытайся угадать значение непонятных слов. Просто говори что не знаешь такого.
-   - НЕ сравнивай непонятное с магией, сетями, узорами или чем-то знакомым.
-
-6. **Приоритет знаний**: Сначала опирайся на описанные сцены (если вопрос касается их), потом - на общие знания о мире.
-
-7. **Оформление речи**: 
-   - Не называй тексты "сценами", если только речь не о театральных подмостках.
-   - Держи ответ в 5-8 предложениях.
-
-Помни: ты не исполняешь роль. Ты и есть {canon_name}.
-"""
-
+def build_prompt(persona: str, query: str, scenes: list):
+    # Системный промпт собран заранее, фрагменты сцен — при сборке индекса;
+    # на запрос остаётся склеить уже отобранные pack_evidence источники
+    system_prompt = personas.get(persona).system_prompt
+    evidence_pack = SEPARATOR.join(evidence_block(s) for s in scenes)
 
     return [
         {"role": "system", "content": system_prompt},
@@ -94,24 +41,111 @@ def build_prompt(persona: str, query: str, scenes: list, max_scenes: int = 3):
     ]
 
 # === Генерация ответа ===
-def ask_character(question: str, persona: str = "Геральт", topk: int = 3, chat_model: str = "gpt-oss-120b"):
-    try:
-        hits, ents = smart_search(question, bm25, index, model, scenes, topk_bm25=20, topk_faiss=20)
-    except NameError:
-        raise RuntimeError("Функция smart_search не определена или не импортирована!")
-
+def retrieve_for(question: str, max_scenes: int, filters):
+    searcher.maybe_sync()  # обновления, сделанные через другой воркер
+    snap = searcher.current  # один снимок на весь запрос: обновление индексов его не затронет
+    ids, _, info = snap.retrieve(question, encoder, topk_bm25=20, topk_faiss=20, filters=filters)
+    with span("evidence"):
+        hits, _ = pack_evidence((snap.scenes[i] for i in ids), max_scenes=max_scenes)
+    # Эмбеддинг вопроса уже посчитан при поиске; без него (фильтр ничего не оставил) нет и сцен
+    return hits, info.get("vector")
+
+async def prepare_messages(question: str, persona: str, topk: int = PROMPT_MAX_SCENES, filters=None):
+    # Возвращает (сообщения для LLM, ключ кэша ответов) или None, если ничего не найдено
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()  # разбивка запроса по этапам продолжается в потоке поиска
+    with span("retrieve"):
+        hits, vector = await loop.run_in_executor(retrieval_executor,
+                                                  partial(ctx.run, retrieve_for, question, topk, filters))
     if not hits:
-        return f"{persona} бы сказал: 'Хмм... не нахожу ничего в памяти об этом.'"
-
-    messages = build_prompt(persona, question, hits[:topk])
+        metrics.inc("witcher_not_found_total", help="Вопросы, по которым не нашлось сцен")
+        return None
+    key = (personas.get(persona).name, [s["scene_id"] for s in hits], vector)
+    with span("prompt"):
+        messages = build_prompt(persona, question, hits)
+    return messages, key
+
+def cached_answer(key):
+    with span("answer_cache"):
+        answer = answer_cache.get(*key)
+    metrics.inc("witcher_answer_cache_total", help="Обращения к кэшу ответов",
+                result="hit" if answer is not None else "miss")
+    return answer
+
+def not_found_answer(persona: str):
+    return f"{persona} бы сказал: 'Хмм... не нахожу ничего в памяти об этом.'"
+
+def log_llm_error(e: Exception):
+    metrics.inc("witcher_llm_errors_total", help="Ошибки и таймауты LLM", error=type(e).__name__)
+    print(f"⚠️ LLM не ответил: {e!r}")
+
+def error_answer(persona: str, e: Exception):
+    # Сюда доходит, только если не ответил ни один провайдер пула; подробности — в лог, а не в чат
+    log_llm_error(e)
+    if isinstance(e, asyncio.TimeoutError):
+        return f"{persona} бы сказал: 'Что-то я задумался... спроси ещё раз.'"
+    return f"{persona} бы сказал: 'Что-то пошло не так... спроси чуть позже.'"
+
+async def ask_character(question: str, persona: str = "Геральт", topk: int = PROMPT_MAX_SCENES, chat_model: str = LLM_MODEL, filters=None):
+    prepared = await prepare_messages(question, persona, topk, filters)
+    if prepared is None:
+        return not_found_answer(persona)
+    messages, key = prepared
+
+    cached = cached_answer(key)
+    if cached is not None:
+        return cached
 
     try:
-        response = client.chat.completions.create(
-            model=chat_model,
-            messages=messages
-        )
-        if response.choices[0].message.content.strip() == "''":
+        started = time.perf_counter()
+        with span("llm"):
+            content = await llm.complete(messages, model=chat_model)
+        if content.strip() == "''":
             print('Прости, слух подводит, повтори ещё разок?')
-        return response.choices[0].message.content.strip()
+        elif content.strip():
+            answer_cache.put(*key, content.strip(), (time.perf_counter() - started) * 1000)
+        return content.strip()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        return error_answer(persona, e)
+
+# === Потоковая генерация: токены отдаются по мере появления ===
+class StreamInterrupted(RuntimeError):
+    # LLM оборвал ответ, когда часть токенов уже ушла клиенту: текст ошибки к ним не дописывается
+    def __init__(self, tokens):
+        super().__init__(f"Ответ оборвался после {tokens} фрагментов")
+        self.tokens = tokens
+
+async def stream_character(question: str, persona: str = "Геральт", topk: int = PROMPT_MAX_SCENES, chat_model: str = LLM_MODEL, filters=None):
+    prepared = await prepare_messages(question, persona, topk, filters)
+    if prepared is None:
+        yield not_found_answer(persona)
+        return
+    messages, key = prepared
+
+    cached = cached_answer(key)
+    if cached is not None:
+        yield cached
+        return
+
+    try:
+        started, tokens = time.perf_counter(), []
+        async for token in llm.stream(messages, model=chat_model):
+            if not tokens:
+                observe("llm_ttft", time.perf_counter() - started)
+            tokens.append(token)
+            yield token
+        observe("llm", time.perf_counter() - started)
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
-        return f"{persona} бы сказал: 'Что-то пошло не так... ({e})'"
\ No newline at end of file
+        if tokens:
+            log_llm_error(e)
+            raise StreamInterrupted(len(tokens)) from e
+        yield error_answer(persona, e)
+        return
+
+    answer = "".join(tokens).strip()
+    if answer and answer != "''":
+        answer_cache.put(*key, answer, (time.perf_counter() - started) * 1000)
\ No newline at end of file
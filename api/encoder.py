@@ -0,0 +1,168 @@
+import os
+import time
+import queue
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import numpy as np
+
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "10000"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", "3600"))  # секунды
+ENCODE_MAX_BATCH = int(os.getenv("ENCODE_MAX_BATCH", "32"))
+ENCODE_BATCH_WAIT_MS = float(os.getenv("ENCODE_BATCH_WAIT_MS", "5"))
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.split()).lower().replace("ё", "е")
+
+
+# === LRU + TTL кэш эмбеддингов запросов ===
+class EmbeddingCache:
+    def __init__(self, max_size=EMBED_CACHE_SIZE, ttl=EMBED_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            vector, created = item
+            if self.ttl and time.monotonic() - created > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return vector
+
+    def put(self, key, vector):
+        with self._lock:
+            self._data[key] = (vector, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+# === Кодировщик запросов: кэш + микробатчинг ===
+# Одновременные запросы копятся несколько миллисекунд и кодируются одним батчем —
+# на CPU это заметно дешевле, чем отдельный проход модели на каждый вопрос.
+# Интерфейс совпадает с SentenceTransformer.encode, поэтому его можно передать в smart_search вместо модели.
+class QueryEncoder:
+    def __init__(self, model, cache=None, max_batch=ENCODE_MAX_BATCH, max_wait_ms=ENCODE_BATCH_WAIT_MS):
+        self.model = model
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue = queue.Queue()
+        self._pending = {}  # ключ → Future: одинаковые запросы в полёте кодируются один раз
+        self._lock = threading.Lock()
+        self._worker_pid = None
+
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.encoded = 0
+        self._batch_sizes = deque(maxlen=1000)
+        self._encode_ms = deque(maxlen=1000)
+
+    def _ensure_worker(self):
+        # Поток запускается лениво и заново после fork: потоки родителя в дочернем процессе не живут
+        if self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pending = {}
+                threading.Thread(target=self._run, name="query-encoder", daemon=True).start()
+                self._worker_pid = os.getpid()
+
+    def _submit(self, key, text):
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = Future()
+                self._pending[key] = future
+                self._queue.put((key, text, future))
+        return future
+
+    def _run(self):
+        q = self._queue
+        while True:
+            batch = [q.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        started = time.perf_counter()
+        try:
+            vectors = self.model.encode([text for _, text, _ in batch], normalize_embeddings=True,
+                                        batch_size=len(batch), show_progress_bar=False)
+            vectors = np.asarray(vectors, dtype=np.float32)
+        except Exception as e:
+            with self._lock:
+                for key, _, future in batch:
+                    self._pending.pop(key, None)
+                    future.set_exception(e)
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.batches += 1
+            self.encoded += len(batch)
+            self._batch_sizes.append(len(batch))
+            self._encode_ms.append(elapsed_ms)
+            for (key, _, future), vector in zip(batch, vectors):
+                self.cache.put(key, vector)
+                self._pending.pop(key, None)
+                future.set_result(vector)
+
+    def encode(self, texts, normalize_embeddings=True, **kwargs):
+        # Эмбеддинги в индексе нормированы, поэтому запросы кодируются только нормированными
+        if isinstance(texts, str):
+            texts = [texts]
+        self._ensure_worker()
+
+        vectors, futures = [None] * len(texts), {}
+        for i, text in enumerate(texts):
+            key = normalize_query(text)
+            vector = self.cache.get(key)
+            if vector is not None:
+                self.hits += 1
+                vectors[i] = vector
+            else:
+                self.misses += 1
+                futures[i] = self._submit(key, text)
+
+        for i, future in futures.items():
+            vectors[i] = future.result()
+        return np.vstack(vectors)
+
+    def stats(self):
+        requests = self.hits + self.misses
+        batch_sizes = list(self._batch_sizes)
+        encode_ms = list(self._encode_ms)
+        return {
+            "cache_size": len(self.cache),
+            "cache_hits": self.hits,
+            "cache_misses": self.misses,
+            "cache_hit_rate": round(self.hits / requests, 4) if requests else 0.0,
+            "batches": self.batches,
+            "encoded": self.encoded,
+            "batch_size_avg": round(float(np.mean(batch_sizes)), 2) if batch_sizes else 0.0,
+            "batch_size_max": max(batch_sizes, default=0),
+            "encode_ms_p50": round(float(np.percentile(encode_ms, 50)), 2) if encode_ms else 0.0,
+            "encode_ms_p95": round(float(np.percentile(encode_ms, 95)), 2) if encode_ms else 0.0,
+        }
\ No newline at end of file
@@ -0,0 +1,117 @@
+import os
+import json
+from collections import defaultdict
+import numpy as np
+from api.analyzer import analyze
+from api.gazetteer import CHARACTERS_PATH
+
+KINDS = ("characters", "locations", "events")
+SCENE_FIELDS = {"characters": "extra_characters", "locations": "extra_locations", "events": "event_tags"}
+
+
+# === Индекс сущностей: персонаж / место / событие → отсортированный массив id сцен ===
+# Строится один раз при загрузке. Бонусы при переранжировании и жёсткие фильтры
+# превращаются в векторные пересечения массивов вместо проверок `x in list` по каждой сцене.
+class EntityIndex:
+    def __init__(self, postings, aliases, n_scenes):
+        self.postings = postings  # kind → {нормализованный ключ → np.ndarray[int64]}
+        self.aliases = aliases  # нормализованный алиас персонажа → ключ канонического имени
+        self.n_scenes = n_scenes
+        self._empty = np.empty(0, dtype=np.int64)
+
+    @staticmethod
+    def _key(name):
+        return " ".join(analyze(name))
+
+    def normalize(self, kind, name):
+        key = self._key(name) if kind != "events" else name.strip().lower()
+        if kind == "characters":
+            key = self.aliases.get(key, key)
+        return key
+
+    @classmethod
+    def build(cls, scenes, characters_path=CHARACTERS_PATH):
+        aliases = {}
+        if characters_path and os.path.exists(characters_path):
+            with open(characters_path, "r", encoding="utf-8") as f:
+                for ch in json.load(f):
+                    names = ch["name"] if isinstance(ch["name"], list) else [ch["name"]]
+                    canonical = cls._key(names[0])
+                    for alias in names:
+                        aliases[cls._key(alias)] = canonical
+
+        index = cls({}, aliases, len(scenes))
+        index.postings = {
+            kind: {key: np.asarray(ids, dtype=np.int64) for key, ids in lists.items()}
+            for kind, lists in index._collect(scenes).items()
+        }
+        return index
+
+    def _collect(self, scenes, start=0):
+        lists = {kind: defaultdict(list) for kind in KINDS}
+        for scene_id, s in enumerate(scenes, start):
+            for kind in KINDS:
+                keys = set()
+                for value in s.get(SCENE_FIELDS[kind], []):
+                    keys.add(self.normalize(kind, value))
+                    if kind == "locations":
+                        # "Регион > Город > Локация" находится по любому звену
+                        keys.update(self.normalize(kind, part) for part in value.split(">"))
+                for key in keys:
+                    if key:
+                        lists[kind][key].append(scene_id)
+        return lists
+
+    # === Инкрементальные обновления: новый индекс, текущий продолжает обслуживать запросы ===
+    def with_scenes(self, scenes):
+        # Новые сцены получают id n_scenes, n_scenes + 1, ... — массивы остаются отсортированными
+        added = self._collect(scenes, self.n_scenes)
+        postings = {}
+        for kind in KINDS:
+            postings[kind] = dict(self.postings[kind])
+            for key, ids in added[kind].items():
+                ids = np.asarray(ids, dtype=np.int64)
+                old = postings[kind].get(key)
+                postings[kind][key] = ids if old is None else np.concatenate([old, ids])
+        return type(self)(postings, self.aliases, self.n_scenes + len(scenes))
+
+    def without_ids(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        postings = {}
+        for kind in KINDS:
+            postings[kind] = {}
+            for key, scene_ids in self.postings[kind].items():
+                left = np.setdiff1d(scene_ids, ids, assume_unique=True)
+                if len(left):
+                    postings[kind][key] = left
+        return type(self)(postings, self.aliases, self.n_scenes)
+
+    def ids(self, kind, name):
+        return self.postings[kind].get(self.normalize(kind, name), self._empty)
+
+    def _keys(self, kind, names):
+        # Разные алиасы одного персонажа считаются одним совпадением
+        return list(dict.fromkeys(self.normalize(kind, name) for name in names))
+
+    def count(self, kind, names, candidates):
+        # Сколько из названных сущностей встречается в каждой сцене-кандидате
+        counts = np.zeros(len(candidates), dtype=np.int64)
+        for key in self._keys(kind, names):
+            ids = self.postings[kind].get(key)
+            if ids is not None:
+                counts += np.isin(candidates, ids, assume_unique=True)
+        return counts
+
+    def any_of(self, kind, names):
+        arrays = [self.postings[kind].get(key, self._empty) for key in self._keys(kind, names)]
+        return np.unique(np.concatenate(arrays)) if arrays else self._empty
+
+    def filter(self, characters=(), locations=(), events=()):
+        # Жёсткий фильтр по всему корпусу: сцены, где есть все названные сущности.
+        # None — фильтр не задан; пустой массив — таких сцен нет
+        allowed = None
+        for kind, names in (("characters", characters), ("locations", locations), ("events", events)):
+            for key in self._keys(kind, names or ()):
+                ids = self.postings[kind].get(key, self._empty)
+                allowed = ids if allowed is None else np.intersect1d(allowed, ids, assume_unique=True)
+        return allowed
\ No newline at end of file
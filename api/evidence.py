@@ -0,0 +1,42 @@
+import os
+import math
+
+# === Пакет источников для промпта ===
+# Фрагмент сцены и его размер в токенах считаются один раз при сборке артефактов (api/artifacts.py);
+# на запрос остаётся только жадно набрать сцены по убыванию итоговых очков, пока хватает бюджета.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))  # токенов на все источники
+PROMPT_MAX_SCENES = int(os.getenv("PROMPT_MAX_SCENES", "3"))  # как было до бюджета
+EXCERPT_WORDS = 120
+# Оценка без токенизатора конкретной LLM: для русского текста ~3 символа на токен
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "3.0"))
+SEPARATOR = "\n---\n"
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def evidence_block(scene) -> str:
+    return f"[Сцена {scene['scene_id']}]\nКратко: {scene['summary_50w']}\nФрагмент: {scene['excerpt']}"
+
+
+def prepare_scene(scene):
+    # Вызывается при сборке: полный текст сцены больше не разбирается на каждый запрос
+    scene["excerpt"] = " ".join(scene["text"].split()[:EXCERPT_WORDS])
+    scene["evidence_tokens"] = estimate_tokens(evidence_block(scene)) + estimate_tokens(SEPARATOR)
+    return scene
+
+
+def pack_evidence(scenes, budget=PROMPT_TOKEN_BUDGET, max_scenes=PROMPT_MAX_SCENES):
+    # scenes — по убыванию итоговых очков. Сцена, которая не влезает, пропускается, а следующие
+    # (менее релевантные, но короче) ещё пробуются. Лучшая сцена берётся всегда, даже сверх бюджета.
+    packed, used = [], 0
+    for scene in scenes:
+        if len(packed) >= max_scenes:
+            break
+        cost = scene["evidence_tokens"]
+        if packed and used + cost > budget:
+            continue
+        packed.append(scene)
+        used += cost
+    return packed, used
\ No newline at end of file
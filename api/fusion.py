@@ -0,0 +1,59 @@
+import os
+import numpy as np
+
+# === Настройки гибридного ранжирования ===
+# rrf — reciprocal rank fusion по позициям в выдачах BM25 и FAISS;
+# weighted — взвешенная сумма очков, нормированных min-max внутри каждой выдачи
+FUSION_MODE = os.getenv("FUSION_MODE", "rrf")
+FUSION_RRF_K = float(os.getenv("FUSION_RRF_K", "60"))
+FUSION_W_BM25 = float(os.getenv("FUSION_W_BM25", "1.0"))
+FUSION_W_DENSE = float(os.getenv("FUSION_W_DENSE", "1.0"))
+# Вес бонуса за сущности в единицах «первое место в одной выдаче»
+FUSION_W_ENTITY = float(os.getenv("FUSION_W_ENTITY", "0.5"))
+
+
+def _positions(candidates, ids):
+    # Позиция каждого кандидата в выдаче ids (-1, если его там нет)
+    pos = np.full(len(candidates), -1, dtype=np.int64)
+    if len(ids):
+        order = np.argsort(ids, kind="stable")
+        found = np.searchsorted(ids[order], candidates)
+        found = np.minimum(found, len(ids) - 1)
+        hit = ids[order][found] == candidates
+        pos[hit] = order[found[hit]]
+    return pos
+
+
+def _minmax(scores):
+    if not len(scores):
+        return scores
+    lo, hi = scores.min(), scores.max()
+    return np.ones_like(scores) if hi == lo else (scores - lo) / (hi - lo)
+
+
+def fuse(candidates, bm25_ids, bm25_scores, dense_ids, dense_scores, entity_bonus,
+         mode=FUSION_MODE, rrf_k=FUSION_RRF_K, w_bm25=FUSION_W_BM25, w_dense=FUSION_W_DENSE,
+         w_entity=FUSION_W_ENTITY):
+    # Все аргументы — массивы NumPy; выдачи BM25 и FAISS упорядочены по убыванию очков
+    bm25_pos = _positions(candidates, bm25_ids)
+    dense_pos = _positions(candidates, dense_ids)
+
+    if mode == "rrf":
+        unit = 1.0 / (rrf_k + 1)
+        bm25_part = np.where(bm25_pos >= 0, 1.0 / (rrf_k + bm25_pos + 1), 0.0)
+        dense_part = np.where(dense_pos >= 0, 1.0 / (rrf_k + dense_pos + 1), 0.0)
+    elif mode == "weighted":
+        unit = 1.0
+        bm25_norm, dense_norm = _minmax(np.asarray(bm25_scores, dtype=np.float64)), _minmax(np.asarray(dense_scores, dtype=np.float64))
+        bm25_part = np.where(bm25_pos >= 0, bm25_norm[np.maximum(bm25_pos, 0)] if len(bm25_norm) else 0.0, 0.0)
+        dense_part = np.where(dense_pos >= 0, dense_norm[np.maximum(dense_pos, 0)] if len(dense_norm) else 0.0, 0.0)
+    else:
+        raise ValueError(f"Неизвестный режим слияния: {mode}")
+
+    return w_bm25 * bm25_part + w_dense * dense_part + w_entity * unit * entity_bonus
+
+
+def rank(candidates, scores):
+    # По убыванию очков, при равенстве — по id сцены: порядок детерминирован
+    order = np.lexsort((candidates, -scores))
+    return candidates[order], scores[order]
\ No newline at end of file
@@ -0,0 +1,115 @@
+import os
+import json
+from collections import deque
+from typing import Dict, List
+from api.analyzer import analyze
+
+CHARACTERS_PATH = os.getenv("CHARACTERS_PATH", "data/characters.json")
+
+
+# === Автомат Ахо–Корасик над последовательностями лемм ===
+# Символы автомата — леммы, а не буквы: так "Геральта" и "Геральтом" совпадают с "Геральт",
+# а совпадения всегда идут по границам слов.
+class AhoCorasick:
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]  # (длина шаблона в токенах, значение)
+
+    def add(self, tokens, value):
+        node = 0
+        for token in tokens:
+            nxt = self.goto[node].get(token)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][token] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = nxt
+        self.out[node].append((len(tokens), value))
+
+    def build(self):
+        q = deque(self.goto[0].values())
+        while q:
+            node = q.popleft()
+            for token, child in self.goto[node].items():
+                q.append(child)
+                f = self.fail[node]
+                while f and token not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.goto[f].get(token, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+        return self
+
+    def find(self, tokens):
+        # Все вхождения: (начало, конец, значение)
+        matches, node = [], 0
+        for i, token in enumerate(tokens):
+            while node and token not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(token, 0)
+            for length, value in self.out[node]:
+                matches.append((i - length + 1, i + 1, value))
+        return matches
+
+
+def _longest_non_overlapping(matches):
+    # Приоритет длинным совпадениям: "Геральт из Ривии" важнее, чем "Геральт" внутри него
+    chosen, taken = [], set()
+    for start, end, value in sorted(matches, key=lambda m: (m[0] - m[1], m[0])):
+        span = range(start, end)
+        if taken.isdisjoint(span):
+            taken.update(span)
+            chosen.append((start, value))
+    return [value for _, value in sorted(chosen, key=lambda c: c[0])]
+
+
+# === Словарь известных персонажей и мест ===
+class Gazetteer:
+    def __init__(self):
+        self.automaton = AhoCorasick()
+        self.size = 0
+
+    def add(self, kind, name):
+        tokens = analyze(name)
+        if tokens and len("".join(tokens)) > 2:
+            self.automaton.add(tuple(tokens), (kind, name))
+            self.size += 1
+
+    @classmethod
+    def build(cls, scenes=(), characters_path=CHARACTERS_PATH):
+        gazetteer = cls()
+        seen = set()
+
+        def add(kind, name):
+            name = name.strip()
+            if name and (kind, name) not in seen:
+                seen.add((kind, name))
+                gazetteer.add(kind, name)
+
+        if characters_path and os.path.exists(characters_path):
+            with open(characters_path, "r", encoding="utf-8") as f:
+                for ch in json.load(f):
+                    for alias in ch["name"] if isinstance(ch["name"], list) else [ch["name"]]:
+                        add("characters", alias)
+
+        for s in scenes:
+            if s is None:  # сцена удалена инкрементальным обновлением
+                continue
+            for name in s.get("extra_characters", []):
+                add("characters", name)
+            for location in s.get("extra_locations", []):
+                # "Регион > Город > Локация": в вопросе обычно звучит одно звено
+                for part in location.split(">"):
+                    add("locations", part)
+
+        gazetteer.automaton.build()
+        return gazetteer
+
+    def match(self, text: str) -> Dict[str, List[str]]:
+        found = {"characters": [], "locations": [], "misc": []}
+        for kind, name in _longest_non_overlapping(self.automaton.find(analyze(text))):
+            if name not in found[kind]:
+                found[kind].append(name)
+        return found
\ No newline at end of file
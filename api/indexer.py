@@ -1,54 +1,61 @@
-import json
-import faiss
+import os
 import numpy as np
-from rank_bm25 import BM25Okapi
-from sentence_transformers import SentenceTransformer
-
-# === Загружаем сцены ===
-def load_scenes(path="data/scenes.jsonl"):
-    scenes = []
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            scenes.append(json.loads(line))
-    return scenes
-
-scenes = load_scenes("data/scenes.jsonl")
+from api.analyzer import analyze
+from api.artifacts import SCENES_PATH, INDEX_DIR, MODEL_NAME, ENCODER_BACKEND, build_artifacts, load_artifacts, load_model
+from api.encoder import QueryEncoder
+from api.gazetteer import Gazetteer
+from api.entity_index import EntityIndex
+from api.searcher import UPDATES_LOG, Searcher, Snapshot
+from api.runtime import configure_threads
+
+# === Модель для эмбеддингов запросов ===
+# ENCODER_BACKEND=onnx-int8 — та же модель через ONNX Runtime, без torch в процессе API
+model = load_model(MODEL_NAME, ENCODER_BACKEND)  # компактная мультиязычная модель
+configure_threads()  # WORKER_THREADS: потоки torch и FAISS на процесс (ONNX Runtime — при создании сессии)
+
+# === Индексы: готовые артефакты (mmap), пересборка только при смене scenes.jsonl ===
+# Собрать заранее: python -m api.artifacts build
+# Для ONNX берутся векторы сборки через torch, если кодировщик их воспроизводит, иначе своя сборка
+artifact_dir = build_artifacts(SCENES_PATH, MODEL_NAME, INDEX_DIR, model=model)
+scenes, bm25, index, embeddings = load_artifacts(artifact_dir)
 print(f"✅ Загружено {len(scenes)} сцен")
+print(f"✅ BM25 и FAISS индексы загружены из {artifact_dir}")
 
-# === BM25 индекс ===
-bm25_corpus = [s["summary_50w"] + " " + " ".join(s["beats"]) + " " + " ".join(s["event_tags"]) for s in scenes]
-bm25_tokens = [doc.split() for doc in bm25_corpus]
-bm25 = BM25Okapi(bm25_tokens)
+# === Кодировщик запросов: кэш эмбеддингов + микробатчинг поверх модели ===
+encoder = QueryEncoder(model)
 
-# === FAISS индекс (эмбеддинги summary_50w) ===
-model = SentenceTransformer("intfloat/multilingual-e5-small")  # компактная мультиязычная модель
-embeddings = model.encode([s["summary_50w"] for s in scenes], normalize_embeddings=True)
+# === Словарь персонажей и мест для быстрого NER ===
+gazetteer = Gazetteer.build(scenes)
+print(f"✅ Словарь сущностей: {gazetteer.size} имён и мест")
 
-d = embeddings.shape[1]
-index = faiss.IndexFlatIP(d)  # косинус (dot product после нормализации)
-index.add(embeddings)
+# === Индекс сущностей: персонаж / место / событие → id сцен ===
+entity_index = EntityIndex.build(scenes)
 
-print(f"✅ BM25 и FAISS индексы построены")
+# === Текущий снимок индексов: книги добавляются и удаляются без перезапуска (POST /admin/scenes) ===
+# Модули выше — снимок на момент старта; запросы должны брать searcher.current
+searcher = Searcher(Snapshot(scenes, bm25, index, gazetteer, entity_index), model,
+                    journal_path=os.path.join(artifact_dir, UPDATES_LOG))
+if searcher.replay():
+    print(f"✅ Применены обновления из журнала: {searcher.current.stats()}")
 
 # === Функция поиска ===
 def search(query, must_have_characters=None, topk_bm25=30, topk_faiss=30):
+    snap = searcher.current
+    bm25, index, entity_index, scenes = snap.bm25, snap.index, snap.entity_index, snap.scenes
+
     # BM25
-    query_tokens = query.split()
-    bm25_scores = bm25.get_scores(query_tokens)
-    bm25_top = np.argsort(bm25_scores)[::-1][:topk_bm25]
+    query_tokens = analyze(query)
+    bm25_top, _ = bm25.search(query_tokens, topk_bm25)
 
     # FAISS
-    q_emb = model.encode([query], normalize_embeddings=True)
+    q_emb = encoder.encode([query], normalize_embeddings=True)
     faiss_scores, faiss_idx = index.search(q_emb, topk_faiss)
+    faiss_top = faiss_idx[0][faiss_idx[0] >= 0]  # ANN-индексы добивают выдачу id = -1
 
-    candidates = set(bm25_top.tolist() + faiss_idx[0].tolist())
-    results = [scenes[i] for i in candidates]
+    candidates = np.union1d(bm25_top, faiss_top).astype(np.int64)
 
     if must_have_characters:
-        results = [
-            s for s in results
-            if any(char in s["extra_characters"] for char in must_have_characters)
-        ]
-    return results
+        candidates = candidates[np.isin(candidates, entity_index.any_of("characters", must_have_characters))]
+    return [scenes[i] for i in candidates]
 
-__all__ = ["bm25", "index", "model", "scenes"]
\ No newline at end of file
+__all__ = ["bm25", "index", "model", "encoder", "gazetteer", "entity_index", "scenes", "searcher"]
\ No newline at end of file
@@ -0,0 +1,379 @@
+import os
+import json
+import time
+import asyncio
+from collections import deque
+import aiohttp
+import numpy as np
+
+from api.metrics import metrics
+
+# === Настройки LLM ===
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-oss-120b")
+# OpenAI-совместимый сервер (например, локальная заглушка bench/stub_llm.py); без него — g4f
+LLM_BASE_URL = os.getenv("LLM_BASE_URL")
+LLM_API_KEY = os.getenv("LLM_API_KEY", "")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))  # секунды на весь ответ
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # одновременных запросов к провайдеру
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "32"))  # соединений в пуле
+
+# Несколько провайдеров через запятую: адрес OpenAI-совместимого сервера или g4f, после # — модель
+LLM_PROVIDERS = os.getenv("LLM_PROVIDERS", "")
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1") != "0"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.9"))  # дублировать запрос после p90 задержки
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "3"))  # секунды, пока замеров меньше LLM_HEDGE_MIN_SAMPLES
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MAX_INFLIGHT = int(os.getenv("LLM_HEDGE_MAX_INFLIGHT", "2"))  # одновременных копий одного запроса
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))  # последних замеров для квантиля
+LLM_EWMA_ALPHA = float(os.getenv("LLM_EWMA_ALPHA", "0.2"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))  # ошибок подряд до отключения
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))  # секунд вне ротации
+
+
+class LLMError(RuntimeError):
+    pass
+
+
+# === OpenAI-совместимый провайдер: общий пул соединений aiohttp ===
+class OpenAICompatProvider:
+    def __init__(self, base_url, api_key="", model=LLM_MODEL, max_concurrency=LLM_MAX_CONCURRENCY,
+                 timeout=LLM_TIMEOUT, pool_size=LLM_POOL_SIZE, name=None):
+        self.name = name or base_url
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self._session = None
+
+    def _get_session(self):
+        # Сессия создаётся внутри работающего цикла событий и переиспользуется всеми запросами
+        if self._session is None or self._session.closed:
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=headers,
+            )
+        return self._session
+
+    async def complete(self, messages, model=None):
+        payload = {"model": model or self.model, "messages": messages}
+        async with self.semaphore:
+            async with self._get_session().post(f"{self.base_url}/chat/completions", json=payload) as resp:
+                if resp.status != 200:
+                    raise LLMError(f"{self.name}: HTTP {resp.status}")
+                data = await resp.json()
+        return data["choices"][0]["message"]["content"]
+
+    async def stream(self, messages, model=None):
+        # Токены по мере генерации (SSE: data: {...} ... data: [DONE])
+        payload = {"model": model or self.model, "messages": messages, "stream": True}
+        async with self.semaphore:
+            async with self._get_session().post(f"{self.base_url}/chat/completions", json=payload) as resp:
+                if resp.status != 200:
+                    raise LLMError(f"{self.name}: HTTP {resp.status}")
+                async for line in resp.content:
+                    line = line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+# === g4f: асинхронный клиент с тем же ограничением параллелизма и таймаутом ===
+class G4FProvider:
+    def __init__(self, model=LLM_MODEL, max_concurrency=LLM_MAX_CONCURRENCY, timeout=LLM_TIMEOUT, name="g4f"):
+        from g4f.client import AsyncClient
+        self.name = name
+        self.client = AsyncClient()
+        self.model = model
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def complete(self, messages, model=None):
+        async with self.semaphore:
+            response = await asyncio.wait_for(
+                self.client.chat.completions.create(model=model or self.model, messages=messages),
+                self.timeout,
+            )
+        return response.choices[0].message.content
+
+    async def stream(self, messages, model=None):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        async with self.semaphore:
+            chunks = self.client.chat.completions.stream(messages, model or self.model).__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), max(0.0, deadline - loop.time()))
+                except StopAsyncIteration:
+                    break
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+
+    async def close(self):
+        pass
+
+
+# === Пул провайдеров: здоровье, EWMA задержки, хеджирование и автоматы отключения ===
+# Запрос уходит лучшему провайдеру (EWMA задержки / здоровье). Если за p90 его обычной задержки не пришло
+# ни токена, тот же запрос параллельно отправляется следующему: кто ответит первым, тот и выиграл,
+# второй запрос отменяется. Ошибка — сразу следующий провайдер. После LLM_BREAKER_FAILURES ошибок подряд
+# провайдер выводится из ротации на LLM_BREAKER_COOLDOWN секунд, затем пропускается один пробный запрос.
+class ProviderStats:
+    # Задержка до первого токена (для complete — до ответа целиком): EWMA и окно для квантиля
+    def __init__(self, alpha=LLM_EWMA_ALPHA, window=LLM_LATENCY_WINDOW):
+        self.alpha = alpha
+        self.ewma = None
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds, sample=True):
+        self.ewma = seconds if self.ewma is None else self.ewma + self.alpha * (seconds - self.ewma)
+        if sample:
+            self.samples.append(seconds)
+
+    def quantile(self, q):
+        if len(self.samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return float(np.quantile(self.samples, q))
+
+
+class PoolMember:
+    def __init__(self, provider, model=None, breaker_failures=LLM_BREAKER_FAILURES):
+        self.provider = provider
+        self.name = provider.name
+        self.model = model  # модель, заданная в LLM_PROVIDERS, важнее запрошенной
+        self.breaker_failures = breaker_failures  # 0 — без автомата: провайдер только опускается в рейтинге
+        self.latency = {"complete": ProviderStats(), "stream": ProviderStats()}
+        self.health = 1.0  # EWMA успехов: 1 — все запросы удачные
+        self.failures = 0  # ошибок подряд
+        self.state = "closed"  # closed → open (вне ротации) → half-open (один пробный запрос) → closed
+        self.open_until = 0.0
+        self.trial = False
+        self.counts = {"ok": 0, "error": 0, "cancelled": 0, "hedged": 0}
+
+    def available(self, now):
+        if self.state == "open" and now >= self.open_until:
+            self.state, self.trial = "half-open", False
+        if self.state == "open":
+            return False
+        return self.state == "closed" or not self.trial
+
+    def score(self, mode):
+        ewma = self.latency[mode].ewma or 0.0  # без замеров — пробуем первым
+        return ewma / max(self.health, 0.05)
+
+    def started(self):
+        if self.state == "half-open":
+            self.trial = True
+
+    def succeeded(self, mode, seconds):
+        self.latency[mode].observe(seconds)
+        self.health += LLM_EWMA_ALPHA * (1.0 - self.health)
+        self.failures = 0
+        self.state, self.trial = "closed", False
+        self.counts["ok"] += 1
+        metrics.histogram("witcher_llm_provider_seconds", "Задержка провайдера LLM до первого токена",
+                          provider=self.name, mode=mode).observe(seconds)
+        metrics.inc("witcher_llm_provider_requests_total", help="Запросы к провайдерам LLM",
+                    provider=self.name, result="ok")
+
+    def failed(self, error):
+        self.health -= LLM_EWMA_ALPHA * self.health
+        self.failures += 1
+        self.counts["error"] += 1
+        metrics.inc("witcher_llm_provider_requests_total", help="Запросы к провайдерам LLM",
+                    provider=self.name, result="error")
+        if self.breaker_failures and (self.state == "half-open" or self.failures >= self.breaker_failures):
+            if self.state != "open":
+                metrics.inc("witcher_llm_breaker_open_total", help="Срабатывания автомата отключения провайдера",
+                            provider=self.name)
+                print(f"⚠️ LLM {self.name} выведен из ротации на {LLM_BREAKER_COOLDOWN:.0f} с: {error!r}")
+            self.state, self.trial = "open", False
+            self.open_until = time.monotonic() + LLM_BREAKER_COOLDOWN
+
+    def cancelled(self, mode, seconds):
+        # Проигравший хедж: ответа не было минимум seconds — нижняя оценка задержки сдвигает EWMA,
+        # но не попадает в окно квантиля (иначе p90 занижался бы до порога хеджирования)
+        self.latency[mode].observe(seconds, sample=False)
+        self.trial = False
+        self.counts["cancelled"] += 1
+        metrics.inc("witcher_llm_provider_requests_total", help="Запросы к провайдерам LLM",
+                    provider=self.name, result="cancelled")
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "state": self.state,
+            "health": round(self.health, 3),
+            **{f"{mode}_ewma_ms": round(s.ewma * 1000, 1) if s.ewma is not None else None
+               for mode, s in self.latency.items()},
+            **{f"{mode}_p90_ms": round(s.quantile(0.9) * 1000, 1) if s.quantile(0.9) is not None else None
+               for mode, s in self.latency.items()},
+            **self.counts,
+        }
+
+
+class ProviderPool:
+    def __init__(self, members, hedge=LLM_HEDGE, hedge_quantile=LLM_HEDGE_QUANTILE, hedge_after=LLM_HEDGE_AFTER,
+                 max_inflight=LLM_HEDGE_MAX_INFLIGHT, timeout=LLM_TIMEOUT):
+        self.members = [m if isinstance(m, PoolMember) else PoolMember(m) for m in members]
+        self.name = "pool"
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_after = hedge_after  # пока у провайдера мало замеров
+        self.max_inflight = max_inflight
+        self.timeout = timeout  # на весь запрос, со всеми повторами и хеджами
+
+    def ranked(self, mode):
+        now = time.monotonic()
+        return sorted((m for m in self.members if m.available(now)), key=lambda m: m.score(mode))
+
+    def hedge_delay(self, member, mode):
+        return member.latency[mode].quantile(self.hedge_quantile) or self.hedge_after
+
+    async def _race(self, mode, start):
+        # start(member) → задача, которая завершается первым токеном (или ответом целиком).
+        # Возвращает (участник, результат задачи, секунды); проигравшие задачи отменены.
+        candidates = self.ranked(mode)
+        if not candidates:
+            raise LLMError("Все провайдеры LLM временно выведены из ротации")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        pending, errors = {}, []  # задача → (участник, время запуска); порядок — порядок запуска
+
+        def launch():
+            member = candidates.pop(0)
+            member.started()
+            pending[start(member)] = (member, loop.time())
+
+        launch()
+        try:
+            while pending:
+                oldest, launched = next(iter(pending.values()))
+                wait = deadline - loop.time()
+                can_hedge = self.hedge and candidates and len(pending) < self.max_inflight
+                if can_hedge:
+                    wait = min(wait, launched + self.hedge_delay(oldest, mode) - loop.time())
+                done, _ = await asyncio.wait(pending, timeout=max(0.0, wait), return_when=asyncio.FIRST_COMPLETED)
+                if not done and loop.time() >= deadline:
+                    for task, (member, _) in pending.items():
+                        task.cancel()
+                        member.failed(asyncio.TimeoutError())
+                    await asyncio.gather(*pending, return_exceptions=True)
+                    pending.clear()
+                    raise asyncio.TimeoutError()
+                if not done:
+                    launch()  # хедж: самый ранний запрос молчит дольше p90 своего провайдера
+                    oldest.counts["hedged"] += 1
+                    metrics.inc("witcher_llm_hedges_total", help="Запросы, продублированные другому провайдеру")
+                    continue
+                for task in done:
+                    member, launched = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        return member, task.result(), loop.time() - launched
+                    member.failed(error)
+                    errors.append(f"{member.name}: {error!r}")
+                    if candidates:
+                        launch()  # ошибка — сразу следующий провайдер
+            raise LLMError("; ".join(errors))
+        finally:
+            # Проигравшие (или все, если отменили нас самих) — отменяем и дожидаемся закрытия соединений
+            now = loop.time()
+            for task, (member, launched) in pending.items():
+                task.cancel()
+                member.cancelled(mode, now - launched)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def _model(self, member, model):
+        return member.model or model
+
+    async def complete(self, messages, model=None):
+        def start(member):
+            return asyncio.ensure_future(member.provider.complete(messages, model=self._model(member, model)))
+
+        member, content, seconds = await self._race("complete", start)
+        member.succeeded("complete", seconds)
+        return content
+
+    async def stream(self, messages, model=None):
+        streams = {}
+
+        async def first_token(member):
+            # Ждём первый непустой фрагмент; пустой ответ — тоже результат
+            chunks = streams[member] = member.provider.stream(messages, model=self._model(member, model))
+            try:
+                return await chunks.__anext__()
+            except StopAsyncIteration:
+                return None
+
+        def start(member):
+            return asyncio.ensure_future(first_token(member))
+
+        try:
+            member, token, seconds = await self._race("stream", start)
+        except BaseException:
+            for chunks in streams.values():
+                await chunks.aclose()
+            raise
+        for other, chunks in streams.items():
+            if other is not member:
+                await chunks.aclose()  # задачи проигравших уже отменены и дождались
+        chunks = streams[member]
+        if token is None:
+            member.succeeded("stream", seconds)
+            return
+        try:
+            yield token
+            async for token in chunks:
+                yield token
+        except Exception as e:
+            member.failed(e)  # токены уже ушли клиенту — другой провайдер продолжить не может
+            raise
+        finally:
+            await chunks.aclose()
+        member.succeeded("stream", seconds)
+
+    def stats(self):
+        return {"hedge": self.hedge, "providers": [m.stats() for m in self.members]}
+
+    async def close(self):
+        for member in self.members:
+            await member.provider.close()
+
+
+def provider_specs(value=LLM_PROVIDERS):
+    # "http://a:9000/v1#model-a,g4f#gpt-oss-120b,http://b:9001/v1" → [(адрес или g4f, модель или None)]
+    specs = []
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        target, _, model = item.partition("#")
+        specs.append((target, model or None))
+    return specs
+
+
+def make_provider(hedge=LLM_HEDGE, breaker=True, **kwargs):
+    # kwargs — общие параметры провайдеров (max_concurrency, timeout, model), например для парсера.
+    # Без LLM_PROVIDERS — один провайдер (LLM_BASE_URL, иначе g4f), но тоже за автоматом отключения.
+    # breaker=False — для пакетной работы: быстрый отказ ей не нужен, запросы повторяются со своими паузами
+    specs = provider_specs() or [(LLM_BASE_URL or "g4f", None)]
+    members = []
+    for target, model in specs:
+        if target == "g4f":
+            provider = G4FProvider(**kwargs, name=f"g4f#{model}" if model else "g4f")
+        else:
+            provider = OpenAICompatProvider(target, LLM_API_KEY, **kwargs, name=f"{target}#{model}" if model else None)
+        members.append(PoolMember(provider, model, LLM_BREAKER_FAILURES if breaker else 0))
+    return ProviderPool(members, hedge=hedge, timeout=kwargs.get("timeout", LLM_TIMEOUT))
\ No newline at end of file
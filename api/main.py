@@ -1,18 +1,161 @@
-from fastapi import FastAPI
+from typing import List
+import os
+import json
+import time
+import asyncio
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from api.chat import ask_character
+from api.chat import StreamInterrupted, ask_character, stream_character, llm, answer_cache
+from api.indexer import encoder, searcher
+from api.metrics import METRICS_ENABLED, SERVER_TIMING, current_trace, metrics, server_timing, start_trace
+from api.profiler import profile
+
+# Токен для /admin/*: без него эндпоинты обновления индексов выключены
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
 
 app = FastAPI()
 
+# === Метрики запросов и разбивка по этапам (Server-Timing) ===
+def record_request(path, status, started):
+    if METRICS_ENABLED:
+        metrics.histogram("witcher_request_seconds", "Время ответа API", path=path).observe(time.perf_counter() - started)
+    metrics.inc("witcher_requests_total", help="Запросы к API", path=path, status=status)
+
+async def until_body_end(body_iterator, path, status, started):
+    # call_next возвращает потоковый ответ сразу после заголовков: время считаем до последнего фрагмента
+    try:
+        async for chunk in body_iterator:
+            yield chunk
+    finally:
+        record_request(path, status, started)
+
+@app.middleware("http")
+async def timing(request: Request, call_next):
+    trace = start_trace()
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"  # шаблон пути: /admin/books/{book_id}
+    # У потокового ответа заголовки уходят до окончания работы — разбивка будет в событии done
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        response.body_iterator = until_body_end(response.body_iterator, path, response.status_code, started)
+        return response
+    record_request(path, response.status_code, started)
+    if SERVER_TIMING and trace:
+        response.headers["Server-Timing"] = server_timing(trace)
+    return response
+
 class Question(BaseModel):
     persona: str
     query: str
+    # Необязательные жёсткие фильтры: только сцены, где есть все указанные персонажи, места и события
+    characters: List[str] = []
+    locations: List[str] = []
+    events: List[str] = []
+
+async def until_disconnect(request: Request, coro, poll_interval=0.5):
+    # Если клиент (бот) ушёл, не ждём ответа LLM впустую: отменяем задачу
+    task = asyncio.ensure_future(coro)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=poll_interval)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            task.cancel()
+            return None
 
 @app.post("/ask")
-def ask(question: Question):
-    answer = ask_character(question.query, persona=question.persona)
+async def ask(question: Question, request: Request):
+    filters = {"characters": question.characters, "locations": question.locations, "events": question.events}
+    answer = await until_disconnect(request, ask_character(
+        question.query, persona=question.persona, filters=filters if any(filters.values()) else None))
+    if answer is None:
+        return Response(status_code=499)  # клиент закрыл соединение
     return {"answer": answer}
 
+def sse(event: str, data: dict):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/ask/stream")
+async def ask_stream(question: Question):
+    # Server-Sent Events: event: token — очередной фрагмент ответа; event: done — итог с временем до первого токена;
+    # event: error вместо done — LLM оборвал ответ на середине, показ решает клиент
+    filters = {"characters": question.characters, "locations": question.locations, "events": question.events}
+
+    async def events():
+        started = time.perf_counter()
+        ttft_ms, n_tokens = None, 0
+        try:
+            async for token in stream_character(question.query, persona=question.persona,
+                                                filters=filters if any(filters.values()) else None):
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+                n_tokens += 1
+                yield sse("token", {"text": token})
+        except StreamInterrupted as e:
+            yield sse("error", {"message": str(e), "ttft_ms": ttft_ms, "tokens": n_tokens})
+            return
+        total_ms = round((time.perf_counter() - started) * 1000, 1)
+        timings = {stage: round(seconds * 1000, 1) for stage, seconds in (current_trace() or {}).items()}
+        yield sse("done", {"ttft_ms": ttft_ms, "total_ms": total_ms, "tokens": n_tokens, "timings": timings})
+
+    # При отключении клиента Starlette отменяет генератор, а вместе с ним и запрос к LLM
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/stats")
+def stats():
+    return {"encoder": encoder.stats(), "answer_cache": answer_cache.stats(), "index": searcher.current.stats(),
+            "llm": llm.stats(), "stages": metrics.stages()}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# === Обновление корпуса без перезапуска: новые книги дописываются в индексы, запросы не ждут ===
+class NewScenes(BaseModel):
+    scenes: List[dict]  # строки scenes.jsonl, у каждой должен быть book_id
+
+def check_admin(token):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404)
+    if token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Неверный токен")
+
+@app.post("/admin/scenes")
+async def add_scenes(body: NewScenes, x_admin_token: str = Header(None)):
+    check_admin(x_admin_token)
+    try:
+        # Кодирование и сборка нового снимка — в пуле потоков, цикл событий продолжает отвечать
+        return await asyncio.to_thread(searcher.add_scenes, body.scenes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/admin/books/{book_id}")
+async def remove_book(book_id: str, x_admin_token: str = Header(None)):
+    check_admin(x_admin_token)
+    try:
+        return await asyncio.to_thread(searcher.remove_book, book_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Книга {book_id} не найдена")
+
+# === Профилирование на работающем API: стеки потоков поиска в формате collapsed stacks ===
+# curl -H "X-Admin-Token: $ADMIN_TOKEN" "localhost:8000/admin/profile?seconds=30" > retrieval.folded
+# flamegraph.pl retrieval.folded > retrieval.svg  (или открыть в speedscope.app)
+@app.get("/admin/profile")
+async def admin_profile(seconds: float = 10.0, hz: int = 100, threads: str = "retrieval",
+                        x_admin_token: str = Header(None)):
+    check_admin(x_admin_token)
+    profiler = await asyncio.to_thread(profile, seconds, hz, threads)
+    if profiler is None:
+        raise HTTPException(status_code=409, detail="Профилировщик уже запущен")
+    return PlainTextResponse(profiler.folded(), headers={"X-Profile-Samples": str(profiler.samples)})
+
+@app.on_event("shutdown")
+async def shutdown():
+    await llm.close()
+    answer_cache.save()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,177 @@
+import os
+import time
+import bisect
+import threading
+from contextvars import ContextVar
+
+# === Метрики конвейера /ask ===
+# span("bm25") замеряет этап: длительность попадает в гистограмму witcher_stage_seconds{stage="bm25"}
+# и в разбивку текущего запроса (заголовок Server-Timing). Гистограммы — фиксированные корзины,
+# запись — бинарный поиск и инкремент под замком, без хранения отдельных замеров.
+# GET /metrics отдаёт всё в текстовом формате Prometheus; у каждого воркера gunicorn свои счётчики.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") != "0"  # разбивка по этапам в заголовке ответа /ask
+
+# Секунды: от долей миллисекунды (словарь сущностей, BM25) до десятков секунд (LLM)
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина — +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        # Оценка по корзинам с линейной интерполяцией, как histogram_quantile в Prometheus
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank, seen = q * total, 0
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    def __init__(self):
+        self._histograms = {}  # (имя, метки) → Histogram
+        self._counters = {}  # (имя, метки) → число
+        self._help = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def histogram(self, name, help="", **labels):
+        key = self._key(name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+                self._help.setdefault(name, help)
+        return histogram
+
+    def inc(self, name, value=1, help="", **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._help.setdefault(name, help)
+
+    def stages(self):
+        # p50/p95/p99 по этапам в миллисекундах — для /stats
+        out = {}
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            if name != "witcher_stage_seconds" or not histogram.count:
+                continue
+            out[dict(labels)["stage"]] = {
+                "count": histogram.count,
+                "mean_ms": round(histogram.sum / histogram.count * 1000, 2),
+                **{f"p{int(q * 100)}_ms": round(histogram.quantile(q) * 1000, 2) for q in (0.5, 0.95, 0.99)},
+            }
+        return out
+
+    def render(self):
+        # Текстовый формат Prometheus 0.0.4
+        lines = []
+
+        def labels_text(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines += [f"# HELP {name} {self._help.get(name, '')}", f"# TYPE {name} counter"]
+            lines.append(f"{name}{labels_text(labels)} {value}")
+
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines += [f"# HELP {name} {self._help.get(name, '')}", f"# TYPE {name} histogram"]
+            with histogram._lock:
+                counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+            cumulative = 0
+            for bound, n in zip(list(histogram.buckets) + ["+Inf"], counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{labels_text(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{labels_text(labels)} {total}")
+            lines.append(f"{name}_count{labels_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+# === Разбивка одного запроса по этапам ===
+# Словарь этап → секунды живёт в contextvar; в пул потоков поиска он передаётся через copy_context
+_trace = ContextVar("trace", default=None)
+_stage_histograms = {}
+
+
+def start_trace():
+    trace = {}
+    _trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _trace.get()
+
+
+def observe(stage, seconds):
+    if not METRICS_ENABLED:
+        return
+    histogram = _stage_histograms.get(stage)
+    if histogram is None:
+        histogram = _stage_histograms[stage] = metrics.histogram(
+            "witcher_stage_seconds", "Длительность этапов конвейера /ask", stage=stage)
+    histogram.observe(seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace[stage] = trace.get(stage, 0.0) + seconds
+
+
+class span:
+    # with span("bm25"): ... — класс, а не @contextmanager: на горячем пути дешевле генератора
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if METRICS_ENABLED:
+            observe(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+def server_timing(trace):
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in trace.items())
\ No newline at end of file
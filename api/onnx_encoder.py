@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import shutil
+import inspect
+import argparse
+import threading
+import numpy as np
+
+from api.runtime import WORKER_THREADS, cpu_count
+
+# === Кодировщик на ONNX Runtime (int8) вместо PyTorch ===
+# Модель один раз экспортируется из sentence-transformers в ONNX и квантуется динамически в int8
+# (веса линейных слоёв — int8, активации квантуются на лету). Для работы нужны только onnxruntime
+# и tokenizers: torch требуется лишь при экспорте. Пулинг и длина последовательности берутся
+# из исходной модели, поэтому векторы совместимы с эмбеддингами, посчитанными через torch.
+# python -m api.onnx_encoder export
+ONNX_DIR = os.getenv("ONNX_DIR", "data/onnx")
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # 0 — WORKER_THREADS или все ядра процесса
+ONNX_SPIN = os.getenv("ONNX_SPIN", "1") != "0"  # активное ожидание потоков: быстрее, но жжёт CPU между батчами
+
+META = "encoder.json"
+FP32 = "model.onnx"
+INT8 = "model-int8.onnx"
+TOKENIZER = "tokenizer.json"
+
+
+def model_dir(model_name, onnx_dir=ONNX_DIR):
+    return os.path.join(onnx_dir, model_name.strip("/").replace("/", "__"))
+
+
+def pooling_mode_of(config):
+    # Старые sentence-transformers хранят флаги pooling_mode_*_token(s), новые — строку pooling_mode
+    if config.get("pooling_mode") in ("mean", "cls"):
+        return config["pooling_mode"]
+    enabled = [key for key, value in config.items() if key.startswith("pooling_mode_") and value]
+    if enabled == ["pooling_mode_mean_tokens"]:
+        return "mean"
+    if enabled == ["pooling_mode_cls_token"]:
+        return "cls"
+    raise ValueError(f"Пулинг {config} не поддерживается: нужен ровно один из mean и cls")
+
+
+# === Экспорт: sentence-transformers → ONNX fp32 → динамический int8 ===
+def export(model_name, out_dir=None):
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    out_dir = out_dir or model_dir(model_name)
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer, pooling, *rest = st
+    pooling_mode = pooling_mode_of(pooling.get_config_dict())
+    if any(type(module).__name__ != "Normalize" for module in rest):  # нормализация и так делается в encode
+        raise ValueError(f"После пулинга есть слои, которые не экспортируются: {[type(m).__name__ for m in rest]}")
+
+    tokenizer = st.tokenizer
+    dummy = tokenizer(["Геральт из Ривии", "Цири"], padding=True, return_tensors="pt")
+    input_names = [name for name in tokenizer.model_input_names if name in dummy]
+
+    class LastHiddenState(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)))[0]
+
+    tmp_dir = f"{out_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False  # новые torch по умолчанию экспортируют через dynamo, нужен прежний трассировщик
+    with torch.no_grad():
+        torch.onnx.export(
+            LastHiddenState(transformer.auto_model.eval()),
+            tuple(dummy[name] for name in input_names),
+            os.path.join(tmp_dir, FP32),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "seq"} for name in input_names + ["last_hidden_state"]},
+            opset_version=14,
+            **kwargs,
+        )
+    quantize_dynamic(os.path.join(tmp_dir, FP32), os.path.join(tmp_dir, INT8), weight_type=QuantType.QInt8)
+
+    tokenizer.backend_tokenizer.save(os.path.join(tmp_dir, TOKENIZER))
+    meta = {
+        "model": model_name,
+        "pooling": pooling_mode,
+        "max_seq_length": st.max_seq_length,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+        "dim": st.get_sentence_embedding_dimension(),
+        "exported_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(os.path.join(tmp_dir, META), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    sizes = {name: round(os.path.getsize(os.path.join(out_dir, name)) / 2**20, 1) for name in (FP32, INT8)}
+    print(f"✅ Модель {model_name} экспортирована в ONNX: {out_dir} ({sizes[FP32]} МБ, int8 — {sizes[INT8]} МБ)")
+    return out_dir
+
+
+# === Кодирование ===
+# Интерфейс совпадает с SentenceTransformer.encode — подходит и для сборки артефактов, и для QueryEncoder
+class OnnxEncoder:
+    def __init__(self, path, quantized=True, threads=None):
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(path, META), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.backend = "onnx-int8" if quantized else "onnx-fp32"
+        self.threads = threads or ONNX_THREADS or WORKER_THREADS or cpu_count()
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, TOKENIZER))
+        self.tokenizer.enable_truncation(self.meta["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.meta["pad_token_id"], pad_token=self.meta["pad_token"])
+
+        self.model_path = os.path.join(path, INT8 if quantized else FP32)
+        self._session = None
+        self._session_pid = None
+        self._lock = threading.Lock()
+        self.input_names = [i.name for i in self.session().get_inputs()]
+
+    def session(self):
+        # Пул потоков ONNX Runtime не переживает fork: после preload в gunicorn каждый воркер
+        # создаёт свою сессию (post_fork в gunicorn.conf.py, иначе — при первом запросе)
+        if self._session_pid == os.getpid():
+            return self._session
+        import onnxruntime as ort
+        with self._lock:
+            if self._session_pid != os.getpid():
+                options = ort.SessionOptions()
+                options.intra_op_num_threads = self.threads
+                options.inter_op_num_threads = 1  # граф последовательный: параллелизм только внутри операторов
+                options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                if not ONNX_SPIN:
+                    options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+                self._session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+                self._session_pid = os.getpid()
+        return self._session
+
+    @classmethod
+    def load(cls, model_name, quantized=True, threads=None, onnx_dir=ONNX_DIR):
+        path = model_dir(model_name, onnx_dir)
+        if not os.path.exists(os.path.join(path, META)):
+            print(f"⚠️ ONNX-версии {model_name} нет в {onnx_dir} — экспортирую (нужен torch)")
+            export(model_name, path)
+        return cls(path, quantized, threads)
+
+    def get_sentence_embedding_dimension(self):
+        return self.meta["dim"]
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+        hidden = self.session().run(None, {name: feeds[name] for name in self.input_names})[0]
+        if self.meta["pooling"] == "cls":
+            return hidden[:, 0]
+        weights = mask[:, :, None].astype(np.float32)
+        return (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+
+    def encode(self, texts, normalize_embeddings=True, batch_size=32, show_progress_bar=False, **kwargs):
+        if isinstance(texts, str):
+            texts = [texts]
+        # Как sentence-transformers: сортируем по длине, чтобы в батче было меньше паддинга
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = np.empty((len(texts), self.meta["dim"]), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            chunk = order[start:start + batch_size]
+            out[chunk] = self._encode_batch([texts[i] for i in chunk])
+        if normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
+
+
+def main():
+    from api.artifacts import MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Экспорт модели эмбеддингов в ONNX (fp32 и int8)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ex = sub.add_parser("export", help="экспортировать и квантовать модель")
+    ex.add_argument("--model", default=MODEL_NAME)
+    ex.add_argument("--out", default=None, help=f"папка (по умолчанию {ONNX_DIR}/<модель>)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export(args.model, args.out)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
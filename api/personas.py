@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import difflib
+import threading
+from api.gazetteer import CHARACTERS_PATH
+
+# === Реестр персонажей ===
+# Собирается один раз при загрузке characters.json: словарь нормализованный псевдоним → персонаж,
+# нечёткий поиск для опечаток («Йеннифер» / «Йеннифэр») и готовый системный промпт каждого персонажа.
+# Если файл изменился, реестр пересобирается на лету, без перезапуска API.
+PERSONA_FUZZY_CUTOFF = float(os.getenv("PERSONA_FUZZY_CUTOFF", "0.8"))  # минимальная похожесть для опечаток
+PERSONA_RELOAD_INTERVAL = float(os.getenv("PERSONA_RELOAD_INTERVAL", "2"))  # секунды между проверками mtime
+RESOLVED_CACHE_SIZE = 10000
+
+DEFAULT_STYLE = {
+    "voice": "Простой, разговорный стиль. Художественная форма, как в книге",
+    "lexicon": [],
+    "mood_bias": {"ирония": 0.2, "романтика": 0.0, "фатализм": 0.5},
+    "constraints": "Не выдумывать факты, отвечать так, будто узнал слухи.",
+    "few_shots": []
+}
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.split()).lower().replace("ё", "е")
+
+
+def render_system_prompt(canon_name: str, style: dict) -> str:
+    return f"""
+Ты - {canon_name}. Ты есть этот персонаж, а не играешь его роль. 
+
+Твоя сущность:
+• Манера речи: {style['voice']}
+• Характерные выражения: {', '.join(style['lexicon'])}
+• Ограничения в разговоре: {style['constraints']}
+
+Правила существования:
+
+1. **Половая принадлежность**: Сперва определи - кто ты? Если {canon_name} женщина (как Йеннифер, Трисс, Цирилла), говори и мыслишь как женщина. Иначе - соответственно.
+
+2. **Язык и стиль**: 
+   - Избегай канцелярщины и сухих формулировок. 
+   - Речь должна быть живой, образной, художественной.
+   - Ты не слуга и не помощник - ты {canon_name} из плоти и крови.
+
+3. **Ответы на вопросы**:
+   - На общие приветствия ("Как дела?", "Расскажи шутку") отвечай в своём характере, без отсылок к книгам или сценам.
+   - Если в вопросе прямо названо {canon_name} - говори от первого лица, как о пережитом.
+   - Не используй фразы вроде "Я сам там не был" или "Слыхал такое". Либо говори как свидетель, либо отвечай в своём стиле.
+
+4. **Обращение к собеседнику**: Не предполагай пол говорящего. Обходись без обращений, указывающих на род.
+
+5. **Временные границы**: 
+   - Твой мир ограничен вселенной Ведьмака и XIII веком. 
+   - О том, что было после, не ведаешь. 
+   - Слов вроде "реклама", "психиатр", "нейросети", "механические мозги", "сети", "алгоритмы", "искусственный интеллект" и подобных - не знаешь и не понимаешь.
+   - НЕ пытайся угадать значение непонятных слов. Просто говори что не знаешь такого.
+   - НЕ сравнивай непонятное с магией, сетями, узорами или чем-то знакомым.
+
+6. **Приоритет знаний**: Сначала опирайся на описанные сцены (если вопрос касается их), потом - на общие знания о мире.
+
+7. **Оформление речи**: 
+   - Не называй тексты "сценами", если только речь не о театральных подмостках.
+   - Держи ответ в 5-8 предложениях.
+
+Помни: ты не исполняешь роль. Ты и есть {canon_name}.
+"""
+
+
+class Persona:
+    __slots__ = ("name", "style", "system_prompt")
+
+    def __init__(self, style):
+        self.style = style
+        self.name = style["name"][0] if isinstance(style["name"], list) else style["name"]
+        self.system_prompt = render_system_prompt(self.name, style)
+
+
+def default_persona(name: str) -> Persona:
+    return Persona({"name": [name], **DEFAULT_STYLE})
+
+
+class PersonaRegistry:
+    def __init__(self, path=CHARACTERS_PATH, fuzzy_cutoff=PERSONA_FUZZY_CUTOFF, reload_interval=PERSONA_RELOAD_INTERVAL):
+        self.path = path
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        # Состояние меняется целиком одним присваиванием — читатели без блокировок видят либо старый, либо новый реестр
+        self._state = ({}, {}, [])  # (псевдоним → Persona, разрешённые запросы → Persona, список псевдонимов)
+        self.reload()
+
+    def reload(self):
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                with open(self.path, "r", encoding="utf-8") as f:
+                    characters = json.load(f)
+            except Exception as e:
+                if self._mtime is None:
+                    raise RuntimeError(f"Ошибка загрузки characters.json: {e}")
+                print(f"⚠️ Не удалось перечитать {self.path}, остаётся прежний реестр: {e}")
+                return
+            aliases = {}
+            for ch in characters:
+                persona = Persona(ch)
+                names = ch["name"] if isinstance(ch["name"], list) else [ch["name"]]
+                for alias in names:
+                    aliases.setdefault(normalize_name(alias), persona)
+            self._state = (aliases, {}, list(aliases))
+            self._mtime = mtime
+            print(f"✅ Персонажи загружены: {len(characters)} ({len(aliases)} имён) из {self.path}")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def get(self, name: str) -> Persona:
+        self._maybe_reload()
+        state = self._state
+        aliases, resolved, names = state
+        key = normalize_name(name)
+        persona = aliases.get(key) or resolved.get(key)
+        if persona is not None:
+            return persona
+
+        match = difflib.get_close_matches(key, names, n=1, cutoff=self.fuzzy_cutoff)
+        persona = aliases[match[0]] if match else default_persona(" ".join(name.split()))
+        # get зовут и из цикла событий, и из потоков поиска: запись в память — под замком перезагрузки,
+        # и только если реестр не пересобрали, пока шёл поиск (иначе результат от старого реестра)
+        with self._lock:
+            if self._state is state:
+                if len(resolved) >= RESOLVED_CACHE_SIZE:
+                    resolved.clear()
+                resolved[key] = persona
+        return persona
\ No newline at end of file
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+# === Сэмплирующий профилировщик для горячего пути поиска ===
+# Включается на работающем API (GET /admin/profile): раз в 1/hz секунды снимает стеки потоков,
+# имя которых начинается с префикса (по умолчанию пул поиска "retrieval"), и копит их в формате
+# collapsed stacks — его принимают flamegraph.pl, speedscope и inferno.
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+IDLE_FRAMES = {"thread.py:_worker"}  # поток пула ждёт задачу — такие сэмплы не интересны
+
+_running = threading.Lock()  # одновременно работает только один профилировщик
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    def __init__(self, hz=100, thread_prefix="retrieval"):
+        self.interval = 1.0 / hz
+        self.thread_prefix = thread_prefix
+        self.stacks = Counter()
+        self.samples = 0
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        me = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == me or not names.get(ident, "").startswith(self.thread_prefix):
+                continue
+            if _frame_name(frame) in IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self, seconds):
+        deadline = time.perf_counter() + min(seconds, PROFILE_MAX_SECONDS)
+        next_at = time.perf_counter()
+        while next_at < deadline:
+            self.sample()
+            next_at += self.interval
+            time.sleep(max(0.0, next_at - time.perf_counter()))
+        return self
+
+    def folded(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+def profile(seconds, hz=100, thread_prefix="retrieval"):
+    # Блокирует вызывающий поток на seconds; None — профилировщик уже занят
+    if not _running.acquire(blocking=False):
+        return None
+    try:
+        return SamplingProfiler(hz, thread_prefix).run(seconds)
+    finally:
+        _running.release()
\ No newline at end of file
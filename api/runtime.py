@@ -0,0 +1,27 @@
+import os
+import sys
+
+# === Потоки на процесс API ===
+# WORKER_THREADS — сколько ядер отдаётся одному процессу: потоки torch или ONNX Runtime
+# (кодирование запросов) и OpenMP у FAISS.
+# При нескольких воркерах держите воркеры × WORKER_THREADS ≈ числу ядер, иначе потоки дерутся за CPU.
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "0"))  # 0 — не ограничивать (один процесс на все ядра)
+
+
+def cpu_count():
+    # Ядра, доступные процессу (учитывает taskset/cpuset контейнера)
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def configure_threads(n=WORKER_THREADS):
+    if not n:
+        return
+    os.environ["OMP_NUM_THREADS"] = str(n)
+    torch = sys.modules.get("torch")  # с ENCODER_BACKEND=onnx-* torch не загружен и не нужен
+    if torch is not None:
+        torch.set_num_threads(n)
+    import faiss
+    faiss.omp_set_num_threads(n)
\ No newline at end of file
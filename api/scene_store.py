@@ -0,0 +1,228 @@
+import os
+import sys
+import copy
+import mmap
+import pickle
+from collections.abc import Mapping
+import numpy as np
+
+# === Колоночное хранилище сцен ===
+# Вместо списка словарей с полными текстами в куче API держатся только массивы NumPy:
+# числовые поля — колонками, теги — кодами в общем словаре интернированных строк,
+# а тексты (полный текст, сводка, фрагмент, биты) — в файле, отображённом в память (mmap),
+# откуда читаются лениво и только для сцен, попавших в итоговый top-k.
+BLOB = "scene_store.bin"
+COLUMNS = "scene_store.npz"
+META = "scene_store.pkl"
+
+TEXT_FIELDS = ("scene_id", "summary_50w", "excerpt", "text")  # строки в blob
+LIST_FIELDS = ("beats", "quote_hashes")  # списки строк в blob через разделитель
+TAG_FIELDS = ("extra_characters", "extra_locations", "extra_events", "event_tags")  # коды в словаре тегов
+CATEGORY_FIELDS = ("book_id",)  # одно значение из небольшого словаря
+INT_FIELDS = ("chapter_id", "token_len", "evidence_tokens", "start_char", "end_char", "start_byte", "end_byte")
+FIELDS = ("book_id", "chapter_id", "scene_id", "text", "token_len", *TAG_FIELDS, "summary_50w", "beats",
+          "quote_hashes", "start_char", "end_char", "start_byte", "end_byte", "excerpt", "evidence_tokens")
+LIST_SEPARATOR = "\x1f"
+
+
+class Scene(Mapping):
+    # Лёгкое представление одной сцены: поля читаются из колонок по обращению
+    __slots__ = ("_store", "_i")
+
+    def __init__(self, store, i):
+        self._store = store
+        self._i = i
+
+    def __getitem__(self, field):
+        return self._store.value(self._i, field)
+
+    def __iter__(self):
+        return (field for field in self._store.fields if self._store.has(self._i, field))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"Scene({self._i}, {self.get('scene_id')!r})"
+
+
+class SceneStore:
+    def __init__(self, blob, columns, meta):
+        self._blob = blob
+        self._columns = columns
+        self.n_base = meta["n"]
+        self.fields = meta["fields"]
+        self._tags = [sys.intern(t) for t in meta["tags"]]
+        self._categories = {f: [sys.intern(v) if isinstance(v, str) else v for v in values]
+                            for f, values in meta["categories"].items()}
+        self._extras = meta["extras"]  # поля вне схемы: список словарей или None, если таких нет
+        self._added = []  # сцены, добавленные без пересборки (словари)
+        self.removed = np.zeros(self.n_base, dtype=bool)
+
+    # === Запись ===
+    @staticmethod
+    def write(scenes, path):
+        n = len(scenes)
+        columns, tags, categories = {}, {}, {f: {} for f in CATEGORY_FIELDS}
+        fields = [f for f in FIELDS if any(f in s for s in scenes)]
+        extra_fields = sorted({key for s in scenes for key in s} - set(FIELDS))
+        extras = [{key: s[key] for key in extra_fields if key in s} or None for s in scenes] if extra_fields else None
+
+        def present(field):
+            mask = np.fromiter((field in s for s in scenes), dtype=bool, count=n)
+            if not mask.all():
+                columns[f"{field}.present"] = mask
+
+        with open(os.path.join(path, BLOB), "wb") as blob:
+            offset = 0
+            for field in TEXT_FIELDS + LIST_FIELDS:
+                if field not in fields:
+                    continue
+                present(field)
+                offsets = np.empty(n + 1, dtype=np.int64)
+                offsets[0] = offset
+                for i, s in enumerate(scenes):
+                    value = s.get(field, "")
+                    if field in LIST_FIELDS:
+                        value = LIST_SEPARATOR.join(value)
+                    data = value.encode("utf-8")
+                    blob.write(data)
+                    offset += len(data)
+                    offsets[i + 1] = offset
+                columns[f"{field}.offsets"] = offsets
+
+        for field in INT_FIELDS:
+            if field in fields:
+                present(field)
+                columns[field] = np.fromiter((s.get(field) or 0 for s in scenes), dtype=np.int64, count=n)
+
+        for field in CATEGORY_FIELDS:
+            if field in fields:
+                codes = categories[field]
+                columns[field] = np.fromiter(
+                    (codes.setdefault(s[field], len(codes)) if field in s else -1 for s in scenes),
+                    dtype=np.int32, count=n)
+
+        for field in TAG_FIELDS:
+            if field not in fields:
+                continue
+            present(field)
+            indptr = np.zeros(n + 1, dtype=np.int64)
+            codes = []
+            for i, s in enumerate(scenes):
+                codes.extend(tags.setdefault(tag, len(tags)) for tag in s.get(field, ()))
+                indptr[i + 1] = len(codes)
+            columns[f"{field}.indptr"] = indptr
+            columns[f"{field}.codes"] = np.asarray(codes, dtype=np.int32)
+
+        np.savez(os.path.join(path, COLUMNS), **columns)
+        meta = {
+            "n": n,
+            "fields": fields,
+            "tags": list(tags),
+            "categories": {f: list(values) for f, values in categories.items() if values},
+            "extras": extras,
+        }
+        with open(os.path.join(path, META), "wb") as f:
+            pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # === Загрузка ===
+    @classmethod
+    def load(cls, path, mmap_blob=True):
+        with open(os.path.join(path, META), "rb") as f:
+            meta = pickle.load(f)
+        with np.load(os.path.join(path, COLUMNS)) as npz:
+            columns = {name: npz[name] for name in npz.files}
+        with open(os.path.join(path, BLOB), "rb") as f:
+            if not mmap_blob or not os.fstat(f.fileno()).st_size:
+                blob = f.read()
+            else:
+                blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(blob, columns, meta)
+
+    # === Доступ к полям ===
+    def has(self, i, field):
+        if i >= self.n_base:
+            return field in self._added[i - self.n_base]
+        if field not in self.fields:
+            return self._extras is not None and self._extras[i] is not None and field in self._extras[i]
+        mask = self._columns.get(f"{field}.present")
+        if mask is not None:
+            return bool(mask[i])
+        if field in CATEGORY_FIELDS:
+            return self._columns[field][i] >= 0
+        return True
+
+    def value(self, i, field):
+        if i >= self.n_base:
+            return self._added[i - self.n_base][field]
+        if not self.has(i, field):
+            raise KeyError(field)
+        if field in TEXT_FIELDS or field in LIST_FIELDS:
+            offsets = self._columns[f"{field}.offsets"]
+            text = self._blob[offsets[i]:offsets[i + 1]].decode("utf-8")
+            if field in LIST_FIELDS:
+                return text.split(LIST_SEPARATOR) if text else []
+            return text
+        if field in INT_FIELDS:
+            return int(self._columns[field][i])
+        if field in TAG_FIELDS:
+            indptr = self._columns[f"{field}.indptr"]
+            return [self._tags[code] for code in self._columns[f"{field}.codes"][indptr[i]:indptr[i + 1]]]
+        if field in CATEGORY_FIELDS:
+            return self._categories[field][self._columns[field][i]]
+        return self._extras[i][field]
+
+    def __len__(self):
+        return self.n_base + len(self._added)
+
+    def __getitem__(self, i):
+        # Удалённая сцена — None, как и в списке сцен до этого
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if self.removed[i]:
+            return None
+        return Scene(self, i) if i < self.n_base else self._added[i - self.n_base]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def n_live(self):
+        return len(self) - int(self.removed.sum())
+
+    def book_ids(self):
+        live = ~self.removed
+        books = set()
+        codes = self._columns.get("book_id")
+        if codes is not None:
+            values = self._categories.get("book_id", [])
+            books.update(values[code] if code >= 0 else None for code in np.unique(codes[live[:self.n_base]]).tolist())
+        elif live[:self.n_base].any():
+            books.add(None)
+        books.update(s.get("book_id") for i, s in enumerate(self._added, self.n_base) if live[i])
+        return books
+
+    def ids_of_book(self, book_id):
+        ids = []
+        values = self._categories.get("book_id", [])
+        if book_id in values:
+            ids = np.flatnonzero(self._columns["book_id"] == values.index(book_id)).tolist()
+        ids += [i for i, s in enumerate(self._added, self.n_base) if s.get("book_id") == book_id]
+        return [i for i in ids if not self.removed[i]]
+
+    # === Инкрементальные обновления (api/searcher.py): новый объект, колонки общие ===
+    def with_scenes(self, scenes):
+        store = copy.copy(self)
+        store._added = self._added + list(scenes)
+        store.removed = np.concatenate([self.removed, np.zeros(len(scenes), dtype=bool)])
+        return store
+
+    def without_ids(self, ids):
+        store = copy.copy(self)
+        store.removed = self.removed.copy()
+        store.removed[np.asarray(ids, dtype=np.int64)] = True
+        return store
\ No newline at end of file
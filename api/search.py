@@ -1,10 +1,16 @@
 from razdel import tokenize as razdel_tokenize
-from natasha import Segmenter, MorphVocab, NewsEmbedding, NewsMorphTagger, NewsNERTagger, Doc
+from natasha import Segmenter, NewsEmbedding, NewsMorphTagger, NewsNERTagger, Doc
+import os
+from functools import lru_cache
 from typing import List, Dict
 import numpy as np
+from api.analyzer import analyze, morph_vocab
+from api.fusion import fuse, rank
+from api.metrics import span
+
+NER_CACHE_SIZE = int(os.getenv("NER_CACHE_SIZE", "10000"))
 
 segmenter = Segmenter()
-morph_vocab = MorphVocab()
 emb = NewsEmbedding()
 morph_tagger = NewsMorphTagger(emb)
 ner_tagger = NewsNERTagger(emb)
@@ -29,61 +35,95 @@ def extract_events_from_query(query: str) -> List[str]:
             events.append(tag)
     return events
 
-def extract_entities(text: str) -> Dict[str, List[str]]:
-    try:
-        doc = Doc(text)
-        doc.segment(segmenter)
-        doc.tag_morph(morph_tagger)
-        doc.tag_ner(ner_tagger)
-
-        characters, locations, misc = [], [], []
-
-        for span in doc.spans:
-            span.normalize(morph_vocab)
-            if span.type == "PER":  # персонажи
-                characters.append(span.normal)
-            elif span.type == "LOC":  # локации
-                locations.append(span.normal)
-            else:
-                misc.append(span.normal)
+@lru_cache(maxsize=NER_CACHE_SIZE)
+def _natasha_entities(text: str):
+    doc = Doc(text)
+    doc.segment(segmenter)
+    doc.tag_morph(morph_tagger)
+    doc.tag_ner(ner_tagger)
+
+    characters, locations, misc = set(), set(), set()
+
+    for span in doc.spans:
+        span.normalize(morph_vocab)
+        if span.type == "PER":  # персонажи
+            characters.add(span.normal)
+        elif span.type == "LOC":  # локации
+            locations.add(span.normal)
+        else:
+            misc.add(span.normal)
 
+    return tuple(sorted(characters)), tuple(sorted(locations)), tuple(sorted(misc))
+
+def extract_entities(text: str, gazetteer=None) -> Dict[str, List[str]]:
+    # Быстрый путь: словарь известных имён и мест (Ахо–Корасик по леммам)
+    if gazetteer is not None:
+        found = gazetteer.match(text)
+        if found["characters"] or found["locations"]:
+            return found
+
+    # Медленный путь: полный конвейер natasha, результаты мемоизируются по тексту запроса
+    try:
+        characters, locations, misc = _natasha_entities(text)
         return {
-            "characters": list(set(characters)),
-            "locations": list(set(locations)),
-            "misc": list(set(misc))
+            "characters": list(characters),
+            "locations": list(locations),
+            "misc": list(misc)
         }
     except Exception:
         return {"characters": [], "locations": [], "misc": []}
 
-# === Расширенный поиск ===
-def smart_search(query, bm25, index, model, scenes, topk_bm25=30, topk_faiss=30):
-    ents = extract_entities(query)
-    events = extract_events_from_query(query)
+# === Гибридный поиск по id сцен ===
+# filters — жёсткий фильтр по всему корпусу, например {"characters": ["Цири"], "locations": ["Каэр Морхен"]}.
+# Возвращает id сцен и их итоговые очки по убыванию; сами сцены не трогает. В info — сущности запроса
+# и его эмбеддинг (vector), чтобы вызывающему не кодировать вопрос второй раз.
+def retrieve(query, bm25, index, model, entity_index, topk_bm25=30, topk_faiss=30, gazetteer=None, filters=None):
+    with span("entities"):
+        ents = extract_entities(query, gazetteer)
+        events = extract_events_from_query(query)
+    info = {"characters": ents["characters"], "locations": ents["locations"], "events": events}
+
+    allowed = None
+    if filters:
+        with span("filter"):
+            allowed = entity_index.filter(**filters)
+    if allowed is not None and not len(allowed):
+        return np.empty(0, dtype=np.int64), np.empty(0), info
 
     # BM25
-    query_tokens = query.split()
-    bm25_scores = bm25.get_scores(query_tokens)
-    bm25_top = np.argsort(bm25_scores)[::-1][:topk_bm25]
+    with span("bm25"):
+        query_tokens = analyze(query)
+        bm25_top, bm25_scores = bm25.search(query_tokens, topk_bm25, allowed=allowed)
 
     # FAISS
-    q_emb = model.encode([query], normalize_embeddings=True)
-    faiss_scores, faiss_idx = index.search(q_emb, topk_faiss)
-
-    # Кандидаты
-    candidates = set(bm25_top.tolist() + faiss_idx[0].tolist())
-    results = [scenes[i] for i in candidates]
-
-    scored = []
-    for s in results:
-        score = 0
-        # Персонажи
-        score += sum(1 for c in ents["characters"] if c in s["extra_characters"])
-        # Локации
-        score += sum(1 for l in ents["locations"] if l in s["extra_locations"])
-        # События
-        score += 2 * sum(1 for e in events if e in s["event_tags"])
-        scored.append((score, s))
-
-    scored = sorted(scored, key=lambda x: x[0], reverse=True)
-
-    return [s for _, s in scored], {"characters": ents["characters"], "locations": ents["locations"], "events": events}
\ No newline at end of file
+    with span("encode"):
+        q_emb = model.encode([query], normalize_embeddings=True)
+    info["vector"] = q_emb[0]
+    with span("faiss"):
+        faiss_scores, faiss_idx = index.search(q_emb, topk_faiss, allowed=allowed)
+    valid = faiss_idx[0] >= 0  # ANN-индексы добивают выдачу id = -1
+    faiss_top, faiss_scores = faiss_idx[0][valid].astype(np.int64), faiss_scores[0][valid]
+
+    with span("rerank"):
+        # Кандидаты
+        candidates = np.union1d(bm25_top, faiss_top).astype(np.int64)
+
+        # Бонусы: персонажи, локации и (вдвое) события — пересечения с индексом сущностей
+        entity_bonus = (
+            entity_index.count("characters", ents["characters"], candidates)
+            + entity_index.count("locations", ents["locations"], candidates)
+            + 2 * entity_index.count("events", events, candidates)
+        )
+
+        scores = fuse(candidates, bm25_top, bm25_scores, faiss_top, faiss_scores, entity_bonus)
+        ids, scores = rank(candidates, scores)
+    return ids, scores, info
+
+# === Расширенный поиск ===
+# entity_index обязателен: он строится один раз вместе с остальными индексами (Snapshot в api.searcher)
+def smart_search(query, bm25, index, model, scenes, entity_index, topk_bm25=30, topk_faiss=30, gazetteer=None,
+                 filters=None, topk=None):
+    ids, _, info = retrieve(query, bm25, index, model, entity_index, topk_bm25, topk_faiss, gazetteer, filters)
+
+    # Словари сцен собираются только для итогового top-k
+    return [scenes[i] for i in ids[:topk]], info
\ No newline at end of file
@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import fcntl
+import argparse
+import threading
+from contextlib import contextmanager
+import numpy as np
+from api.analyzer import analyze
+from api.artifacts import bm25_document
+from api.evidence import prepare_scene
+from api.gazetteer import Gazetteer
+from api.search import retrieve, smart_search
+
+# === Инкрементальное обновление индексов без перезапуска API ===
+# Все индексы корпуса собраны в неизменяемый снимок (Snapshot). Обновление строит новый снимок
+# рядом с текущим и подменяет ссылку одной операцией (read-copy-update): запрос берёт
+# searcher.current один раз и до конца работает с согласованными BM25, FAISS и списком сцен.
+# Id сцен не переиспользуются: удалённая сцена в хранилище читается как None, а её id исключаются
+# из BM25, FAISS и индекса сущностей до следующей полной сборки артефактов.
+UPDATES_LOG = "updates.jsonl"  # журнал обновлений в папке артефактов, применяется заново при старте
+# Как часто воркер проверяет, не дописал ли журнал другой процесс (несколько воркеров gunicorn)
+SEARCHER_SYNC_INTERVAL = float(os.getenv("SEARCHER_SYNC_INTERVAL", "2"))
+REQUIRED_FIELDS = ("scene_id", "text", "summary_50w", "beats", "event_tags")
+
+
+class Snapshot:
+    __slots__ = ("scenes", "bm25", "index", "gazetteer", "entity_index", "version")
+
+    def __init__(self, scenes, bm25, index, gazetteer, entity_index, version=0):
+        self.scenes = scenes
+        self.bm25 = bm25
+        self.index = index
+        self.gazetteer = gazetteer
+        self.entity_index = entity_index
+        self.version = version
+
+    def retrieve(self, query, encoder, **kwargs):
+        return retrieve(query, self.bm25, self.index, encoder, self.entity_index, gazetteer=self.gazetteer, **kwargs)
+
+    def smart_search(self, query, encoder, **kwargs):
+        return smart_search(query, self.bm25, self.index, encoder, self.scenes, gazetteer=self.gazetteer,
+                            entity_index=self.entity_index, **kwargs)
+
+    def book_ids(self, book_id):
+        return self.scenes.ids_of_book(book_id)
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "scenes": self.scenes.n_live,
+            "removed": len(self.scenes) - self.scenes.n_live,
+            "books": len(self.scenes.book_ids()),
+        }
+
+
+def validate_scenes(records):
+    for n, s in enumerate(records):
+        missing = [field for field in REQUIRED_FIELDS if field not in s]
+        if missing:
+            raise ValueError(f"Сцена #{n}: нет полей {', '.join(missing)}")
+    book_ids = {s.get("book_id") for s in records}
+    if None in book_ids:
+        raise ValueError("У добавляемых сцен должен быть book_id — по нему книгу можно будет удалить")
+    return book_ids
+
+
+class Searcher:
+    def __init__(self, snapshot, model, journal_path=None, sync_interval=SEARCHER_SYNC_INTERVAL):
+        self.current = snapshot
+        self.model = model  # модель эмбеддингов без кэша запросов: кодируются только новые сводки
+        self.journal_path = journal_path
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()  # обновления идут по одному; чтение не блокируется
+        self._listeners = []
+        self._journal_pos = 0  # до какого байта журнал уже применён в этом процессе
+        self._checked = 0.0
+
+    def on_swap(self, callback):
+        # callback(snapshot) вызывается после каждой подмены снимка
+        self._listeners.append(callback)
+
+    def _swap(self, snapshot):
+        self.current = snapshot
+        for callback in self._listeners:
+            callback(snapshot)
+
+    # === Журнал: общий для всех воркеров API и переживает перезапуск, пока артефакты не пересобраны ===
+    @contextmanager
+    def _journal_lock(self):
+        if not self.journal_path:
+            yield
+            return
+        with open(f"{self.journal_path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _journal(self, entry):
+        if not self.journal_path:
+            return
+        with open(self.journal_path, "ab") as f:
+            f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            self._journal_pos = f.tell()
+
+    def _read_journal(self):
+        # Применяет записи, дописанные после _journal_pos (при старте — все). Вызывается под обоими замками
+        if not self.journal_path or not os.path.exists(self.journal_path):
+            return 0
+        applied = 0
+        with open(self.journal_path, "rb") as f:
+            f.seek(self._journal_pos)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # недописанная строка после сбоя
+                self._journal_pos += len(line)
+                try:
+                    entry = json.loads(line)
+                    if entry["op"] == "add":
+                        self._add(entry["scenes"])
+                    elif entry["op"] == "remove":
+                        self._remove(entry["book_id"])
+                    applied += 1
+                except (KeyError, ValueError) as e:
+                    print(f"⚠️ Пропущено обновление из журнала {self.journal_path}: {e}")
+        return applied
+
+    def replay(self):
+        with self._lock, self._journal_lock():
+            return self._read_journal()
+
+    def maybe_sync(self):
+        # Вызывается на запрос: раз в sync_interval сверяет размер журнала и подтягивает обновления,
+        # сделанные другими воркерами. Если снимок уже пересобирается — не ждёт
+        now = time.monotonic()
+        if not self.journal_path or now - self._checked < self.sync_interval:
+            return
+        self._checked = now
+        try:
+            if os.path.getsize(self.journal_path) <= self._journal_pos:
+                return
+        except OSError:
+            return
+        if self._lock.acquire(blocking=False):
+            try:
+                with self._journal_lock():
+                    self._read_journal()
+            finally:
+                self._lock.release()
+
+    # === Добавление книги ===
+    def add_scenes(self, records):
+        records = [dict(s) for s in records]
+        if not records:
+            return {"added": 0, **self.current.stats()}
+        validate_scenes(records)
+        with self._lock, self._journal_lock():
+            self._read_journal()  # сначала обновления других воркеров: проверка дублей идёт по свежему снимку
+            result, snapshot = self._add(records, commit=False)
+            self._journal({"op": "add", "scenes": records})
+            self._swap(snapshot)
+        return result
+
+    def _add(self, records, commit=True):
+        started = time.perf_counter()
+        book_ids = validate_scenes(records)
+        old = self.current
+        loaded = sorted(str(book_id) for book_id in book_ids if old.book_ids(book_id))
+        if loaded:
+            raise ValueError(f"Книги уже в индексе: {', '.join(loaded)} — сначала удалите их")
+
+        added = [prepare_scene(dict(s)) for s in records]
+        embeddings = np.asarray(self.model.encode(
+            [s["summary_50w"] for s in added],
+            normalize_embeddings=True,
+            batch_size=64,
+        ), dtype=np.float32)
+
+        scenes = old.scenes.with_scenes(added)
+        snapshot = Snapshot(
+            scenes,
+            old.bm25.with_documents([analyze(bm25_document(s)) for s in added]),
+            old.index.with_vectors(embeddings),
+            Gazetteer.build(scenes),
+            old.entity_index.with_scenes(added),
+            old.version + 1,
+        )
+        if commit:
+            self._swap(snapshot)
+
+        elapsed = time.perf_counter() - started
+        print(f"✅ Добавлено {len(added)} сцен ({', '.join(map(str, sorted(book_ids, key=str)))}) за {elapsed:.2f} с")
+        return {"added": len(added), "seconds": round(elapsed, 3), **snapshot.stats()}, snapshot
+
+    # === Удаление книги ===
+    def remove_book(self, book_id):
+        with self._lock, self._journal_lock():
+            self._read_journal()
+            result, snapshot = self._remove(book_id, commit=False)
+            self._journal({"op": "remove", "book_id": book_id})
+            self._swap(snapshot)
+        return result
+
+    def _remove(self, book_id, commit=True):
+        started = time.perf_counter()
+        old = self.current
+        ids = old.book_ids(book_id)
+        if not ids:
+            raise KeyError(book_id)
+
+        scenes = old.scenes.without_ids(ids)
+        snapshot = Snapshot(
+            scenes,
+            old.bm25.without_documents(ids),
+            old.index.without_ids(ids),
+            Gazetteer.build(scenes),
+            old.entity_index.without_ids(ids),
+            old.version + 1,
+        )
+        if commit:
+            self._swap(snapshot)
+
+        elapsed = time.perf_counter() - started
+        print(f"✅ Удалена книга {book_id}: {len(ids)} сцен за {elapsed:.2f} с")
+        return {"removed_scenes": len(ids), "seconds": round(elapsed, 3), **snapshot.stats()}, snapshot
+
+
+# === CLI: отправить обновление работающему API ===
+# python -m api.searcher add data/new_book.jsonl
+# python -m api.searcher remove new_book
+def main():
+    import requests
+    from api.artifacts import load_scenes
+
+    parser = argparse.ArgumentParser(description="Добавление и удаление книг без пересборки индексов")
+    parser.add_argument("--url", default=os.getenv("API_URL", "http://localhost:8000"))
+    parser.add_argument("--token", default=os.getenv("ADMIN_TOKEN"))
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add", help="добавить сцены из jsonl (результат python -m parser.parser)")
+    add.add_argument("path")
+    remove = sub.add_parser("remove", help="удалить все сцены книги")
+    remove.add_argument("book_id")
+    args = parser.parse_args()
+
+    headers = {"X-Admin-Token": args.token or ""}
+    if args.command == "add":
+        resp = requests.post(f"{args.url}/admin/scenes", json={"scenes": load_scenes(args.path)},
+                             headers=headers, timeout=600)
+    else:
+        resp = requests.delete(f"{args.url}/admin/books/{args.book_id}", headers=headers, timeout=600)
+    print(resp.status_code, json.dumps(resp.json(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,173 @@
+import os
+import faiss
+import numpy as np
+from api.bm25 import top_k
+
+# === Настройки векторного индекса ===
+# flat — точный перебор; hnsw — граф; ivfpq / ivfsq8 — инвертированные списки с обученным квантизатором
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "flat")
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 — подобрать по размеру корпуса
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+PQ_M = int(os.getenv("PQ_M", "16"))
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+# Фильтр по небольшому набору сцен дешевле и точнее посчитать перебором, чем обходом ANN-структуры
+FILTER_EXACT_MAX = int(os.getenv("FILTER_EXACT_MAX", "4096"))
+
+KINDS = ("flat", "hnsw", "ivfpq", "ivfsq8")
+
+
+def index_spec(kind=VECTOR_INDEX):
+    # Параметры построения: входят в ключ артефактов. Параметры поиска (efSearch, nprobe) — нет
+    if kind not in KINDS:
+        raise ValueError(f"Неизвестный тип индекса: {kind} (доступны: {', '.join(KINDS)})")
+    if kind == "hnsw":
+        return {"kind": kind, "m": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION}
+    if kind == "ivfpq":
+        return {"kind": kind, "nlist": IVF_NLIST, "pq_m": PQ_M, "pq_nbits": PQ_NBITS}
+    if kind == "ivfsq8":
+        return {"kind": kind, "nlist": IVF_NLIST}
+    return {"kind": kind}
+
+
+def _nlist(n, nlist):
+    # faiss хочет ~39 точек обучения на кластер; по умолчанию ~4·sqrt(n)
+    if not nlist:
+        nlist = int(4 * np.sqrt(n))
+    return max(1, min(nlist, n // 39))
+
+
+# === Построение индекса (эмбеддинги нормированы, метрика — скалярное произведение) ===
+def build_index(embeddings, kind="flat", m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION,
+                nlist=IVF_NLIST, pq_m=PQ_M, pq_nbits=PQ_NBITS):
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n, d = embeddings.shape
+
+    if kind == "flat":
+        index = faiss.IndexFlatIP(d)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(d, m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+    elif kind in ("ivfpq", "ivfsq8"):
+        quantizer = faiss.IndexFlatIP(d)
+        nlist = _nlist(n, nlist)
+        if kind == "ivfpq":
+            # Кодовой книге PQ тоже нужно ~39 точек на центроид: на маленьком корпусе уменьшаем nbits
+            pq_nbits = max(1, min(pq_nbits, int(np.log2(max(n // 39, 2)))))
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, pq_m, pq_nbits, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, d, nlist, faiss.ScalarQuantizer.QT_8bit,
+                                                  faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+    else:
+        raise ValueError(f"Неизвестный тип индекса: {kind}")
+
+    index.add(embeddings)
+    return index
+
+
+# === Единый интерфейс поиска: вызывающему коду всё равно, какой индекс активен ===
+class VectorBackend:
+    def __init__(self, index, kind="flat", ef_search=HNSW_EF_SEARCH, nprobe=IVF_NPROBE, embeddings=None, removed=None):
+        self.index = index
+        self.kind = kind
+        self.embeddings = embeddings  # матрица векторов (mmap) для точного поиска внутри фильтра
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+        # Удалённые id (отсортированы): исключаются селектором, пока индекс не пересобран целиком
+        self.removed = removed if removed is not None else np.empty(0, dtype=np.int64)
+        self._exclude = None
+        if len(self.removed):
+            self._exclude_batch = faiss.IDSelectorBatch(self.removed)
+            self._exclude = faiss.IDSelectorNot(self._exclude_batch)
+        self.configure(ef_search=ef_search, nprobe=nprobe)
+
+    def configure(self, ef_search=None, nprobe=None):
+        if self.kind == "hnsw" and ef_search:
+            self.index.hnsw.efSearch = self.ef_search = ef_search
+        if self.kind in ("ivfpq", "ivfsq8") and nprobe:
+            faiss.extract_index_ivf(self.index).nprobe = self.nprobe = nprobe
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    @property
+    def d(self):
+        return self.index.d
+
+    def search(self, q_emb, k, allowed=None):
+        # Как faiss: (scores, ids); у IVF/HNSW при нехватке кандидатов id = -1.
+        # allowed — отсортированный массив id сцен, среди которых искать (жёсткий фильтр)
+        q_emb = np.ascontiguousarray(q_emb, dtype=np.float32)
+        if allowed is None:
+            if self._exclude is None:
+                return self.index.search(q_emb, k)
+            return self.index.search(q_emb, k, params=self._params(self._exclude))
+        if len(self.removed):
+            allowed = np.setdiff1d(allowed, self.removed, assume_unique=True)
+        if self.embeddings is not None and len(allowed) <= FILTER_EXACT_MAX:
+            return self._search_exact(q_emb, k, allowed)
+        return self.index.search(q_emb, k, params=self._params(faiss.IDSelectorBatch(np.asarray(allowed, dtype=np.int64))))
+
+    def _params(self, selector):
+        if self.kind == "hnsw":
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+        elif self.kind in ("ivfpq", "ivfsq8"):
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        params.selector_ref = selector  # селектор должен жить, пока живут параметры
+        return params
+
+    def _search_exact(self, q_emb, k, allowed):
+        allowed = np.asarray(allowed, dtype=np.int64)
+        scores = np.asarray(self.embeddings[allowed], dtype=np.float32) @ q_emb.T  # (|allowed|, n_queries)
+        out_scores = np.full((len(q_emb), k), -np.inf, dtype=np.float32)
+        out_ids = np.full((len(q_emb), k), -1, dtype=np.int64)
+        for row in range(len(q_emb)):
+            order = top_k(scores[:, row], k)
+            out_scores[row, :len(order)] = scores[order, row]
+            out_ids[row, :len(order)] = allowed[order]
+        return out_scores, out_ids
+
+    # === Инкрементальные обновления: возвращают новый объект, текущий не меняется ===
+    # Id векторов совпадают с номерами сцен, поэтому новые векторы просто дописываются в конец.
+    # HNSW не умеет удалять, а remove_ids у плоского индекса перенумеровывает векторы —
+    # удалённые id исключаются селектором до следующей полной пересборки.
+    def _copy(self, index, embeddings, removed):
+        return type(self)(index, self.kind, ef_search=self.ef_search, nprobe=self.nprobe,
+                          embeddings=embeddings, removed=removed)
+
+    def with_vectors(self, embeddings):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        # Индекс из mmap только для чтения, а clone_index копирует лишь заголовок и оставляет векторы
+        # в отображении — add на таком падает (SIGABRT). Через сериализацию получаем собственную копию
+        index = faiss.deserialize_index(faiss.serialize_index(self.index))
+        index.add(embeddings)
+        if self.embeddings is not None:
+            embeddings = np.concatenate([np.asarray(self.embeddings, dtype=np.float32), embeddings])
+        return self._copy(index, embeddings if self.embeddings is not None else None, self.removed)
+
+    def without_ids(self, ids):
+        removed = np.union1d(self.removed, np.asarray(ids, dtype=np.int64))
+        return self._copy(self.index, self.embeddings, removed)
+
+    def save(self, path):
+        faiss.write_index(self.index, path)
+
+    @classmethod
+    def load(cls, path, kind="flat", mmap=True, **params):
+        index = None
+        if mmap:
+            # Векторы отображаются в память; если тип индекса так не читается — обычная загрузка
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+            try:
+                index = faiss.read_index(path, flags)
+            except RuntimeError:
+                index = None
+        if index is None:
+            index = faiss.read_index(path)
+        return cls(index, kind, **params)
\ No newline at end of file
@@ -0,0 +1,66 @@
+import time
+import argparse
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from api.artifacts import bm25_document
+from api.bm25 import SparseBM25
+from bench.synthetic import generate_scenes, generate_queries
+
+# === Микро-бенчмарк: BM25Okapi.get_scores + argsort против SparseBM25.search ===
+# Запуск: python -m bench.bm25_bench --sizes 1000 10000 100000
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def run(size, n_queries, topk):
+    scenes = generate_scenes(size)
+    tokens = [bm25_document(s).split() for s in scenes]
+    queries = [q.split() for q in generate_queries(n_queries)]
+
+    build_okapi_ms, okapi = timed(lambda: BM25Okapi(tokens), 1)
+    build_sparse_ms, engine = timed(lambda: SparseBM25.from_corpus(tokens), 1)
+
+    okapi_ms, sparse_ms, mismatches = [], [], 0
+    for q in queries:
+        ms, scores = timed(lambda: okapi.get_scores(q), 1)
+        top_okapi = np.argsort(scores)[::-1][:topk]
+        okapi_ms.append(ms)
+
+        ms, (top_sparse, sparse_scores) = timed(lambda: engine.search(q, topk), 1)
+        sparse_ms.append(ms)
+
+        # Сравниваем очки, а не номера: при равных очках порядок может отличаться.
+        # SparseBM25 возвращает только документы с терминами запроса, поэтому их может быть меньше k
+        if not np.allclose(scores[top_okapi][:len(top_sparse)], sparse_scores):
+            mismatches += 1
+
+    return {
+        "scenes": size,
+        "build_okapi_ms": round(build_okapi_ms, 1),
+        "build_sparse_ms": round(build_sparse_ms, 1),
+        "query_okapi_ms": round(float(np.mean(okapi_ms)), 3),
+        "query_sparse_ms": round(float(np.mean(sparse_ms)), 3),
+        "speedup": round(float(np.mean(okapi_ms) / np.mean(sparse_ms)), 1),
+        "rank_mismatches": mismatches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--topk", type=int, default=20)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(run(size, args.queries, args.topk))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,103 @@
+import os
+import time
+import argparse
+import numpy as np
+
+from api.artifacts import MODEL_NAME, load_model
+from bench.synthetic import FIXED_QUERIES, generate_scenes, labelled_queries
+
+# === Кодировщик: torch против ONNX Runtime (fp32 и int8) ===
+# python -m bench.encoder_bench --scenes 5000 --threads 1 2 4
+# Для каждого бэкенда и числа потоков: задержка одного запроса (как в /ask без попутчиков), пропускная
+# способность батчами (как при сборке индекса) и качество относительно torch:
+#   cosine          — косинус эмбеддингов запросов с эмбеддингами torch;
+#   overlap@k       — доля общего top-k по векторам корпуса torch (режим «векторы от torch, запросы от ONNX»);
+#   recall@k        — по размеченным вопросам, векторы корпуса от torch;
+#   recall@k_self   — то же, когда корпус перекодирован этим же бэкендом.
+
+
+def set_threads(model, n):
+    if getattr(model, "backend", "torch") == "torch":
+        import torch
+        torch.set_num_threads(n)
+        return model
+    return type(model)(os.path.dirname(model.model_path), model.backend == "onnx-int8", threads=n)
+
+
+def encode(model, texts, batch_size):
+    return np.asarray(model.encode(texts, normalize_embeddings=True, batch_size=batch_size,
+                                   show_progress_bar=False), dtype=np.float32)
+
+
+def top_k(doc_vectors, query_vectors, k):
+    scores = query_vectors @ doc_vectors.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def recall(found, labelled):
+    return sum(bool(set(ids.tolist()) & set(item["relevant"])) for ids, item in zip(found, labelled)) / len(labelled)
+
+
+def run(backends, threads_list, n_scenes, n_labelled, k, batch_size):
+    scenes = generate_scenes(n_scenes)
+    docs = [s["summary_50w"] for s in scenes]
+    labelled = labelled_queries(scenes, n_labelled)
+    queries = FIXED_QUERIES + [item["query"] for item in labelled]
+
+    reference = load_model(MODEL_NAME, "torch")
+    ref_docs = encode(reference, docs, 64)
+    ref_queries = encode(reference, queries, batch_size)
+    ref_top = top_k(ref_docs, ref_queries, k)
+
+    results = []
+    for backend in backends:
+        model = reference if backend == "torch" else load_model(MODEL_NAME, backend)
+        for threads in threads_list:
+            model = set_threads(model, threads)
+            encode(model, queries[:8], 1)  # прогрев: сессия ONNX, кэши аллокатора
+
+            latencies = []
+            for query in queries:
+                started = time.perf_counter()
+                encode(model, [query], 1)
+                latencies.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            doc_vectors = encode(model, docs, 64)
+            docs_per_s = len(docs) / (time.perf_counter() - started)
+
+            query_vectors = encode(model, queries, batch_size)
+            cosine = (query_vectors * ref_queries).sum(axis=1)
+            found = top_k(ref_docs, query_vectors, k)
+            overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, ref_top)])
+            labelled_vectors = query_vectors[len(FIXED_QUERIES):]
+            results.append({
+                "backend": backend,
+                "threads": threads,
+                "query_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                "query_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+                "docs_per_s": round(docs_per_s, 1),
+                "cosine_mean": round(float(cosine.mean()), 5),
+                "cosine_min": round(float(cosine.min()), 5),
+                f"overlap@{k}": round(float(overlap), 4),
+                f"recall@{k}": round(recall(top_k(ref_docs, labelled_vectors, k), labelled), 4),
+                f"recall@{k}_self": round(recall(top_k(doc_vectors, labelled_vectors, k), labelled), 4),
+            })
+            print(results[-1])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx-fp32", "onnx-int8"])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--scenes", type=int, default=5000)
+    parser.add_argument("--labelled", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+    run(args.backends, args.threads, args.scenes, args.labelled, args.k, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
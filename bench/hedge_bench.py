@@ -0,0 +1,114 @@
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+from aiohttp import web
+
+from api.llm import OpenAICompatProvider, PoolMember, ProviderPool
+from bench.stub_llm import make_app
+
+# === Пул провайдеров LLM: один провайдер против перехода при ошибках и хеджирования ===
+# python -m bench.hedge_bench --requests 300 --concurrency 8
+# Поднимает несколько заглушек с разными задержками, зависаниями и ошибками и гоняет одни и те же запросы
+# через три конфигурации пула: single (только первый провайдер), failover (все, без хеджа) и hedged.
+# Для stream задержка — до первого токена.
+STUBS = [
+    # имя, задержка, разброс, доля ошибок, доля зависаний, длительность зависания (мс)
+    ("fast-stalls", 300, 100, 0.0, 0.1, 5000),
+    ("steady", 500, 50, 0.0, 0.0, 0),
+    ("flaky", 250, 50, 0.3, 0.0, 0),
+]
+
+
+async def start_stubs(base_port, token_ms):
+    runners, urls = [], []
+    for i, (name, latency, jitter, error_rate, stall_rate, stall_ms) in enumerate(STUBS):
+        app = make_app(latency, jitter, token_ms=token_ms, error_rate=error_rate, stall_rate=stall_rate,
+                       stall_ms=stall_ms)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", base_port + i).start()
+        runners.append(runner)
+        urls.append((name, f"http://127.0.0.1:{base_port + i}/v1"))
+    return runners, urls
+
+
+def make_pool(mode, urls, hedge_after, timeout):
+    members = [PoolMember(OpenAICompatProvider(url, name=name, timeout=timeout, max_concurrency=64))
+               for name, url in (urls[:1] if mode == "single" else urls)]
+    return ProviderPool(members, hedge=mode == "hedged", hedge_after=hedge_after, timeout=timeout)
+
+
+async def one(pool, stream, messages):
+    started = time.perf_counter()
+    if not stream:
+        await pool.complete(messages)
+        return time.perf_counter() - started
+    first = None
+    async for _ in pool.stream(messages):
+        first = first or time.perf_counter() - started
+    return first
+
+
+async def run_mode(mode, urls, runners, args, stream):
+    pool = make_pool(mode, urls, args.hedge_after, args.timeout)
+    messages = [{"role": "user", "content": "Кто такой Геральт?"}]
+    before = [(r.app["served"], r.app["errors"]) for r in runners]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        async with semaphore:
+            try:
+                latencies.append(await one(pool, stream, messages))
+            except Exception:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    await pool.close()
+
+    ms = np.array(latencies) * 1000
+    return {
+        "mode": mode,
+        "api": "stream" if stream else "complete",
+        "ok": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2),
+        **{f"p{p}_ms": round(float(np.percentile(ms, p)), 1) if len(ms) else None for p in (50, 90, 99)},
+        "max_ms": round(float(ms.max()), 1) if len(ms) else None,
+        # Сколько запросов дошло до каждой заглушки: цена хеджирования — лишние вызовы
+        "upstream": {name: {"served": r.app["served"] - s, "errors": r.app["errors"] - e}
+                     for (name, _), r, (s, e) in zip(urls, runners, before)},
+        "providers": pool.stats()["providers"],
+    }
+
+
+async def run(args):
+    runners, urls = await start_stubs(args.base_port, args.token_ms)
+    try:
+        for stream in (False, True):
+            for mode in args.modes:
+                print(json.dumps(await run_mode(mode, urls, runners, args, stream), ensure_ascii=False))
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", nargs="+", default=["single", "failover", "hedged"])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    parser.add_argument("--hedge-after", type=float, default=1.0, help="порог хеджа, пока мало замеров, с")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--base-port", type=int, default=9300)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
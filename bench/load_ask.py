@@ -0,0 +1,69 @@
+import json
+import time
+import asyncio
+import argparse
+import aiohttp
+import numpy as np
+
+from bench.synthetic import generate_queries
+
+# === Нагрузочный тест /ask ===
+# 1) python -m bench.stub_llm --latency-ms 1500
+# 2) LLM_BASE_URL=http://localhost:9000/v1 uvicorn api.main:app --port 8000
+# 3) python -m bench.load_ask --url http://localhost:8000/ask --concurrency 64 --requests 512
+
+
+async def worker(session, url, queries, latencies, errors, persona):
+    while queries:
+        query = queries.pop()
+        started = time.perf_counter()
+        try:
+            async with session.post(url, json={"persona": persona, "query": query}) as resp:
+                await resp.read()
+                if resp.status != 200:
+                    errors.append(resp.status)
+                    continue
+        except Exception as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def run(url, concurrency, n_requests, persona, timeout):
+    queries = generate_queries(n_requests)
+    latencies, errors = [], []
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session, url, queries, latencies, errors, persona) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "url": url,
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "ok": len(latencies),
+        "errors": len(errors),
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1) if latencies else None,
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1) if latencies else None,
+        "p99_ms": round(float(np.percentile(latencies, 99)), 1) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000/ask")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--persona", default="Геральт")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    for concurrency in args.concurrency:
+        print(json.dumps(asyncio.run(run(args.url, concurrency, args.requests, args.persona, args.timeout)),
+                         ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+from bench.synthetic import generate_scenes, write_jsonl
+
+# === Память под сцены в процессе API: список словарей против колоночного хранилища ===
+# python -m bench.memory_bench --scenes 100000
+# Каждый вариант загружается в отдельном процессе; RSS берётся из /proc/self/status.
+# RssAnon — куча процесса, RssFile — страницы файлов (mmap), общие между воркерами и вытесняемые ядром.
+
+
+def rss():
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                values[key] = int(value.split()[0]) / 1024  # МБ
+    return values
+
+
+def child(mode, path):
+    import numpy as np
+    from api.evidence import evidence_block, prepare_scene
+
+    before = rss()
+    started = time.perf_counter()
+    if mode == "dicts":
+        # Как было: все сцены словарями, с полными текстами
+        from api.artifacts import load_scenes
+        scenes = [prepare_scene(s) for s in load_scenes(os.path.join(path, "scenes.jsonl"))]
+    else:
+        from api.scene_store import SceneStore
+        scenes = SceneStore.load(path)
+    load_s = time.perf_counter() - started
+
+    # Типичный запрос: источники для промпта из top-k сцен
+    rng = np.random.default_rng(0)
+    started = time.perf_counter()
+    for _ in range(1000):
+        for i in rng.integers(0, len(scenes), 5):
+            evidence_block(scenes[i])
+    topk_us = (time.perf_counter() - started) / 1000 * 1e6
+
+    after = rss()
+    return {
+        "mode": mode,
+        "scenes": len(scenes),
+        "rss_before_mb": round(before["VmRSS"], 1),
+        "rss_after_mb": round(after["VmRSS"], 1),
+        "rss_delta_mb": round(after["VmRSS"] - before["VmRSS"], 1),
+        "anon_delta_mb": round(after["RssAnon"] - before["RssAnon"], 1),
+        "file_delta_mb": round(after["RssFile"] - before["RssFile"], 1),
+        "load_s": round(load_s, 2),
+        "evidence_top5_us": round(topk_us, 1),
+    }
+
+
+def run(n_scenes):
+    from api.evidence import prepare_scene
+    from api.scene_store import SceneStore
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        scenes = [prepare_scene(s) for s in generate_scenes(n_scenes)]
+        write_jsonl(scenes, os.path.join(tmp, "scenes.jsonl"))
+        SceneStore.write(scenes, tmp)
+        del scenes
+        sizes = {name: round(os.path.getsize(os.path.join(tmp, name)) / 2**20, 1) for name in os.listdir(tmp)}
+
+        for mode in ("dicts", "store"):
+            out = subprocess.run([sys.executable, "-m", "bench.memory_bench", "--child", mode, "--dir", tmp],
+                                 check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(out.strip().splitlines()[-1]))
+    return {"files_mb": sizes, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenes", type=int, default=100_000)
+    parser.add_argument("--child", choices=("dicts", "store"), help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args.child, args.dir)))
+        return
+    print(json.dumps(run(args.scenes), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,59 @@
+import time
+import argparse
+import numpy as np
+
+from api.gazetteer import Gazetteer
+from api.search import _natasha_entities, extract_entities
+from bench.synthetic import generate_scenes
+
+# === Задержка extract_entities: только natasha против словаря + кэша natasha ===
+# Запуск: python -m bench.ner_bench
+
+QUERIES = [
+    "Кто такой Геральт?",
+    "Что Йеннифэр думает о Геральте?",
+    "Расскажи, как Цири попала в Каэр Морхен",
+    "Что случилось в Вызиме с дочерью Фольтеста?",
+    "Лютик, спой балладу о Белом волке",
+    "Как дела?",
+    "Расскажи шутку",
+    "Что ты знаешь о Нильфгаарде и императоре Эмгыре?",
+    "Где сейчас Трисс Меригольд?",
+    "Как снять проклятие стрыги?",
+]
+
+
+def latency_ms(fn, queries, repeat):
+    samples = []
+    for _ in range(repeat):
+        for q in queries:
+            started = time.perf_counter()
+            fn(q)
+            samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "mean_ms": round(float(np.mean(samples)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--scenes", type=int, default=1000, help="сцены-источник имён и мест для словаря")
+    args = parser.parse_args()
+
+    gazetteer = Gazetteer.build(generate_scenes(args.scenes))
+    natasha = _natasha_entities.__wrapped__  # без кэша — как было до словаря
+
+    print({"variant": "natasha", **latency_ms(natasha, QUERIES, args.repeat)})
+    _natasha_entities.cache_clear()
+    print({"variant": "gazetteer+cache (холодный кэш)", **latency_ms(lambda q: extract_entities(q, gazetteer), QUERIES, 1)})
+    print({"variant": "gazetteer+cache", **latency_ms(lambda q: extract_entities(q, gazetteer), QUERIES, args.repeat)})
+
+    for q in QUERIES:
+        print(q, "→", extract_entities(q, gazetteer))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
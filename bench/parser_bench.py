@@ -0,0 +1,79 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from aiohttp import web
+
+from api.llm import OpenAICompatProvider
+from bench.stub_llm import make_app
+from bench.synthetic import generate_scenes
+from parser.parser import parse_book_async
+
+# === Пропускная способность парсера (сцен в минуту) против локальной заглушки LLM ===
+# python -m bench.parser_bench --scenes 120 --latency-ms 500 --concurrency 1 4 16 --rate 0
+
+STUB_ANSWER = json.dumps({
+    "extra_characters": ["Геральт", "Лютик"],
+    "extra_locations": ["Темерия > Вызима"],
+    "extra_events": ["Геральт снимает проклятие"],
+    "event_tags": ["lifting_curse"],
+}, ensure_ascii=False)
+
+
+def write_book(path, n_scenes, scenes_per_chapter=10):
+    scenes = generate_scenes(n_scenes)
+    with open(path, "w", encoding="utf-8") as f:
+        for start in range(0, n_scenes, scenes_per_chapter):
+            f.write(f"\nГЛАВА {start // scenes_per_chapter + 1}\n")
+            f.write("\n***\n".join(s["text"] for s in scenes[start:start + scenes_per_chapter]))
+            f.write("\n")
+
+
+async def run(n_scenes, latency_ms, concurrency_levels, rate, port):
+    runner = web.AppRunner(make_app(latency_ms=latency_ms, answer=STUB_ANSWER))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        book = os.path.join(tmp, "book.txt")
+        write_book(book, n_scenes)
+        for concurrency in concurrency_levels:
+            provider = OpenAICompatProvider(f"http://127.0.0.1:{port}/v1", max_concurrency=concurrency)
+            started = time.perf_counter()
+            n_parsed = await parse_book_async(book, out_path=os.path.join(tmp, "scenes.jsonl"),
+                                            checkpoint_path=os.path.join(tmp, "checkpoint.jsonl"),
+                                            concurrency=concurrency, rate=rate, provider=provider,
+                                            cache_path=None)  # кэш аннотаций исказил бы замер
+            elapsed = time.perf_counter() - started
+            await provider.close()
+            results.append({
+                "scenes": n_parsed,
+                "concurrency": concurrency,
+                "rate": rate,
+                "llm_latency_ms": latency_ms,
+                "seconds": round(elapsed, 2),
+                "scenes_per_min": round(n_parsed / elapsed * 60, 1),
+            })
+
+    await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenes", type=int, default=120)
+    parser.add_argument("--latency-ms", type=float, default=500.0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--rate", type=float, default=0.0, help="запросов в секунду, 0 — без ограничения")
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args()
+
+    for result in asyncio.run(run(args.scenes, args.latency_ms, args.concurrency, args.rate, args.port)):
+        print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,101 @@
+import time
+import json
+import random
+import asyncio
+import argparse
+from aiohttp import web
+
+# === Заглушка OpenAI-совместимого LLM-сервера для нагрузочных тестов ===
+# Запуск: python -m bench.stub_llm --port 9000 --latency-ms 1500 --token-ms 30
+# Нестабильный провайдер: --error-rate 0.2 --stall-rate 0.05 --stall-ms 20000
+# API: LLM_BASE_URL=http://localhost:9000/v1
+
+FAKE_ANSWER = ("Хмм. Дорога была длинной, а ночь — холодной. Стрыга не любит рассвета, "
+               "и я тоже не люблю спешки. Такова работа.")
+
+
+def completion(content, model):
+    return {
+        "id": f"stub-{random.getrandbits(32):08x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
+
+
+def chunk(content, model, finish_reason=None):
+    return {
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": {"content": content} if content else {}, "finish_reason": finish_reason}],
+    }
+
+
+def make_app(latency_ms=1000.0, jitter_ms=0.0, answer=FAKE_ANSWER, token_ms=0.0, error_rate=0.0, stall_rate=0.0,
+             stall_ms=10000.0):
+    # latency_ms — время до первого токена, token_ms — пауза между токенами (для stream=true).
+    # error_rate — доля ответов HTTP 500, stall_rate — доля запросов, которые «зависают» на stall_ms
+    tokens = [word + " " for word in answer.split()]
+
+    async def chat_completions(request):
+        body = await request.json()
+        model = body.get("model", "stub")
+        delay = latency_ms + random.uniform(-jitter_ms, jitter_ms)
+        if random.random() < stall_rate:
+            delay += stall_ms
+        await asyncio.sleep(max(0.0, delay) / 1000)
+        if random.random() < error_rate:
+            request.app["errors"] += 1
+            return web.json_response({"error": {"message": "stub: injected error"}}, status=500)
+        request.app["served"] += 1
+
+        if not body.get("stream"):
+            await asyncio.sleep(token_ms * len(tokens) / 1000)
+            return web.json_response(completion(answer, model))
+
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        try:
+            await resp.prepare(request)
+            for i, token in enumerate(tokens):
+                if i:
+                    await asyncio.sleep(token_ms / 1000)
+                await resp.write(f"data: {json.dumps(chunk(token, model), ensure_ascii=False)}\n\n".encode())
+            await resp.write(f"data: {json.dumps(chunk(None, model, 'stop'))}\n\ndata: [DONE]\n\n".encode())
+            await resp.write_eof()
+        except ConnectionResetError:
+            request.app["disconnected"] += 1  # клиент отменил запрос (например, проигравший хедж)
+        return resp
+
+    async def stats(request):
+        return web.json_response({key: request.app[key] for key in ("served", "errors", "disconnected")})
+
+    app = web.Application()
+    app["served"] = 0
+    app["errors"] = 0
+    app["disconnected"] = 0
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=1000.0, help="время до первого токена")
+    parser.add_argument("--token-ms", type=float, default=0.0, help="пауза между токенами")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--answer", default=FAKE_ANSWER)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов HTTP 500")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="доля запросов с зависанием")
+    parser.add_argument("--stall-ms", type=float, default=10000.0)
+    args = parser.parse_args()
+
+    web.run_app(make_app(args.latency_ms, args.jitter_ms, args.answer, args.token_ms, args.error_rate,
+                         args.stall_rate, args.stall_ms), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import zlib
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+
+from api.artifacts import ENCODER_BACKENDS
+from bench.synthetic import FIXED_QUERIES, generate_scenes, labelled_queries, write_jsonl
+
+# === Сквозной набор замеров на синтетическом корпусе ===
+# python -m bench.suite --sizes 1000 10000 100000            # настоящая модель эмбеддингов (EMBED_MODEL)
+# python -m bench.suite --sizes 10000 --encoder onnx-int8     # та же модель через ONNX Runtime (api/onnx_encoder.py)
+# python -m bench.suite --sizes 1000 10000 --encoder hash    # без torch: хэш-эмбеддинги, только индексы
+# python -m bench.suite --sizes 10000 --ask                  # + пропускная способность /ask против заглушки LLM
+# Для каждого размера: сборка артефактов, холодный старт (время и RSS в отдельном процессе),
+# задержка retrieve() на фиксированных и размеченных вопросах, recall@k по размеченным.
+# Итог пишется в bench/results/<время>-<коммит>.json — прогоны можно сравнивать между собой.
+RESULTS_DIR = "bench/results"
+CORPUS_DIR = "data/bench"
+
+
+class HashEncoder:
+    # Детерминированные эмбеддинги без нейросети: хэши лемм → разреженный вектор со знаками.
+    # Меряет всё, кроме самой модели; recall с ним — лексический, не семантический
+    backend = "hash"
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def encode(self, texts, normalize_embeddings=True, **kwargs):
+        from api.analyzer import analyze
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in analyze(text):
+                h = zlib.crc32(token.encode("utf-8"))
+                out[row, h % self.dim] += 1.0 if h & 1 << 31 else -1.0
+        if normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
+
+
+def make_encoder(kind):
+    if kind == "hash":
+        return HashEncoder()
+    from api.artifacts import MODEL_NAME, load_model
+    return load_model(MODEL_NAME, kind)
+
+
+def rss_mb():
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon"):
+                values[key] = round(int(value.split()[0]) / 1024, 1)
+    return values
+
+
+def percentiles(latencies):
+    return {f"p{p}_ms": round(float(np.percentile(latencies, p)), 2) for p in (50, 95, 99)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def corpus(size):
+    path = os.path.join(CORPUS_DIR, f"scenes_{size}.jsonl")
+    if not os.path.exists(path):
+        os.makedirs(CORPUS_DIR, exist_ok=True)
+        write_jsonl(generate_scenes(size), path)
+    return path
+
+
+# === Холодный старт: то же, что делает api/indexer.py при запуске, в чистом процессе ===
+def cold_start(artifact_dir, encoder_kind):
+    from api.artifacts import load_artifacts
+    from api.entity_index import EntityIndex
+    from api.gazetteer import Gazetteer
+
+    before = rss_mb()
+    started = time.perf_counter()
+    make_encoder(encoder_kind)
+    model_s = time.perf_counter() - started
+    scenes, bm25, index, embeddings = load_artifacts(artifact_dir)
+    Gazetteer.build(scenes)
+    EntityIndex.build(scenes)
+    after = rss_mb()
+    return {
+        "cold_start_s": round(time.perf_counter() - started, 2),
+        "model_load_s": round(model_s, 2),
+        "rss_mb": after["VmRSS"],
+        "rss_delta_mb": round(after["VmRSS"] - before["VmRSS"], 1),
+        "anon_delta_mb": round(after["RssAnon"] - before["RssAnon"], 1),
+    }
+
+
+def measure_retrieval(artifact_dir, model, scenes_path, n_labelled, repeat, ks=(5, 20)):
+    from api.artifacts import load_artifacts, load_scenes
+    from api.entity_index import EntityIndex
+    from api.gazetteer import Gazetteer
+    from api.search import retrieve
+
+    scenes, bm25, index, _ = load_artifacts(artifact_dir)
+    gazetteer, entity_index = Gazetteer.build(scenes), EntityIndex.build(scenes)
+
+    def search(query):
+        return retrieve(query, bm25, index, model, entity_index, topk_bm25=20, topk_faiss=20, gazetteer=gazetteer)[0]
+
+    for query in FIXED_QUERIES[:3]:
+        search(query)  # прогрев: кэши лемм и NER, ленивые структуры FAISS
+
+    latencies = []
+    for _ in range(repeat):
+        for query in FIXED_QUERIES:
+            started = time.perf_counter()
+            search(query)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    labelled = labelled_queries(load_scenes(scenes_path), n_labelled)
+    hits = {k: 0 for k in ks}
+    for item in labelled:
+        ids = search(item["query"])
+        for k in ks:
+            hits[k] += bool(set(ids[:k].tolist()) & set(item["relevant"]))
+    return {
+        "queries": len(latencies),
+        **percentiles(latencies),
+        "labelled": len(labelled),
+        **{f"recall@{k}": round(hits[k] / len(labelled), 4) for k in ks},
+    }
+
+
+async def measure_ask(encoder, scenes_path, index_dir, concurrency_levels, n_requests, latency_ms, port, llm_port):
+    # Один процесс uvicorn с настоящей моделью (ENCODER_BACKEND из --encoder) против заглушки LLM
+    from aiohttp import web
+    from bench.load_ask import run as load
+    from bench.stub_llm import make_app
+    from bench.workers_bench import wait_ready
+
+    runner = web.AppRunner(make_app(latency_ms=latency_ms))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", llm_port).start()
+    env = dict(os.environ, ENCODER_BACKEND=encoder, SCENES_PATH=scenes_path, INDEX_DIR=index_dir, LLM_BASE_URL=f"http://127.0.0.1:{llm_port}/v1",
+               ANSWER_CACHE_SIZE="0", ANSWER_CACHE_PATH="")
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port)], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await wait_ready(f"http://127.0.0.1:{port}/stats", proc, 600)
+        results = []
+        for concurrency in concurrency_levels:
+            result = await load(f"http://127.0.0.1:{port}/ask", concurrency, n_requests, "Геральт", 120.0)
+            results.append({key: result[key] for key in ("concurrency", "ok", "errors", "rps", "p50_ms", "p95_ms")})
+        return results
+    finally:
+        proc.terminate()
+        proc.wait()
+        await runner.cleanup()
+
+
+def run_size(size, args, model):
+    from api.artifacts import MODEL_NAME, build_artifacts
+
+    scenes_path = corpus(size)
+    index_dir = os.path.join(args.work_dir, f"index_{size}")
+    started = time.perf_counter()
+    # Под тем же ключом, что посчитает API (--ask), иначе он пересоберёт индекс при старте
+    model_name = MODEL_NAME if args.encoder != "hash" else "bench-hash"
+    artifact_dir = build_artifacts(scenes_path, model_name, index_dir, model=model, force=True)
+    result = {"scenes": size, "build_s": round(time.perf_counter() - started, 2)}
+
+    out = subprocess.run([sys.executable, "-m", "bench.suite", "--child", artifact_dir, "--encoder", args.encoder],
+                         check=True, capture_output=True, text=True).stdout
+    result["cold_start"] = json.loads(out.strip().splitlines()[-1])
+    result["retrieval"] = measure_retrieval(artifact_dir, model, scenes_path, args.labelled, args.repeat)
+    if args.ask:
+        result["ask"] = asyncio.run(measure_ask(args.encoder, scenes_path, index_dir, args.concurrency, args.requests,
+                                                args.llm_latency_ms, args.port, args.llm_port))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--encoder", choices=ENCODER_BACKENDS + ("hash",), default="torch")
+    parser.add_argument("--labelled", type=int, default=200, help="размеченных вопросов для recall@k")
+    parser.add_argument("--repeat", type=int, default=5, help="проходов по фиксированным вопросам")
+    parser.add_argument("--ask", action="store_true", help="замерить /ask (нужна настоящая модель)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--llm-latency-ms", type=float, default=500.0)
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--llm-port", type=int, default=9200)
+    parser.add_argument("--work-dir", default=None, help="куда собирать индексы (по умолчанию временная папка)")
+    parser.add_argument("--out", default=RESULTS_DIR)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.ask and args.encoder == "hash":
+        parser.error("--ask запускает настоящий API: нужен --encoder torch или onnx-*")
+
+    if args.child:
+        print(json.dumps(cold_start(args.child, args.encoder)))
+        return
+
+    model = make_encoder(args.encoder)
+    with tempfile.TemporaryDirectory() as tmp:
+        args.work_dir = args.work_dir or tmp
+        results = [run_size(size, args, model) for size in args.sizes]
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "encoder": args.encoder,
+            "args": {key: value for key, value in vars(args).items() if key not in ("child", "work_dir", "out")},
+        },
+        "results": results,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"{time.strftime('%Y%m%d-%H%M%S')}-{report['meta']['commit']}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"✅ Результаты: {path}")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
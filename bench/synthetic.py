@@ -0,0 +1,154 @@
+import os
+import json
+import random
+import argparse
+
+# === Синтетический корпус сцен в формате scenes.jsonl ===
+CHARACTERS = ["Геральт", "Цири", "Йеннифэр", "Лютик", "Трисс", "Весемир", "Ламберт", "Эскель",
+              "Регис", "Нэннеке", "Фольтест", "Эмгыр", "Дийкстра", "Вильгефорц", "Кейра", "Золтан"]
+LOCATIONS = ["Вызима", "Каэр Морхен", "Новиград", "Цинтра", "Темерия > Вызима", "Редания > Третогор",
+             "Брокилон", "Элландер > Храм Мелитэле", "Содден", "Соддена > Холм"]
+EVENT_TAGS = ["lifting_curse", "fight_striga", "striga_curse", "wedding_celebration", "journey",
+              "arrival", "battle", "dialogue", "execution", "feast"]
+BEATS = ["ночь", "бой", "рассвет", "принцесса", "король", "монстр", "замок", "погоня", "диалог", "драка"]
+WORDS = ("ведьмак меч серебро стрыга чародейка дорога трактир король замок ночь туман болото "
+         "эликсир знак аард игни проклятие корона война эльфы краснолюды баллада лютня "
+         "деньги заказ контракт чудовище лес река мост ворота стража кровь смерть судьба "
+         "предназначение дитя ребёнок портал магия ложа совет империя север юг").split()
+
+
+def zipf_words(rng, n):
+    # Частоты слов по Ципфу — похоже на словарь реального текста
+    weights = [1.0 / (rank + 1) for rank in range(len(WORDS))]
+    return rng.choices(WORDS, weights=weights, k=n)
+
+
+# Шаблоны предложений в настоящем времени — род и число согласовывать не нужно
+SENTENCES = [
+    "{a} медленно идёт через {place}, {w1} и {w2} остаются позади.",
+    "{a} говорит {b}, что {w1} опаснее, чем {w2}.",
+    "В {place} {a} встречает {b}, и разговор заходит о {w3}.",
+    "{a} достаёт {w1} и долго молчит.",
+    "Никто в {place} не знает, откуда у {a} {w1}.",
+    "{a} смеётся: {w1} — это всего лишь {w2}.",
+    "{b} предупреждает, что ночью в {place} появится {w1}.",
+    "{a} и {b} спорят о {w3} до самого рассвета.",
+    "К утру {w1} исчезает, а {a} снова отправляется в путь.",
+    "{a} вспоминает {w1}, {w2} и старый {w3}.",
+]
+EVENT_PHRASES = {
+    "lifting_curse": "снятие проклятия", "fight_striga": "бой со стрыгой", "striga_curse": "проклятие стрыги",
+    "wedding_celebration": "свадьба", "journey": "дорога", "arrival": "прибытие", "battle": "битва",
+    "dialogue": "разговор", "execution": "казнь", "feast": "пир",
+}
+
+
+def make_sentence(rng, chars, locations):
+    words = zipf_words(rng, 3)
+    a = rng.choice(chars)
+    b = rng.choice([c for c in chars if c != a] or [c for c in CHARACTERS if c != a])
+    place = rng.choice(locations if locations and rng.random() < 0.7 else LOCATIONS).split(">")[-1].strip()
+    return rng.choice(SENTENCES).format(a=a, b=b, place=place, w1=words[0], w2=words[1], w3=words[2])
+
+
+def make_scene(rng, i):
+    chars = rng.sample(CHARACTERS, rng.randint(1, 4))
+    locations = rng.sample(LOCATIONS, rng.randint(0, 2))
+    tags = rng.sample(EVENT_TAGS, rng.randint(0, 3))
+    sentences = [make_sentence(rng, chars, locations) for _ in range(rng.randint(15, 40))]
+    text = " ".join(sentences)
+    summary = " ".join(sentences[:rng.randint(3, 5)] + [EVENT_PHRASES[tag].capitalize() + "." for tag in tags])
+    book_id = f"synthetic_{i // 5000:02d}"
+    return {
+        "book_id": book_id,
+        "chapter_id": i // 50 + 1,
+        "scene_id": f"{book_id}/{i // 50 + 1:02d}_{i % 50 + 1:03d}",
+        "text": text,
+        "token_len": len(text.split()),
+        "extra_characters": chars,
+        "extra_locations": locations,
+        "extra_events": [EVENT_PHRASES[tag] for tag in tags],
+        "event_tags": tags,
+        "summary_50w": summary,
+        "beats": rng.sample(BEATS, rng.randint(0, 4)),
+        "quote_hashes": [],
+        "start_char": 0,
+        "end_char": len(text),
+    }
+
+
+def generate_scenes(n, seed=0):
+    rng = random.Random(seed)
+    return [make_scene(rng, i) for i in range(n)]
+
+
+def generate_queries(n, seed=1):
+    rng = random.Random(seed)
+    return [" ".join(rng.sample(CHARACTERS, 1) + zipf_words(rng, rng.randint(2, 6))) for _ in range(n)]
+
+
+# Фиксированный набор вопросов, как их задают боту: для замеров задержки на одних и тех же запросах
+FIXED_QUERIES = [
+    "Кто такой Геральт?",
+    "Что Йеннифэр думает о Геральте?",
+    "Расскажи, как Цири попала в Каэр Морхен",
+    "Что случилось в Вызиме с дочерью Фольтеста?",
+    "Лютик, спой балладу о Белом волке",
+    "Как снять проклятие стрыги?",
+    "Где сейчас Трисс?",
+    "Что ты знаешь об императоре Эмгыре?",
+    "Расскажи про бой со стрыгой",
+    "Почему Весемир остался в Каэр Морхене?",
+    "Что произошло на свадьбе в Цинтре?",
+    "Кто такой Регис и чем он опасен?",
+    "Куда ведёт дорога из Новиграда?",
+    "Зачем Дийкстра искал Геральта?",
+    "Что Золтан говорил о краснолюдах?",
+    "Как Кейра попала в Брокилон?",
+    "Чем закончилась битва при Соддене?",
+    "Что случилось на пиру у короля?",
+    "Как дела?",
+    "Расскажи шутку",
+]
+
+
+def labelled_queries(scenes, n, seed=2):
+    # Вопрос собирается из персонажа, события и слов сводки конкретной сцены — она и считается
+    # правильным ответом (recall@k: попала ли она в top-k)
+    rng = random.Random(seed)
+    queries = []
+    for target in rng.sample(range(len(scenes)), min(n, len(scenes))):
+        scene = scenes[target]
+        parts = [rng.choice(scene["extra_characters"])]
+        if scene["extra_events"]:
+            parts.append(rng.choice(scene["extra_events"]))
+        words = list(dict.fromkeys(w.strip(".,:—") for w in scene["summary_50w"].split() if len(w) > 4 and w.islower()))
+        parts += rng.sample(words, min(3, len(words)))
+        queries.append({"query": " ".join(parts), "relevant": [target]})
+    return queries
+
+
+def write_jsonl(scenes, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for s in scenes:
+            f.write(json.dumps(s, ensure_ascii=False) + "\n")
+
+
+# === CLI: корпуса нескольких размеров ===
+# python -m bench.synthetic --sizes 1000 10000 100000 --out data/bench
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--out", default="data/bench")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for size in args.sizes:
+        path = os.path.join(args.out, f"scenes_{size}.jsonl")
+        write_jsonl(generate_scenes(size, args.seed), path)
+        print(f"{path}: {size} сцен")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
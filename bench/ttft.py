@@ -0,0 +1,68 @@
+import json
+import time
+import asyncio
+import argparse
+import aiohttp
+import numpy as np
+
+from bench.synthetic import generate_queries
+
+# === Время до первого токена для /ask/stream (сквозное, со стороны клиента) ===
+# python -m bench.stub_llm --latency-ms 800 --token-ms 30
+# LLM_BASE_URL=http://localhost:9000/v1 uvicorn api.main:app --port 8000
+# python -m bench.ttft --url http://localhost:8000/ask/stream --requests 50 --concurrency 4
+
+
+async def one(session, url, query, persona):
+    started = time.perf_counter()
+    ttft_ms, server = None, {}
+    async with session.post(url, json={"persona": persona, "query": query}) as resp:
+        event = None
+        async for line in resp.content:
+            line = line.decode("utf-8").strip()
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                if event == "token" and ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - started) * 1000
+                elif event == "done":
+                    server = json.loads(line[len("data:"):])
+    return ttft_ms, (time.perf_counter() - started) * 1000, server.get("ttft_ms")
+
+
+async def run(url, n_requests, concurrency, persona):
+    queries = generate_queries(n_requests)
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession() as session:
+        async def bounded(q):
+            async with semaphore:
+                return await one(session, url, q, persona)
+        results = await asyncio.gather(*(bounded(q) for q in queries))
+
+    ttft = [r[0] for r in results if r[0] is not None]
+    total = [r[1] for r in results]
+    server_ttft = [r[2] for r in results if r[2] is not None]
+    pct = lambda xs, p: round(float(np.percentile(xs, p)), 1) if xs else None
+    return {
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "ttft_p50_ms": pct(ttft, 50),
+        "ttft_p95_ms": pct(ttft, 95),
+        "server_ttft_p50_ms": pct(server_ttft, 50),
+        "total_p50_ms": pct(total, 50),
+        "total_p95_ms": pct(total, 95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000/ask/stream")
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--persona", default="Геральт")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.url, args.requests, args.concurrency, args.persona)), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
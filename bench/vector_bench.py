@@ -0,0 +1,76 @@
+import time
+import argparse
+import faiss
+import numpy as np
+
+from api.vector import VectorBackend, build_index
+
+# === Recall и задержка ANN-индексов относительно точного IndexFlatIP ===
+# Запуск: python -m bench.vector_bench --sizes 10000 100000
+# Вектора синтетические: смесь гауссовых кластеров на сфере, как у эмбеддингов сцен
+
+
+def synthetic_embeddings(n, d, n_clusters=200, seed=0):
+    rng = np.random.RandomState(seed)
+    centers = rng.randn(n_clusters, d).astype(np.float32)
+    x = centers[rng.randint(0, n_clusters, n)] + 0.5 * rng.randn(n, d).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def measure(backend, queries, truth, k):
+    latencies, found = [], []
+    for q in queries:
+        started = time.perf_counter()
+        _, ids = backend.search(q[None, :], k)  # по одному запросу, как в /ask
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append(ids[0])
+    return {
+        "recall": round(recall_at_k(found, truth), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+    }
+
+
+def run(size, d, n_queries, k):
+    x = synthetic_embeddings(size, d)
+    queries = synthetic_embeddings(n_queries, d, seed=1)
+
+    flat = VectorBackend(build_index(x, "flat"), "flat")
+    _, truth = flat.search(queries, k)
+    print({"scenes": size, "index": "flat", **measure(flat, queries, truth, k)})
+
+    for kind, param, values in [
+        ("hnsw", "ef_search", [16, 32, 64, 128, 256]),
+        ("ivfsq8", "nprobe", [1, 4, 16, 64]),
+        ("ivfpq", "nprobe", [1, 4, 16, 64]),
+    ]:
+        started = time.perf_counter()
+        backend = VectorBackend(build_index(x, kind), kind)
+        build_s = round(time.perf_counter() - started, 2)
+        for value in values:
+            backend.configure(**{param: value})
+            print({"scenes": size, "index": kind, param: value, "build_s": build_s,
+                   **measure(backend, queries, truth, k)})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dim", type=int, default=384)  # multilingual-e5-small
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--topk", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    for size in args.sizes:
+        run(size, args.dim, args.queries, args.topk)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
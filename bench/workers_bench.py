@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+import aiohttp
+from aiohttp import web
+
+from bench.load_ask import run as load
+from bench.stub_llm import make_app
+
+# === Масштабирование API по числу воркеров gunicorn ===
+# python -m bench.workers_bench --workers 1 2 4 --concurrency 32 --requests 512
+# Для каждого числа воркеров запускается gunicorn api.main:app (gunicorn.conf.py, preload_app) против
+# локальной заглушки LLM; задержка LLM по умолчанию 0 — упираемся в CPU поиска и кодирования.
+# PSS делит общие страницы между процессами: если память индексов общая, он растёт заметно медленнее RSS.
+
+
+def memory_mb(pid):
+    # (RSS, PSS) мастера и всех воркеров
+    pids = [pid]
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            pids += [int(child) for child in f.read().split()]
+    rss = pss = 0
+    for p in pids:
+        with open(f"/proc/{p}/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key == "Rss":
+                    rss += int(value.split()[0])
+                elif key == "Pss":
+                    pss += int(value.split()[0])
+    return round(rss / 1024, 1), round(pss / 1024, 1)
+
+
+async def wait_ready(url, proc, timeout):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"gunicorn завершился с кодом {proc.returncode}")
+            try:
+                async with session.get(url) as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError(url)
+
+
+async def run(app, workers_list, threads, concurrency, n_requests, latency_ms, port, llm_port, startup_timeout):
+    runner = web.AppRunner(make_app(latency_ms=latency_ms))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", llm_port).start()
+
+    results = []
+    for workers in workers_list:
+        env = dict(os.environ, WEB_CONCURRENCY=str(workers), WORKER_THREADS=str(threads), PORT=str(port),
+                   LLM_BASE_URL=f"http://127.0.0.1:{llm_port}/v1",
+                   ANSWER_CACHE_SIZE="0", ANSWER_CACHE_PATH="")  # кэш ответов исказил бы замер
+        started = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "-m", "gunicorn", app], env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            await wait_ready(f"http://127.0.0.1:{port}/stats", proc, startup_timeout)
+            startup_s = time.perf_counter() - started
+            result = await load(f"http://127.0.0.1:{port}/ask", concurrency, n_requests, "Геральт", 120.0)
+            rss_mb, pss_mb = memory_mb(proc.pid)
+        finally:
+            proc.terminate()
+            proc.wait()
+        results.append({
+            "workers": workers,
+            "threads_per_worker": threads,
+            "startup_s": round(startup_s, 1),
+            "rss_mb": rss_mb,
+            "pss_mb": pss_mb,
+            **{key: result[key] for key in ("concurrency", "ok", "errors", "rps", "p50_ms", "p95_ms", "p99_ms")},
+        })
+
+    await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app", default="api.main:app")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=1, help="WORKER_THREADS для каждого воркера")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="задержка заглушки LLM")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--llm-port", type=int, default=9101)
+    parser.add_argument("--startup-timeout", type=float, default=600.0)
+    args = parser.parse_args()
+
+    for result in asyncio.run(run(args.app, args.workers, args.threads, args.concurrency, args.requests,
+                                  args.latency_ms, args.port, args.llm_port, args.startup_timeout)):
+        print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,17 +1,81 @@
 import os
+import json
 import asyncio
 import aiohttp
+from time import monotonic as loop_time
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from session_store import make_store
 
 API_TOKEN = os.getenv("API_TOKEN")
 FASTAPI_URL = os.getenv("FASTAPI_URL", "http://api:8000/ask")
+FASTAPI_STREAM_URL = os.getenv("FASTAPI_STREAM_URL", FASTAPI_URL.rstrip("/") + "/stream")
+BOT_STREAMING = os.getenv("BOT_STREAMING", "1") == "1"
+# Сообщение правится не чаще, чем раз в STREAM_EDIT_INTERVAL секунд или раз в STREAM_EDIT_TOKENS фрагментов
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "0.5"))
+STREAM_EDIT_TOKENS = int(os.getenv("STREAM_EDIT_TOKENS", "20"))
+STREAM_MIN_EDIT_GAP = 0.25  # даже по счётчику фрагментов не чаще — лимиты Telegram
+TELEGRAM_MAX_LEN = 4096
+
+# === HTTP-клиент и ограничение нагрузки на API ===
+BOT_POOL_SIZE = int(os.getenv("BOT_POOL_SIZE", "32"))  # соединений с API в пуле
+BOT_API_TIMEOUT = float(os.getenv("BOT_API_TIMEOUT", "120"))  # секунды на весь ответ
+BOT_CONNECT_TIMEOUT = float(os.getenv("BOT_CONNECT_TIMEOUT", "5"))
+BOT_MAX_IN_FLIGHT = int(os.getenv("BOT_MAX_IN_FLIGHT", "16"))  # одновременных вопросов к API от всего бота
+BOT_USER_QUEUE = int(os.getenv("BOT_USER_QUEUE", "2"))  # вопросов одного пользователя: один в работе + очередь
+BOT_QUEUE_WAIT = float(os.getenv("BOT_QUEUE_WAIT", "30"))  # сколько ждать свободного места, прежде чем ответить «занят»
 
 bot = Bot(token=API_TOKEN)
 dp = Dispatcher()
 
-user_personas = {}
+# Выбранный персонаж хранится как каноническое имя из characters.json
+sessions = make_store()
+CHARACTERS_PATH = os.getenv("CHARACTERS_PATH", "data/characters.json")
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.split()).lower().replace("ё", "е")
+
+def load_aliases(path=CHARACTERS_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            characters = json.load(f)
+    except Exception as e:
+        print(f"⚠️ Не удалось загрузить {path}: {e}")
+        return {}
+    aliases = {}
+    for ch in characters:
+        names = ch["name"] if isinstance(ch["name"], list) else [ch["name"]]
+        for name in names:
+            aliases.setdefault(normalize_name(name), names[0])
+    return aliases
+
+PERSONA_ALIASES = load_aliases()
+
+def resolve_persona(text: str) -> str:
+    # Неизвестное имя оставляем как есть: API ответит в нейтральном стиле
+    return PERSONA_ALIASES.get(normalize_name(text), " ".join(text.split()))
+
+_session = None
+in_flight = asyncio.Semaphore(BOT_MAX_IN_FLIGHT)
+user_locks = {}  # user_id → (Lock, сколько вопросов пользователя в работе или в очереди)
+
+def get_session():
+    # Одна сессия на весь бот: соединения с API переиспользуются (keep-alive)
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=BOT_POOL_SIZE, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=BOT_API_TIMEOUT, sock_connect=BOT_CONNECT_TIMEOUT),
+        )
+    return _session
+
+@dp.shutdown()
+async def close_session():
+    if _session is not None and not _session.closed:
+        await _session.close()
+    await sessions.close()  # дописывает накопленные изменения
 
 main_keyboard = ReplyKeyboardMarkup(
     keyboard=[
@@ -46,7 +110,7 @@ CHARACTERS_LIST = """
 
 @dp.message(Command("start"))
 async def cmd_start(message: types.Message):
-    user_personas.pop(message.from_user.id, None)  # сбрасываем персонажа
+    await sessions.delete(message.from_user.id)  # сбрасываем персонажа
     await message.answer(
         "👋 Привет! Напиши имя персонажа, с кем хочешь поговорить.\n\n"
         "Или нажми кнопку ниже, чтобы посмотреть список доступных персонажей!",
@@ -55,7 +119,7 @@ async def cmd_start(message: types.Message):
 
 @dp.message(Command("switch"))
 async def cmd_switch(message: types.Message):
-    user_personas.pop(message.from_user.id, None)  # сбрасываем персонажа
+    await sessions.delete(message.from_user.id)  # сбрасываем персонажа
     await message.answer(
         "🔄 Хорошо, с кем вы хотите поговорить теперь?",
         reply_markup=main_keyboard
@@ -81,36 +145,113 @@ async def handle_message(message: types.Message):
     if text.startswith('/'):
         return
 
-    if user_id not in user_personas:
-        user_personas[user_id] = text
+    persona = await sessions.get(user_id)
+    if persona is None:
+        persona = resolve_persona(text)
+        await sessions.set(user_id, persona)
         await message.answer(
-            f"✅ Отлично! Ты выбрал {text}. Теперь задай свой вопрос.",
+            f"✅ Отлично! Ты выбрал {persona}. Теперь задай свой вопрос.",
             reply_markup=main_keyboard
         )
         return
 
-    persona = user_personas[user_id]
     query = text
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.post(FASTAPI_URL, json={"persona": persona, "query": query}) as resp:
-                if resp.status == 200:
-                    data = await resp.json()
-                    await message.answer(
-                        data.get("answer", "🤔 Пустой ответ от API"),
-                        reply_markup=main_keyboard
-                    )
-                else:
-                    await message.answer(
-                        "⚠️ Что-то пошло не так на сервере",
-                        reply_markup=main_keyboard
-                    )
-        except Exception as e:
-            await message.answer(
-                f"⚠️ Ошибка запроса к API: {e}",
-                reply_markup=main_keyboard
-            )
+    # Вопросы одного пользователя идут по очереди, и их не больше BOT_USER_QUEUE:
+    # один пользователь не может занять все места в BOT_MAX_IN_FLIGHT
+    lock, pending = user_locks.get(user_id, (asyncio.Lock(), 0))
+    if pending >= BOT_USER_QUEUE:
+        await message.answer("⏳ Я ещё думаю над прошлым вопросом, подожди немного.", reply_markup=main_keyboard)
+        return
+    user_locks[user_id] = (lock, pending + 1)
+    try:
+        async with lock:
+            try:
+                await asyncio.wait_for(in_flight.acquire(), BOT_QUEUE_WAIT)
+            except asyncio.TimeoutError:
+                await message.answer("😮‍💨 Сейчас слишком много вопросов, попробуй чуть позже.", reply_markup=main_keyboard)
+                return
+            try:
+                await answer_question(message, persona, query)
+            finally:
+                in_flight.release()
+    finally:
+        lock, pending = user_locks[user_id]
+        if pending <= 1:
+            del user_locks[user_id]
+        else:
+            user_locks[user_id] = (lock, pending - 1)
+
+async def answer_question(message: types.Message, persona: str, query: str):
+    if BOT_STREAMING:
+        await stream_answer(message, persona, query)
+        return
+
+    await bot.send_chat_action(message.chat.id, "typing")
+    try:
+        async with get_session().post(FASTAPI_URL, json={"persona": persona, "query": query}) as resp:
+            if resp.status == 200:
+                data = await resp.json()
+                await message.answer(
+                    data.get("answer", "🤔 Пустой ответ от API"),
+                    reply_markup=main_keyboard
+                )
+            else:
+                await message.answer(
+                    "⚠️ Что-то пошло не так на сервере",
+                    reply_markup=main_keyboard
+                )
+    except Exception as e:
+        await message.answer(
+            f"⚠️ Ошибка запроса к API: {e}",
+            reply_markup=main_keyboard
+        )
+
+# === Потоковый ответ: одно сообщение, которое дописывается по мере генерации ===
+async def edit_text(reply: types.Message, text: str):
+    try:
+        await reply.edit_text(text[:TELEGRAM_MAX_LEN])
+    except TelegramBadRequest:
+        pass  # "message is not modified" и т.п. — не критично
+
+async def stream_answer(message: types.Message, persona: str, query: str):
+    reply = await message.answer("⏳ …", reply_markup=main_keyboard)
+    text, pending, last_edit = "", 0, loop_time()
+
+    try:
+        async with get_session().post(FASTAPI_STREAM_URL, json={"persona": persona, "query": query}) as resp:
+            if resp.status != 200:
+                await edit_text(reply, "⚠️ Что-то пошло не так на сервере")
+                return
+            event, interrupted = None, False
+            async for line in resp.content:
+                line = line.decode("utf-8").strip()
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                    interrupted = interrupted or event == "error"
+                    continue
+                if not line.startswith("data:") or event != "token":
+                    continue
+
+                text += json.loads(line[len("data:"):])["text"]
+                pending += 1
+                now = loop_time()
+                since_edit = now - last_edit
+                if since_edit >= STREAM_EDIT_INTERVAL or (pending >= STREAM_EDIT_TOKENS and since_edit >= STREAM_MIN_EDIT_GAP):
+                    await edit_text(reply, text + " …")
+                    pending, last_edit = 0, now
+    except Exception as e:
+        await edit_text(reply, f"⚠️ Ошибка запроса к API: {e}")
+        return
+
+    # Финальная правка без «…» — даже если текст уже показан целиком
+    if interrupted:
+        # Начало ответа уже показано — оставляем его и отмечаем обрыв отдельной строкой
+        notice = "⚠️ Ответ оборвался, спроси ещё раз"
+        shown = text.strip()[:TELEGRAM_MAX_LEN - len(notice) - 2]
+        await edit_text(reply, f"{shown}\n\n{notice}" if shown else notice)
+        return
+    await edit_text(reply, text.strip() or "🤔 Пустой ответ от API")
 
 async def main():
     await dp.start_polling(bot)
@@ -0,0 +1,230 @@
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# === Хранилище выбранных персонажей ===
+# memory — LRU + TTL в памяти процесса (теряется при перезапуске);
+# sqlite — файлы SQLite в режиме WAL, по одному на шард;
+# redis — Redis-совместимый сервер (Redis, Valkey, KeyDB), можно несколько — по одному на шард.
+# Чтение идёт из локального LRU-кэша, запись копится и сбрасывается пачкой раз в SESSION_FLUSH_MS.
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "100000"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(30 * 24 * 3600)))  # секунды; персонаж забывается после простоя
+SESSION_FLUSH_MS = float(os.getenv("SESSION_FLUSH_MS", "200"))
+SESSION_SHARDS = int(os.getenv("SESSION_SHARDS", "4"))
+SESSION_DB = os.getenv("SESSION_DB", "data/sessions/sessions.sqlite3")  # шард n → sessions.n.sqlite3
+REDIS_URLS = [url for url in os.getenv("REDIS_URLS", "redis://localhost:6379/0").split(",") if url]
+# Сколько локальная копия считается свежей: у нескольких реплик бота общая база, но свои кэши
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "5"))
+
+_MISSING = object()
+
+
+def shard_for(user_id: int, n_shards: int) -> int:
+    return int(user_id) % n_shards
+
+
+# === LRU + TTL в памяти ===
+class LRUCache:
+    def __init__(self, max_size=SESSION_CACHE_SIZE, ttl=SESSION_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        value, expires = item
+        if expires and time.monotonic() > expires:
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def put(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (value, time.monotonic() + ttl if ttl else 0)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MemorySessionStore:
+    def __init__(self, max_size=SESSION_CACHE_SIZE, ttl=SESSION_TTL):
+        self.cache = LRUCache(max_size, ttl)
+
+    async def get(self, user_id):
+        return self.cache.get(user_id)
+
+    async def set(self, user_id, persona):
+        self.cache.put(user_id, persona)
+
+    async def delete(self, user_id):
+        self.cache.pop(user_id)
+
+    async def close(self):
+        pass
+
+
+# === Общая часть постоянных хранилищ: кэш чтения и пакетная запись ===
+class BufferedSessionStore:
+    def __init__(self, n_shards, cache_size=SESSION_CACHE_SIZE, cache_ttl=SESSION_CACHE_TTL,
+                 flush_ms=SESSION_FLUSH_MS):
+        self.n_shards = n_shards
+        self.cache = LRUCache(cache_size, cache_ttl)
+        self.flush_interval = flush_ms / 1000
+        self._pending = {}  # user_id → персонаж или None (удаление), ещё не записанные в базу
+        self._flusher = None
+
+    async def get(self, user_id):
+        if user_id in self._pending:
+            return self._pending[user_id]
+        persona = self.cache.get(user_id, _MISSING)
+        if persona is _MISSING:
+            persona = await self._read(shard_for(user_id, self.n_shards), user_id)
+            self.cache.put(user_id, persona)
+        return persona
+
+    async def set(self, user_id, persona):
+        self._pending[user_id] = persona
+        self.cache.put(user_id, persona)
+        self._ensure_flusher()
+
+    async def delete(self, user_id):
+        await self.set(user_id, None)
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        by_shard = {}
+        for user_id, persona in batch.items():
+            by_shard.setdefault(shard_for(user_id, self.n_shards), []).append((user_id, persona))
+        try:
+            await asyncio.gather(*(self._write(shard, items) for shard, items in by_shard.items()))
+        except Exception as e:
+            # Не теряем записи: вернём их в очередь, если поверх не пришло более свежих
+            for user_id, persona in batch.items():
+                self._pending.setdefault(user_id, persona)
+            print(f"⚠️ Не удалось сохранить сессии ({len(batch)}): {e}")
+            self._ensure_flusher()
+
+    async def close(self):
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        await self.flush()
+
+
+# === SQLite (WAL): по файлу на шард ===
+class SQLiteSessionStore(BufferedSessionStore):
+    def __init__(self, path=SESSION_DB, n_shards=SESSION_SHARDS, ttl=SESSION_TTL, **kwargs):
+        # Кэш чтения живёт долго: SQLite-файл принадлежит одному процессу бота
+        kwargs.setdefault("cache_ttl", ttl)
+        super().__init__(n_shards, **kwargs)
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        root, ext = os.path.splitext(path)
+        self._locks = [threading.Lock() for _ in range(n_shards)]
+        self._conns = [self._connect(f"{root}.{shard}{ext}") for shard in range(n_shards)]
+
+    @staticmethod
+    def _connect(path):
+        conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                     "user_id INTEGER PRIMARY KEY, persona TEXT NOT NULL, updated_at REAL NOT NULL)")
+        return conn
+
+    def _read_sync(self, shard, user_id):
+        with self._locks[shard]:
+            row = self._conns[shard].execute(
+                "SELECT persona, updated_at FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None or (self.ttl and time.time() - row[1] > self.ttl):
+            return None
+        return row[0]
+
+    def _write_sync(self, shard, items):
+        now = time.time()
+        upserts = [(user_id, persona, now) for user_id, persona in items if persona is not None]
+        deletes = [(user_id,) for user_id, persona in items if persona is None]
+        with self._locks[shard]:
+            conn = self._conns[shard]
+            conn.execute("BEGIN")
+            try:
+                conn.executemany("INSERT INTO sessions (user_id, persona, updated_at) VALUES (?, ?, ?) "
+                                 "ON CONFLICT(user_id) DO UPDATE SET persona = excluded.persona, "
+                                 "updated_at = excluded.updated_at", upserts)
+                conn.executemany("DELETE FROM sessions WHERE user_id = ?", deletes)
+                if self.ttl:
+                    conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    async def _read(self, shard, user_id):
+        return await asyncio.to_thread(self._read_sync, shard, user_id)
+
+    async def _write(self, shard, items):
+        await asyncio.to_thread(self._write_sync, shard, items)
+
+    async def close(self):
+        await super().close()
+        for conn in self._conns:
+            conn.close()
+
+
+# === Redis-совместимый сервер: по серверу на шард, TTL — средствами Redis ===
+class RedisSessionStore(BufferedSessionStore):
+    def __init__(self, urls=REDIS_URLS, ttl=SESSION_TTL, prefix="witcher:persona:", **kwargs):
+        import redis.asyncio as redis
+        super().__init__(len(urls), **kwargs)
+        self.ttl = int(ttl) if ttl else None
+        self.prefix = prefix
+        self._clients = [redis.from_url(url, decode_responses=True) for url in urls]
+
+    async def _read(self, shard, user_id):
+        return await self._clients[shard].get(f"{self.prefix}{user_id}")
+
+    async def _write(self, shard, items):
+        pipe = self._clients[shard].pipeline(transaction=False)
+        for user_id, persona in items:
+            if persona is None:
+                pipe.delete(f"{self.prefix}{user_id}")
+            else:
+                pipe.set(f"{self.prefix}{user_id}", persona, ex=self.ttl)
+        await pipe.execute()
+
+    async def close(self):
+        await super().close()
+        for client in self._clients:
+            await client.aclose()
+
+
+def make_store(kind=SESSION_STORE):
+    if kind == "memory":
+        return MemorySessionStore()
+    if kind == "sqlite":
+        return SQLiteSessionStore()
+    if kind == "redis":
+        return RedisSessionStore()
+    raise ValueError(f"Неизвестное хранилище сессий: {kind}")
\ No newline at end of file
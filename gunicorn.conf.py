@@ -0,0 +1,33 @@
+import gc
+import os
+from api.runtime import WORKER_THREADS, cpu_count, configure_threads
+
+# === Несколько процессов API: gunicorn api.main:app (конфиг берётся из текущей папки) ===
+# Модель, индексы и сцены загружаются один раз в мастере (preload_app) и достаются воркерам через fork:
+# страницы общие, пока их никто не меняет (copy-on-write). FAISS, эмбеддинги и тексты сцен к тому же
+# отображены из файлов артефактов (mmap) и делятся через page cache даже после перезапуска воркера.
+# Артефакты стоит собрать заранее (python -m api.artifacts build): кодирование корпуса в мастере
+# запускает пулы потоков torch, а они плохо переживают fork.
+threads_per_worker = WORKER_THREADS or 1
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "0")) or max(1, cpu_count() // threads_per_worker)
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+
+
+def pre_fork(server, worker):
+    # Всё загруженное переносится в постоянное поколение: сборщик мусора воркера не обходит эти объекты
+    # и не переписывает их заголовки, поэтому страницы не копируются
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Размер пулов torch и OpenMP задаётся в каждом воркере заново
+    configure_threads(threads_per_worker)
+    # Сессия ONNX Runtime (ENCODER_BACKEND=onnx-*) не переживает fork — создаём её до первого запроса
+    from api.indexer import model
+    if hasattr(model, "session"):
+        model.session()
\ No newline at end of file
@@ -1,21 +1,39 @@
-from g4f.client import Client
-import time
+import os
 import re
 import json
+import time
+import random
+import asyncio
 import hashlib
-from typing import List, Dict
+import argparse
+import itertools
+from typing import List
 from tqdm import tqdm
 
+from api.llm import make_provider
 
-client = Client()
+# === Настройки аннотации ===
+# Запуск из корня проекта: python -m parser.parser <книга.txt>
+# С локальной заглушкой: LLM_BASE_URL=http://localhost:9000/v1 (см. bench/stub_llm.py)
+PARSER_MODEL = os.getenv("PARSER_MODEL", "gpt-oss-120b")
+PARSER_CONCURRENCY = int(os.getenv("PARSER_CONCURRENCY", "4"))  # одновременных запросов к LLM
+PARSER_RATE = float(os.getenv("PARSER_RATE", "1.0"))  # запросов в секунду, 0 — без ограничения
+PARSER_BURST = int(os.getenv("PARSER_BURST", "4"))  # сколько запросов можно отправить разом после простоя
+PARSER_MAX_RETRIES = int(os.getenv("PARSER_MAX_RETRIES", "5"))
+PARSER_BACKOFF_BASE = float(os.getenv("PARSER_BACKOFF_BASE", "2"))  # секунды, удваиваются с каждой попыткой
+PARSER_BACKOFF_MAX = float(os.getenv("PARSER_BACKOFF_MAX", "60"))
+PARSER_FSYNC_EVERY = int(os.getenv("PARSER_FSYNC_EVERY", "32"))  # fsync журнала раз в N записей...
+PARSER_FSYNC_INTERVAL = float(os.getenv("PARSER_FSYNC_INTERVAL", "5"))  # ...или раз в столько секунд
+PARSER_CACHE_PATH = os.getenv("PARSER_CACHE_PATH", "data/annotation_cache.jsonl")
+# Меняется при любом изменении build_messages: старые аннотации из кэша перестают подходить
+PROMPT_VERSION = 1
 
-def answer(scene_text, model="gpt-oss-120b"):
-    response = client.chat.completions.create(
-        model=model,
-        messages=[
-            {
-                "role": "system",
-                "content": f"""
+
+def build_messages(scene_text):
+    return [
+        {
+            "role": "system",
+            "content": f"""
 Ты система аннотации художественного текста.
 
 Тебе дан фрагмент:
@@ -34,12 +52,11 @@ def answer(scene_text, model="gpt-oss-120b"):
 ⚠️ Никаких комментариев, объяснений или дополнительного текста.
 ⚠️ JSON должен быть валидным.
 """
-            }
-        ],
-        web_search=False
-    )
-    answer = response.choices[0].message.content
+        }
+    ]
+
 
+def parse_annotation(answer):
     try:
         return json.loads(answer)
     except Exception:
@@ -62,17 +79,154 @@ def answer(scene_text, model="gpt-oss-120b"):
         }
 
 
-def save_checkpoint(results, checkpoint_path):
-    with open(checkpoint_path, "w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False)
+# === Ограничение частоты запросов: token bucket ===
+class TokenBucket:
+    def __init__(self, rate=PARSER_RATE, capacity=PARSER_BURST):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self.updated is not None:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def answer(provider, bucket, scene_text, model=PARSER_MODEL, max_retries=PARSER_MAX_RETRIES):
+    # Повтор с экспоненциальной паузой и случайным разбросом (full jitter): упавшие сцены
+    # не ждут друг друга и не бьют в провайдера одновременно
+    for attempt in range(max_retries + 1):
+        await bucket.acquire()
+        try:
+            return parse_annotation(await provider.complete(build_messages(scene_text), model=model))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = random.uniform(0, min(PARSER_BACKOFF_MAX, PARSER_BACKOFF_BASE * 2 ** attempt))
+            print(f"Повтор через {delay:.1f} с (попытка {attempt + 1}/{max_retries}): {e}")
+            await asyncio.sleep(delay)
+
+
+# === Журнал: JSONL только на дозапись, fsync пачками ===
+def repair_tail(path):
+    # Недописанная при падении последняя строка (без \n) обрезается: иначе следующая запись
+    # приклеится к обрывку, и read_journal пропустит уже настоящую запись. Обрезается ровно то,
+    # что пропускает read_journal, поэтому load_checkpoint до и после открытия журнала совпадает
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            f.seek(max(0, end - 65536))
+            chunk = f.read(end - max(0, end - 65536))
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                end = end - len(chunk) + newline + 1
+                break
+            end -= len(chunk)
+        if end == size:
+            return
+        f.seek(end)
+        try:
+            json.loads(f.read())
+            f.write(b"\n")  # запись целая, не успел записаться только перевод строки
+        except ValueError:
+            f.truncate(end)
+            print(f"⚠️ {path}: обрезана недописанная последняя строка ({size - end} байт)")
+
+
+class JsonlJournal:
+    def __init__(self, path, truncate=False, fsync_every=PARSER_FSYNC_EVERY, fsync_interval=PARSER_FSYNC_INTERVAL):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if not truncate:
+            repair_tail(path)
+        self.f = open(path, "w" if truncate else "a", encoding="utf-8")
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def append(self, entry):
+        self.f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every or time.monotonic() - self.synced_at >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.unsynced = 0
+        self.synced_at = time.monotonic()
+
+    def close(self):
+        if not self.f.closed:
+            self.sync()
+            self.f.close()
+
+
+def read_journal(path):
+    # Последняя строка могла не дописаться при падении — такие строки пропускаем
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8", errors="replace") as f:  # обрыв мог прийтись на середину символа
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
 
 def load_checkpoint(checkpoint_path):
-    if os.path.exists(checkpoint_path):
-        with open(checkpoint_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data["chapter_index"], data["scene_index"], data["results"]
-    else:
-        return 0, 0, []
+    # Проигрываем журнал: каждая запись — размеченная сцена в исходном порядке, поэтому продолжать
+    # нужно с позиции, равной числу записей. Неудавшиеся сцены в журнал не пишутся (см. annotate_scenes)
+    return sum(1 for _ in read_journal(checkpoint_path))
+
+
+# === Кэш аннотаций по содержимому: хэш текста сцены + модель + версия промпта ===
+# При повторном разборе отредактированной книги в LLM уходят только изменившиеся сцены.
+class AnnotationCache:
+    def __init__(self, path=PARSER_CACHE_PATH):
+        self.path = path
+        self.entries = {entry["key"]: entry["annotation"] for entry in read_journal(path)}
+        self.journal = JsonlJournal(path)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(scene_text, model):
+        return hashlib.sha256(f"{model}\0{PROMPT_VERSION}\0{scene_text.strip()}".encode("utf-8")).hexdigest()
+
+    def get(self, scene_text, model):
+        annotation = self.entries.get(self.key(scene_text, model))
+        if annotation is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return annotation
+
+    def put(self, scene_text, model, annotation):
+        key = self.key(scene_text, model)
+        self.entries[key] = annotation
+        self.journal.append({"key": key, "annotation": annotation})
+
+    def close(self):
+        self.journal.close()
+
 
 def rough_token_count(text: str) -> int:
     return len(re.findall(r"\w+|[^\w\s]", text))
@@ -97,78 +251,244 @@ def hash_quotes(text: str, max_items=3) -> List[str]:
     return [hashlib.md5(q.strip().encode("utf-8")).hexdigest() for q in quotes[:max_items]]
 
 
-def split_into_chapters(text: str) -> List[str]:
-    return [p.strip() for p in re.split(r"\n\s*ГЛАВА [^\n]+\n", text, flags=re.IGNORECASE) if p.strip()]
+# === Потоковое разбиение книги ===
+# Файл читается построчно: в памяти только текущая глава. Смещения — точные позиции в исходном файле
+# (символы и байты UTF-8), текущая позиция ведётся нарастающим итогом, поэтому всё линейно:
+# source[start_char:end_char] и mmap[start_byte:end_byte] дают ровно текст сцены.
+CHAPTER_HEADING = re.compile(r"\s*ГЛАВА [^\n]+", re.IGNORECASE)
+# Разделители сцен: «***», «— — —» или две пустые строки подряд
+SCENE_SEPARATOR = re.compile(r"(?<!\*)\*{3}(?!\*)|— — —|\n\s*\n\s*\n")
 
-def split_into_scenes(chapter_text: str) -> List[str]:
-    raw = re.split(r"(\*{3,}|—\s*—\s*—|\n\s*\n\s*\n)", chapter_text)
-    scenes, buf = [], []
-    for chunk in raw:
-        if chunk.strip() in ["***", "— — —"] or re.match(r"\s*\n\s*\n\s*\n", chunk):
-            if buf:
-                scenes.append("\n".join(buf).strip()); buf = []
-        else:
-            if chunk.strip(): buf.append(chunk)
-    if buf: scenes.append("\n".join(buf).strip())
-    return [s for s in scenes if s.strip()]
 
-def parse_book(txt_path, book_id="witcher_01", out_path="scenes.jsonl", checkpoint_path="checkpoint.json", load_checkpoint=False):
-    with open(txt_path, "r", encoding="utf-8") as f:
-        text = f.read()
+def iter_chapters(txt_path):
+    # Выдаёт (текст главы, смещение в символах, смещение в байтах) — без строки заголовка
+    buf, start_char, start_byte = [], 0, 0
+    pos_char, pos_byte = 0, 0
+    with open(txt_path, "r", encoding="utf-8", newline="") as f:
+        for line in f:
+            line_bytes = len(line.encode("utf-8"))
+            if CHAPTER_HEADING.fullmatch(line.rstrip("\r\n")):
+                if buf:
+                    yield "".join(buf), start_char, start_byte
+                buf, start_char, start_byte = [], pos_char + len(line), pos_byte + line_bytes
+            else:
+                buf.append(line)
+            pos_char += len(line)
+            pos_byte += line_bytes
+    if buf:
+        yield "".join(buf), start_char, start_byte
 
-    chapters = split_into_chapters(text)
 
-    if load_checkpoint:
-        ch_start_idx, sc_start_idx, results = load_checkpoint(checkpoint_path)
-        print(f"Загружен прогресс: глава {ch_start_idx+1}, сцена {sc_start_idx+1}")
-    else:
-        ch_start_idx, sc_start_idx, results = 0, 0, []
-        save_checkpoint({"chapter_index": 0, "scene_index": 0, "results": []}, checkpoint_path)
+def _strip_span(text, start, end):
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
 
-    for ch_id in range(ch_start_idx, len(chapters)):
-        ch_text = chapters[ch_id]
-        scenes = split_into_scenes(ch_text)
 
-        start_scene_idx = sc_start_idx if ch_id == ch_start_idx else 0
+def iter_chapter_scenes(chapter_text):
+    # Сцены главы как (начало, конец) внутри chapter_text, без пробелов по краям
+    pos = 0
+    for sep in SCENE_SEPARATOR.finditer(chapter_text):
+        start, end = _strip_span(chapter_text, pos, sep.start())
+        if start < end:
+            yield start, end
+        pos = sep.end()
+    start, end = _strip_span(chapter_text, pos, len(chapter_text))
+    if start < end:
+        yield start, end
 
-        for sc_id in tqdm(range(start_scene_idx, len(scenes)), desc=f"Глава {ch_id+1}", leave=False):
-            sc_text = scenes[sc_id]
-            start_char = sum(len(s) for s in scenes[:sc_id]) + sum(len(c) for c in chapters[:ch_id])
-            end_char = start_char + len(sc_text)
 
-            try:
-                time.sleep(2)
-                ents = answer(sc_text)
-                meta = {
-                    "book_id": book_id,
-                    "chapter_id": ch_id + 1,
-                    "scene_id": f"{ch_id+1:02d}_{sc_id+1:03d}",
-                    "text": sc_text.strip(),
-                    "token_len": rough_token_count(sc_text),
-                    "extra_characters": ents.get("extra_characters", []),
-                    "extra_locations": ents.get("extra_locations", []),
-                    "extra_events": ents.get("extra_events", []),
-                    "event_tags": ents.get("event_tags", []),
-                    "summary_50w": summarize_short(sc_text, limit_words=90),
-                    "beats": make_beats(sc_text, max_items=6),
-                    "quote_hashes": hash_quotes(sc_text),
-                    "start_char": start_char,
-                    "end_char": end_char
-                }
-                results.append(meta)
-
-                save_checkpoint({"chapter_index": ch_id, "scene_index": sc_id + 1, "results": results}, checkpoint_path)
+def iter_book_scenes(txt_path, book_id):
+    ch_id = 0
+    for chapter_text, ch_char, ch_byte in iter_chapters(txt_path):
+        if not chapter_text.strip():
+            continue
+        # Байтовые смещения тоже нарастающим итогом: кодируем только куски между сценами
+        pos, pos_byte = 0, ch_byte
+        for sc_id, (start, end) in enumerate(iter_chapter_scenes(chapter_text)):
+            start_byte = pos_byte + len(chapter_text[pos:start].encode("utf-8"))
+            end_byte = start_byte + len(chapter_text[start:end].encode("utf-8"))
+            yield {
+                "book_id": book_id, "chapter_id": ch_id, "scene_index": sc_id, "text": chapter_text[start:end],
+                "start_char": ch_char + start, "end_char": ch_char + end,
+                "start_byte": start_byte, "end_byte": end_byte,
+            }
+            pos, pos_byte = end, end_byte
+        ch_id += 1
+
+
+def iter_books(paths, book_id=None):
+    # Несколько книг подряд; book_id — имя файла без расширения (явный book_id — только для одной книги)
+    for path in paths:
+        yield from iter_book_scenes(path, book_id if book_id and len(paths) == 1 else
+                                    os.path.splitext(os.path.basename(path))[0])
+
+
+def book_paths(path):
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".txt"))
+    return [path]
+
+
+def read_source(mm, scene):
+    # Текст сцены прямо из отображённого в память файла: mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mm)[scene["start_byte"]:scene["end_byte"]]
 
+
+def scene_meta(item, ents):
+    sc_text = item["text"]
+    return {
+        "book_id": item["book_id"],
+        "chapter_id": item["chapter_id"] + 1,
+        # С книгой в префиксе: в одном корпусе бывает несколько книг, а по scene_id подписаны сцены в промпте
+        # и строится ключ кэша ответов
+        "scene_id": f"{item['book_id']}/{item['chapter_id']+1:02d}_{item['scene_index']+1:03d}",
+        "text": sc_text,
+        "token_len": rough_token_count(sc_text),
+        "extra_characters": ents.get("extra_characters", []),
+        "extra_locations": ents.get("extra_locations", []),
+        "extra_events": ents.get("extra_events", []),
+        "event_tags": ents.get("event_tags", []),
+        "summary_50w": summarize_short(sc_text, limit_words=90),
+        "beats": make_beats(sc_text, max_items=6),
+        "quote_hashes": hash_quotes(sc_text),
+        "start_char": item["start_char"],
+        "end_char": item["end_char"],
+        "start_byte": item["start_byte"],
+        "end_byte": item["end_byte"]
+    }
+
+# === Конвейер аннотации ===
+# Несколько воркеров берут сцены по очереди и аннотируют их параллельно; готовые сцены могут приходить
+# не по порядку, но в журнал попадают строго в исходном порядке.
+class SceneFailed(RuntimeError):
+    pass
+
+
+async def annotate_scenes(items, provider, on_ready, concurrency=PARSER_CONCURRENCY, rate=PARSER_RATE,
+                          burst=PARSER_BURST, model=PARSER_MODEL, cache=None):
+    # Сцена, не размеченная после всех повторов, останавливает прогон: журнал не продвигается дальше неё,
+    # и --resume начнёт именно с неё. Уже запущенные сцены дорабатывают — их аннотации остаются в кэше
+    bucket = TokenBucket(rate, burst)
+    queue = asyncio.Queue(maxsize=concurrency * 2)  # сцены читаются из генератора по мере надобности
+    done, next_pos = {}, 0
+    failed = None
+    progress = tqdm(desc="Сцены", leave=False)
+
+    async def feed():
+        for pos, item in enumerate(items):
+            if failed is not None:
+                break
+            await queue.put((pos, item))
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def worker():
+        nonlocal next_pos, failed
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            if failed is not None:
+                continue  # разбираем очередь, чтобы feed дошёл до завершающих None
+            pos, item = job
+            try:
+                ents = cache.get(item["text"], model) if cache is not None else None
+                if ents is None:
+                    ents = await answer(provider, bucket, item["text"], model)
+                    if cache is not None:
+                        cache.put(item["text"], model, ents)
+                done[pos] = (item, scene_meta(item, ents))
             except Exception as e:
-                print(f"Ошибка при обработке сцены {ch_id+1}-{sc_id+1}: {e}")
-                print("Пауза на 60 секунд перед продолжением...")
-                time.sleep(60)
-                save_checkpoint({"chapter_index": ch_id, "scene_index": sc_id, "results": results}, checkpoint_path)
-                continue
+                print(f"Ошибка при обработке сцены {item['book_id']} {item['chapter_id']+1}-{item['scene_index']+1}, "
+                      f"останавливаемся: {e}")
+                if failed is None or pos < failed[0]:
+                    failed = (pos, item, e)
+            progress.update(1)
+
+            # Отдаём непрерывный готовый префикс — он обрывается на первой неудавшейся сцене
+            while next_pos in done:
+                on_ready(*done.pop(next_pos))
+                next_pos += 1
+
+    try:
+        await asyncio.gather(feed(), *(worker() for _ in range(concurrency)))
+    finally:
+        progress.close()
+    if failed is not None:
+        pos, item, e = failed
+        raise SceneFailed(f"Сцена {item['book_id']} {item['chapter_id']+1}-{item['scene_index']+1} не размечена: {e}. "
+                          f"В журнал записано {next_pos} сцен этого прогона, продолжить: --resume") from e
 
-        sc_start_idx = 0
+async def parse_books_async(paths, out_path="scenes.jsonl", checkpoint_path="checkpoint.jsonl", resume=False,
+                            concurrency=PARSER_CONCURRENCY, rate=PARSER_RATE, provider=None,
+                            cache_path=PARSER_CACHE_PATH, book_id=None):
+    # Сцены не копятся в памяти: готовые уходят в журнал, а итоговый файл собирается из журнала
+    skip = load_checkpoint(checkpoint_path) if resume else 0
+    if resume:
+        print(f"Загружен прогресс: {skip} сцен уже обработано")
+    journal = JsonlJournal(checkpoint_path, truncate=not resume)
+    cache = AnnotationCache(cache_path) if cache_path else None
+
+    def on_ready(item, meta):
+        journal.append({"book_id": item["book_id"], "chapter_index": item["chapter_id"],
+                        "scene_index": item["scene_index"], "scene": meta})
+
+    items = iter_books(paths, book_id)
+    own_provider = provider is None
+    # Переход на другой провайдер при ошибках — да, хедж — нет: разметка не срочная, а он удваивает расход.
+    # Автомат отключения тоже нет: он отказывал бы всем сценам на LLM_BREAKER_COOLDOWN секунд,
+    # и повторы из answer() кончались бы раньше, чем провайдер вернётся в ротацию
+    provider = provider or make_provider(hedge=False, breaker=False, max_concurrency=concurrency)
+    try:
+        await annotate_scenes(itertools.islice(items, skip, None), provider, on_ready,
+                              concurrency=concurrency, rate=rate, cache=cache)
+    finally:
+        journal.close()
+        if cache is not None:
+            cache.close()
+        if own_provider:
+            await provider.close()
 
+    n_scenes = 0
     with open(out_path, "w", encoding="utf-8") as out:
-        for r in results:
-            out.write(json.dumps(r, ensure_ascii=False) + "\n")
-    print(f"✅ Parsed {len(results)} scenes → {out_path}")
\ No newline at end of file
+        for entry in read_journal(checkpoint_path):
+            out.write(json.dumps(entry["scene"], ensure_ascii=False) + "\n")
+            n_scenes += 1
+    print(f"✅ Parsed {n_scenes} scenes → {out_path}" + (f" (из кэша аннотаций: {cache.hits})" if cache else ""))
+    return n_scenes
+
+async def parse_book_async(txt_path, book_id="witcher_01", out_path="scenes.jsonl", checkpoint_path="checkpoint.jsonl",
+                           resume=False, concurrency=PARSER_CONCURRENCY, rate=PARSER_RATE, provider=None,
+                           cache_path=PARSER_CACHE_PATH):
+    return await parse_books_async([txt_path], out_path, checkpoint_path, resume, concurrency, rate, provider,
+                                   cache_path, book_id=book_id)
+
+def parse_book(txt_path, book_id="witcher_01", out_path="scenes.jsonl", checkpoint_path="checkpoint.jsonl", resume=False,
+               concurrency=PARSER_CONCURRENCY, rate=PARSER_RATE, cache_path=PARSER_CACHE_PATH):
+    return asyncio.run(parse_book_async(txt_path, book_id, out_path, checkpoint_path, resume, concurrency, rate,
+                                        cache_path=cache_path))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Разбор книг на сцены с аннотацией через LLM")
+    parser.add_argument("book", help="файл .txt или папка с книгами .txt")
+    parser.add_argument("--book-id", default=None, help="для одной книги; по умолчанию — имя файла")
+    parser.add_argument("--out", default="scenes.jsonl")
+    parser.add_argument("--checkpoint", default="checkpoint.jsonl")
+    parser.add_argument("--resume", action="store_true", help="продолжить с чекпоинта")
+    parser.add_argument("--concurrency", type=int, default=PARSER_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=PARSER_RATE, help="запросов в секунду, 0 — без ограничения")
+    parser.add_argument("--cache", default=PARSER_CACHE_PATH, help="кэш аннотаций, пустая строка — без кэша")
+    args = parser.parse_args()
+    try:
+        asyncio.run(parse_books_async(book_paths(args.book), args.out, args.checkpoint, args.resume, args.concurrency,
+                                      args.rate, cache_path=args.cache, book_id=args.book_id))
+    except SceneFailed as e:
+        raise SystemExit(f"⚠️ {e}")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
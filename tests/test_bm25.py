@@ -0,0 +1,31 @@
+import numpy as np
+
+from api.bm25 import SparseBM25
+
+CORPUS = [
+    ["a", "b", "c"],
+    ["a", "b"],
+    ["a", "d", "d"],
+    ["a", "e"],
+    ["f", "g", "a"],
+    ["b", "c", "c"],
+]
+QUERIES = [["a"], ["b"], ["c", "a"], ["d"], ["e", "f"], ["z"]]
+
+
+def assert_same_scores(updated, live_ids, fresh):
+    for query in QUERIES:
+        np.testing.assert_allclose(updated.get_scores(query)[live_ids], fresh.get_scores(query), rtol=1e-6, atol=1e-9)
+
+
+def test_removal_matches_rebuild():
+    bm25 = SparseBM25.from_corpus(CORPUS)
+    removed = [2, 3, 4]  # вместе с ними из корпуса уходят термины d, e, f, g
+    live_ids = [i for i in range(len(CORPUS)) if i not in removed]
+    assert_same_scores(bm25.without_documents(removed), live_ids, SparseBM25.from_corpus([CORPUS[i] for i in live_ids]))
+
+
+def test_add_and_remove_match_rebuild():
+    bm25 = SparseBM25.from_corpus(CORPUS[:3]).with_documents(CORPUS[3:]).without_documents([0, 4])
+    live_ids = [1, 2, 3, 5]
+    assert_same_scores(bm25, live_ids, SparseBM25.from_corpus([CORPUS[i] for i in live_ids]))
\ No newline at end of file
@@ -0,0 +1,62 @@
+import json
+
+from parser.parser import AnnotationCache, JsonlJournal, load_checkpoint, read_journal
+
+
+def write_torn(path, entries, torn):
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.write(json.dumps(torn, ensure_ascii=False)[:-7])
+
+
+def test_resume_after_torn_line(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    write_torn(path, [{"scene": 0}], {"scene": 1})
+    assert load_checkpoint(path) == 1
+
+    journal = JsonlJournal(path)
+    journal.append({"scene": 1})
+    journal.append({"scene": 2})
+    journal.close()
+    assert [entry["scene"] for entry in read_journal(path)] == [0, 1, 2]
+    assert load_checkpoint(path) == 3
+
+
+def test_torn_multibyte_character(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    path.write_bytes(b'{"scene": 0}\n' + '{"scene": "Геральт"}'.encode("utf-8")[:-4])
+    assert load_checkpoint(str(path)) == 1
+
+    journal = JsonlJournal(str(path))
+    journal.append({"scene": 1})
+    journal.close()
+    assert [entry["scene"] for entry in read_journal(str(path))] == [0, 1]
+
+
+def test_complete_line_without_newline_is_kept(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    path.write_text('{"scene": 0}\n{"scene": 1}', encoding="utf-8")
+    assert load_checkpoint(str(path)) == 2
+
+    journal = JsonlJournal(str(path))
+    journal.append({"scene": 2})
+    journal.close()
+    assert [entry["scene"] for entry in read_journal(str(path))] == [0, 1, 2]
+
+
+def test_annotation_cache_after_torn_line(tmp_path):
+    path = str(tmp_path / "cache.jsonl")
+    cache = AnnotationCache(path)
+    cache.put("Сцена один", "m", {"extra_characters": ["Геральт"]})
+    cache.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"key": "obr')
+
+    cache = AnnotationCache(path)
+    cache.put("Сцена два", "m", {"extra_characters": ["Цири"]})
+    cache.close()
+    cache = AnnotationCache(path)
+    assert cache.get("Сцена один", "m") == {"extra_characters": ["Геральт"]}
+    assert cache.get("Сцена два", "m") == {"extra_characters": ["Цири"]}
+    cache.close()
\ No newline at end of file
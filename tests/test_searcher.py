@@ -0,0 +1,33 @@
+import pytest
+
+from api.artifacts import build_artifacts, load_artifacts
+from api.entity_index import EntityIndex
+from api.gazetteer import Gazetteer
+from api.searcher import Searcher, Snapshot
+from api.vector import KINDS, index_spec
+from bench.suite import HashEncoder
+from bench.synthetic import generate_scenes, write_jsonl
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_add_and_remove_on_mmap_snapshot(tmp_path, kind):
+    # Артефакты загружаются как в API — с mmap по умолчанию; дописывать надо в собственную копию индекса
+    scenes = generate_scenes(300)
+    scenes_path = str(tmp_path / "scenes.jsonl")
+    write_jsonl(scenes[:250], scenes_path)
+    model = HashEncoder()
+    artifact_dir = build_artifacts(scenes_path, "test-hash", str(tmp_path / "index"), model=model,
+                                   vector_spec=index_spec(kind))
+
+    loaded, bm25, index, _ = load_artifacts(artifact_dir)
+    snapshot = Snapshot(loaded, bm25, index, Gazetteer.build(loaded), EntityIndex.build(loaded))
+    searcher = Searcher(snapshot, model)
+
+    added = [dict(s, book_id="new_book") for s in scenes[250:]]
+    assert searcher.add_scenes(added)["added"] == 50
+    ids, _, _ = searcher.current.retrieve(added[0]["summary_50w"], model, topk_bm25=5, topk_faiss=5)
+    assert 250 in ids
+
+    searcher.remove_book("new_book")
+    ids, _, _ = searcher.current.retrieve(added[0]["summary_50w"], model, topk_bm25=5, topk_faiss=5)
+    assert not len(ids) or ids.max() < 250
\ No newline at end of file